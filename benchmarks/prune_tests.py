@@ -0,0 +1,81 @@
+"""
+Batch pruning benchmark: 20k tests x 10 quantities x 5 requirements
+(1M requirement-test pairs) against 50k sufficiency rows.
+
+    python -m benchmarks.prune_tests [--tests N] [--rows N] [--repeat N]
+
+Half of the rows are sufficient under the configuration of some test, so
+most entries are dropped and nearly every test is rebuilt (worst case).
+The tests are round-tripped through JSON, so that their strings are fresh
+objects as after loading tests.json, and every run prunes a new copy.
+"""
+import argparse
+import gc
+import json
+import logging
+import random
+import time
+
+from src.prune_tests import SufficiencyIndex, prune_tests_batch
+
+
+def make_data(n_tests: int, n_rows: int, seed: int = 7):
+    """Synthetic tests (as JSON text) and sufficiency table"""
+    rng = random.Random(seed)
+    scenarios = [f"s{k}" for k in range(300)]
+    requirements = [f"r{k}" for k in range(max(n_rows * 6 // 5, 1))]
+    tests = []
+    for t in range(n_tests):
+        config = sorted(rng.sample(scenarios, rng.randint(1, 6)))
+        tests.append({
+            "uuid": f"u{t}",
+            "scenarios": config,
+            "quantities": {f"q{t}_{q}": {"requirements": rng.sample(requirements, 5)} for q in range(10)},
+        })
+    bindings = []
+    for k, req_id in enumerate(rng.sample(requirements, n_rows)):
+        config = tests[rng.randrange(n_tests)]["scenarios"] if k % 2 else rng.sample(scenarios, rng.randint(1, 6))
+        bindings.append({"reqName": {"type": "literal", "value": req_id},
+                         "scenarios": {"type": "literal", "value": ",".join(config)}})
+    sufficiency = {"head": {"vars": ["reqName", "scenarios"]}, "results": {"bindings": bindings}}
+    return json.dumps(tests), sufficiency
+
+
+def best_of(repeat: int, run, setup=lambda: None) -> float:
+    """Best time of ``run(setup())``; its result is freed after the clock stops"""
+    best = float("inf")
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        start = time.perf_counter()
+        result = run(arg)
+        best = min(best, time.perf_counter() - start)
+        del arg, result
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tests", type=int, default=20000)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    tests_json, sufficiency = make_data(args.tests, args.rows)
+    pruned, report = prune_tests_batch(json.loads(tests_json), sufficiency)
+    pairs = len(report.entry_quantity)
+    print(f"{args.tests} tests, {pairs} requirement-test pairs, {args.rows} sufficiency rows")
+    print(report.summary())
+    del pruned, report
+
+    index = SufficiencyIndex(sufficiency)
+    index_time = best_of(args.repeat, SufficiencyIndex, lambda: sufficiency)
+    total = best_of(args.repeat, lambda tests: prune_tests_batch(tests, sufficiency), lambda: json.loads(tests_json))
+    cached = best_of(args.repeat, lambda tests: prune_tests_batch(tests, index), lambda: json.loads(tests_json))
+    print(f"best of {args.repeat}: sufficiency index {index_time:.3f} s, prune_tests_batch {total:.3f} s, "
+          f"with a prebuilt index (load_sufficiency_index) {cached:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,54 +4,54 @@ import os
 
 import pandas as pd
 
+from src.sparql_json import open_bindings
+
 def json_to_csv(csv_output_path, json_input_path="", json_file_object=None):
     """
     Converts a JSON file (with 'head'->'vars' and 'results'->'bindings') to a CSV file.
     If a column's value is missing in bindings, it writes an empty value.
     If a binding's value is a URI containing '#', only the part after '#' is extracted.
+    Bindings are streamed row by row, so the JSON document is never fully loaded.
     """
-    # 1. Read the JSON file
+    # 1. Pick the JSON source
     if json_input_path != "" and json_file_object != None:
         raise Exception("Only provide either file object or file path")
     elif json_input_path == "" and json_file_object == None:
         raise Exception("Provide wither file object or file path of json file")
     elif json_file_object != None:
-        data = json.loads(json_file_object)
+        # the raw JSON content (bytes or str) of an upload, or an open file
+        source = json_file_object.encode("utf-8") if isinstance(json_file_object, str) else json_file_object
     elif json_input_path != "":
-        with open(json_input_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-    # 2. Extract columns from data["head"]["vars"]
-    columns = data["head"]["vars"]
-
-    # 3. Get rows from data["results"]["bindings"]
-    bindings = data["results"]["bindings"]
-
-    # 4. Create and write to a CSV file
-    with open(csv_output_path, 'w+', newline='', encoding='utf-8') as csv_file:
-        writer = csv.writer(csv_file)
-        # Write header row
-        writer.writerow(columns)
-
-        # 5. For each row in the JSON, gather values for each column
-        for row_binding in bindings:
-            row_data = []
-            for col in columns:
+        source = json_input_path
+
+    with open_bindings(source) as reader:
+        # 2. Extract columns from data["head"]["vars"]
+        columns = reader.vars
+        if columns is None:
+            # 'head' comes after 'results': buffer the bindings until it is read
+            rows = list(reader.rows())
+            columns = reader.vars
+            if columns is None:
+                raise Exception("JSON data has no 'head'->'vars'")
+            rows = (tuple(row.get(column) for column in columns) for row in rows)
+        else:
+            rows = reader.rows(columns)
+
+        # 3. Create and write to a CSV file
+        with open(csv_output_path, 'w+', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            # Write header row
+            writer.writerow(columns)
+
+            # 4. For each binding row, gather values for each column
+            for row_data in rows:
                 # If the column is missing, write empty string
-                if col not in row_binding:
-                    row_data.append('')
-                    continue
-
-                # Otherwise, get the "value"
-                value = row_binding[col].get('value', '')
+                row_data = ['' if value is None else value for value in row_data]
 
                 # If there's a '#' in the URI or string, split and take the last part
-                if '#' in value:
-                    value = value.split('#')[-1]
-
-                row_data.append(value)
+                row_data = [value.split('#')[-1] if '#' in value else value for value in row_data]
 
-            writer.writerow(row_data)
+                writer.writerow(row_data)
 
 def validate_csv(file_path, expected_columns, skip_non_null_check=False):
     try:
@@ -1,4 +1,7 @@
 import json
+import base64
+import struct
+import zlib
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -7,8 +10,174 @@ import numpy as np
 
 import streamlit as st
 
+from src.test_plan import TestPlan, as_tests, cost_vector
+
+# ----------------------------------------------------------------------
+# Large-data rendering
+# ----------------------------------------------------------------------
+# Cells (heatmap) or points (dot plots) drawn as SVG markers; above this
+# figures switch to a single Heatmap / Scattergl trace
+SVG_MAX_CELLS = 5000
+# Cells or points drawn client-side; above this the matrix is rasterized
+# into a PNG on the server, so the payload depends on pixels, not cells
+WEBGL_MAX_CELLS = 250000
+# Largest raster (tests x scenarios pixels); bigger matrices are max-pooled
+RASTER_MAX_SIZE = (2000, 1000)
+# Axis categories labelled one by one in the large-data modes
+MAX_TICK_LABELS = 200
+# Level of detail: test sequences (or selected ranges) longer than this
+# are binned into this many buckets of consecutive tests
+MAX_PLOT_BUCKETS = 1000
+
+
+def render_mode(cells: int, mode: str = "auto") -> str:
+    """"svg", "webgl" or "raster" for a figure of ``cells`` cells or points"""
+    if mode != "auto":
+        return mode
+    if cells <= SVG_MAX_CELLS:
+        return "svg"
+    return "webgl" if cells <= WEBGL_MAX_CELLS else "raster"
+
+
+def _png_data_uri(rgb: np.ndarray) -> str:
+    """(h, w, 3) uint8 image as a base64 PNG data URI"""
+    height, width = rgb.shape[:2]
+    raw = np.hstack((np.zeros((height, 1), dtype=np.uint8), rgb.reshape(height, width * 3))).tobytes()
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    png = (b"\x89PNG\r\n\x1a\n"
+           + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+           + chunk(b"IDAT", zlib.compress(raw, 6))
+           + chunk(b"IEND", b""))
+    return "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+
+
+def _max_pool(values: np.ndarray, max_size) -> tuple:
+    """Matrix shrunk by block-wise max to at most max_size (width, height); returns it and the block shape"""
+    rows, cols = values.shape
+    block_rows, block_cols = -(-rows // max_size[1]), -(-cols // max_size[0])
+    if block_rows == block_cols == 1:
+        return values, (1, 1)
+    padded = np.zeros((-(-rows // block_rows) * block_rows, -(-cols // block_cols) * block_cols), dtype=values.dtype)
+    padded[:rows, :cols] = values
+    pooled = padded.reshape(padded.shape[0] // block_rows, block_rows,
+                            padded.shape[1] // block_cols, block_cols).max(axis=(1, 3))
+    return pooled, (block_rows, block_cols)
+
+
+def _hex_rgb(color: str) -> np.ndarray:
+    color = color.lstrip("#")
+    return np.array([int(color[k:k + 2], 16) for k in (0, 2, 4)], dtype=np.uint8)
+
+
+def _category_axis(labels, positions=None) -> dict:
+    """Axis settings labelling every position with its category, when there are few"""
+    if len(labels) > MAX_TICK_LABELS:
+        return dict(showgrid=False)
+    positions = np.arange(len(labels)) if positions is None else positions
+    return dict(tickmode="array", tickvals=positions, ticktext=[str(l) for l in labels], showgrid=False)
+
+
+def bucket_edges(n: int, max_buckets: int = MAX_PLOT_BUCKETS) -> np.ndarray:
+    """Edges of min(n, max_buckets) runs of consecutive positions in 0..n, equal up to one"""
+    buckets = min(n, max_buckets) if max_buckets else n
+    return (np.arange(buckets + 1) * n) // max(buckets, 1)
+
+
+def _test_range(tests, test_range=None) -> tuple:
+    """(start, stop) positions of ``test_range`` (all tests if None) and the scenario entries within it"""
+    n = len(tests)
+    start, stop = test_range if test_range is not None else (0, n)
+    start, stop = max(0, start), min(n, stop)
+    if isinstance(tests, TestPlan):
+        points = int(tests.offsets[stop] - tests.offsets[start]) if stop > start else 0
+    else:
+        points = sum(len(t["scenarios"]) for t in tests[start:stop])
+    return start, stop, points
+
+
+def bucket_cost_frame(costs_df: pd.DataFrame, cost_column: str, max_buckets: int = MAX_PLOT_BUCKETS) -> pd.DataFrame:
+    """
+    Rows of a make_cost_frame slice binned into buckets of consecutive
+    tests: mean, min and max of ``cost_column``, the cumulative cost at
+    the bucket's last test and the bucket size; test_id becomes
+    "first–last".
+    """
+    edges = bucket_edges(len(costs_df), max_buckets)
+    starts = edges[:-1]
+    values = costs_df[cost_column].to_numpy(dtype=np.float64)
+    ids = costs_df["test_id"].astype(str).tolist()
+    return pd.DataFrame({
+        "test_id": [f"{ids[a]}–{ids[b - 1]}" for a, b in zip(edges, edges[1:])],
+        cost_column: np.add.reduceat(values, starts) / np.diff(edges),
+        "min_cost": np.minimum.reduceat(values, starts),
+        "max_cost": np.maximum.reduceat(values, starts),
+        "cumulative_cost": costs_df["cumulative_cost"].to_numpy()[edges[1:] - 1],
+        "tests": np.diff(edges),
+    })
+
+
+def plot_large_presence(tests, title, mode="auto", color="#4682b4", cell_size=10, fig_height=600,
+                        heatmap=False, x_title="Test ID (in execution order)", y_title="Scenario ID",
+                        test_range=None, max_buckets=MAX_PLOT_BUCKETS):
+    """
+    Scenario x test presence (active scenarios of every test) as one
+    trace: a Heatmap (``heatmap``) or Scattergl of the active cells in
+    "webgl" mode, or a server-side rasterized PNG image in "raster" mode.
+
+    Only the tests of ``test_range`` (start, stop) are shown; when there
+    are more than ``max_buckets`` of them, consecutive tests are binned
+    and every cell shows the fraction of the bucket's tests in which the
+    scenario is active. Tests are plotted at their 1-based position in
+    the sequence, first scenario on top.
+    """
+    status, scenario_ids, test_ids = make_presence_array(tests)
+    start, stop, _ = _test_range(tests, test_range)
+    values = status[:, start:stop] > 0
+    edges = bucket_edges(stop - start, max_buckets)
+    binned = len(edges) - 1 < stop - start
+    if binned:
+        values = np.add.reduceat(values, edges[:-1], axis=1) / np.diff(edges)
+        labels = [f"{test_ids[start + a]}–{test_ids[start + b - 1]}" for a, b in zip(edges, edges[1:])]
+        x = start + 1 + (edges[:-1] + edges[1:] - 1) / 2
+    else:
+        labels = test_ids[start:stop]
+        x = np.arange(start, stop) + 1
+    n_rows, n_cols = values.shape
+    step = (stop - start) / max(n_cols, 1)
+
+    cells = values.size if heatmap or binned else int(np.count_nonzero(values))
+    mode = render_mode(cells, mode)
+    hover = "Test #%{x}<br>Scenario #%{y}<extra></extra>"
+    if mode == "raster":
+        pooled, (block_rows, block_cols) = _max_pool(values.astype(np.float32), RASTER_MAX_SIZE)
+        white, ink = _hex_rgb("#ffffff").astype(np.float32), _hex_rgb(color).astype(np.float32)
+        rgb = np.rint(white + pooled[:, :, None] * (ink - white)).astype(np.uint8)
+        trace = go.Image(source=_png_data_uri(rgb),
+                         x0=start + 1 + (block_cols * step - 1) / 2, dx=block_cols * step,
+                         y0=(block_rows - 1) / 2, dy=block_rows, hovertemplate=hover)
+    elif heatmap or binned:
+        z = np.round(values, 3) if binned else values.astype(np.int8)
+        trace = go.Heatmap(z=z, x=x, zmin=0, zmax=1, showscale=binned,
+                           colorscale=[[0, "white"], [1, color]],
+                           hovertemplate=hover.replace("<extra>", "<br>Active: %{z}<extra>") if binned else hover)
+    else:
+        rows, cols = np.nonzero(values)
+        trace = go.Scattergl(x=x[cols], y=rows, mode="markers",
+                             marker=dict(size=cell_size, symbol="square", color=color),
+                             hovertemplate=hover)
+
+    fig = go.Figure(trace)
+    fig.update_xaxes(title=x_title, range=[start + 0.5, stop + 0.5], **_category_axis(labels, x))
+    fig.update_yaxes(title=y_title, range=[n_rows - 0.5, -0.5], **_category_axis(scenario_ids))
+    fig.update_layout(title=title, height=fig_height, showlegend=False)
+    return fig
+
 
 def build_scenario_df(tests):
+    tests = as_tests(tests)
     rows = []
     for idx, test in enumerate(tests, start=1):
         for scenario in test["scenarios"]:
@@ -19,7 +188,19 @@ def build_scenario_df(tests):
             })
     return pd.DataFrame(rows)
 
-def plot_scenario_heatmaps(tests, title, cell_size=10, fig_height=600):
+def plot_scenario_heatmaps(tests, title, cell_size=10, fig_height=600, mode="auto"):
+    """
+    Scenario x test grid; ``mode`` ("auto", "svg", "webgl", "raster")
+    picks the renderer, by cell count when "auto".
+    """
+    if isinstance(tests, TestPlan):
+        n_cells = len(np.unique(tests.cols)) * len(tests)
+    else:
+        n_cells = len({s for t in tests for s in t["scenarios"]}) * len(tests)
+    mode = render_mode(n_cells, mode)
+    if mode != "svg":
+        return plot_large_presence(tests, title, mode, color="#4682b4", fig_height=fig_height, heatmap=True,
+                                   x_title="Test Configuration")
 
     grid_df, _ = make_presence_df(
         tests, 
@@ -91,7 +272,19 @@ def plot_scenario_heatmaps(tests, title, cell_size=10, fig_height=600):
 
     return fig
 
-def plot_sequence_dots(tests, title, cell_size=10, fig_height=600):
+def plot_sequence_dots(tests, title, cell_size=10, fig_height=600, mode="auto",
+                       test_range=None, max_buckets=MAX_PLOT_BUCKETS):
+    """
+    Active scenarios per test as dots; ``mode`` as in
+    plot_scenario_heatmaps, by point count. Only the tests of
+    ``test_range`` (start, stop) are shown, binned by plot_large_presence
+    when there are more than ``max_buckets``.
+    """
+    start, stop, n_points = _test_range(tests, test_range)
+    if (max_buckets and stop - start > max_buckets) or render_mode(n_points, mode) != "svg":
+        return plot_large_presence(tests, title, mode, color="#636efa", cell_size=cell_size, fig_height=fig_height,
+                                   test_range=(start, stop), max_buckets=max_buckets)
+    tests = as_tests(tests)[start:stop]
     
     # Extract ordered test IDs and their scenarios from tests
     # test: [{id: "1", scenarios: ["3", "19"]}, {id: "2", scenarios: ["3", "19", "5"]}, ...]
@@ -143,7 +336,8 @@ def plot_sequence_dots(tests, title, cell_size=10, fig_height=600):
 
     return fig
 
-def build_scenario_timeline(tests, title, cell_size=10, fig_height=600):
+def build_scenario_timeline(tests, title, cell_size=10, fig_height=600, mode="auto",
+                            test_range=None, max_buckets=MAX_PLOT_BUCKETS):
     """
     Build a Plotly timeline (Gantt) figure that shows how long each scenario
     remains active across a test sequence.
@@ -164,10 +358,24 @@ def build_scenario_timeline(tests, title, cell_size=10, fig_height=600):
     title : str
         Figure title.
 
+    mode : str
+        "auto", "svg", "webgl" or "raster" (see plot_scenario_heatmaps),
+        picked by point count when "auto".
+    test_range : tuple, optional
+        (start, stop) positions of the tests to show; all by default.
+    max_buckets : int
+        Longer ranges are binned into this many buckets of consecutive
+        tests (see plot_large_presence); None always shows every test.
+
     Returns
     -------
     plotly.graph_objects.Figure
     """
+    start, stop, n_points = _test_range(tests, test_range)
+    if (max_buckets and stop - start > max_buckets) or render_mode(n_points, mode) != "svg":
+        return plot_large_presence(tests, title, mode, color="#636efa", cell_size=cell_size, fig_height=fig_height,
+                                   test_range=(start, stop), max_buckets=max_buckets)
+    tests = as_tests(tests)[start:stop]
 
     ordered_test_ids = [str(t["id"]) for t in tests]        # X‑axis order
     scenario_ids = sorted({s for t in tests for s in t["scenarios"]})
@@ -234,39 +442,60 @@ def build_scenario_timeline(tests, title, cell_size=10, fig_height=600):
 # ----------------------------------------------------------------------
 # 1. Build Scenario × Test matrix with status codes
 # ----------------------------------------------------------------------
-def make_presence_df(tests, flipped=False) -> pd.DataFrame:
+def make_presence_array(tests):
     """
-    Return a DataFrame whose values are:
-        2 → newly applied
-        1 → active (carried over)
-       -1 → retracted
-        0 → inactive
+    Scenario x test status array of make_presence_df (int8), with its row
+    labels (sorted scenario IDs) and column labels (test IDs as strings).
+    Cells are filled by fancy indexing, in increasing precedence:
+    active (1), newly applied (2), retracted (-1).
     """
+    if isinstance(tests, TestPlan):
+        return _plan_presence_array(tests)
+    tests = as_tests(tests)
 
     test_ids      = [str(t["id"]) for t in tests]           # column order
     scenario_all  = sorted({s for t in tests for s in t["scenarios"]}
                            | {s for t in tests for s in t["apply"]}
                            | {s for t in tests for s in t["retract"]})
-    df = pd.DataFrame(0, index=scenario_all, columns=test_ids, dtype=int)
+    row_of = {sc: r for r, sc in enumerate(scenario_all)}
+    status = np.zeros((len(scenario_all), len(tests)), dtype=np.int8)
+    for key, value in (("scenarios", 1), ("apply", 2), ("retract", -1)):
+        cols = np.repeat(np.arange(len(tests)), [len(t[key]) for t in tests])
+        rows = np.fromiter((row_of[sc] for t in tests for sc in t[key]), dtype=np.intp, count=len(cols))
+        status[rows, cols] = value
+    return status, scenario_all, test_ids
+
+
+def _plan_presence_array(plan: TestPlan):
+    """make_presence_array straight from a TestPlan's incidence and operations"""
+    scenario_ids = plan.scenarios.ids
+    present = sorted(np.unique(plan.cols).tolist(), key=scenario_ids.__getitem__)
+    row_of = np.full(max(len(scenario_ids), 1), -1, dtype=np.intp)
+    row_of[present] = np.arange(len(present))
+
+    rows, cols = row_of[plan.cols], plan.rows()
+    applied, retracted = plan.operations()
+    status = np.zeros((len(present), len(plan)), dtype=np.int8)
+    status[rows, cols] = 1
+    status[rows[applied], cols[applied]] = 2
+    # retracted from test i -> shown on test i + 1, which retracts it
+    status[rows[retracted], cols[retracted] + 1] = -1
+
+    test_ids = [str(record.extra.get("id", i + 1)) for i, record in enumerate(plan.records)]
+    return status, [scenario_ids[c] for c in present], test_ids
 
-    for t in tests:
-        tid = str(t["id"])
-
-        # 2 → newly applied
-        for sc in t["apply"]:
-            df.at[sc, tid] = 2
-
-        # 1 → active but not newly applied
-        for sc in t["scenarios"]:
-            if df.at[sc, tid] == 0:               # skip if already marked 2
-                df.at[sc, tid] = 1
 
-        # -1 → retracted
-        for sc in t["retract"]:
-            df.at[sc, tid] = -1                  # overwrite any 0
-
-    df.index.name   = "Scenario ID"
-    df.columns.name = "Test ID"
+def make_presence_df(tests, flipped=False) -> pd.DataFrame:
+    """
+    Return a DataFrame whose values are:
+        2 → newly applied
+        1 → active (carried over)
+       -1 → retracted
+        0 → inactive
+    """
+    status, scenario_all, test_ids = make_presence_array(tests)
+    df = pd.DataFrame(status, index=pd.Index(scenario_all, name="Scenario ID"),
+                      columns=pd.Index(test_ids, name="Test ID"))
 
     if flipped:
         # Transpose the DataFrame to have tests as rows and scenarios as columns
@@ -278,21 +507,17 @@ def make_presence_df(tests, flipped=False) -> pd.DataFrame:
 # ----------------------------------------------------------------------
 # 2. Style function with custom colours
 # ----------------------------------------------------------------------
-def style_presence(df: pd.DataFrame, show_additional: bool = False):
-    colours = {2: "#4f8aff",     # light blue  – newly applied
-               1: "#2a4b8d",     # dark  blue  – active / carried‑over
-              -1: "#ffafaf",     # light red   – retracted
-               0: "#ffffff"}     # white       – inactive
-
-    if not show_additional:
-        colours.update({
-            0: "#ffffff", 
-            1: "#2a4b8d",
-            -1: '#2a4b8d',
-            2: '#2a4b8d'
-        })
+PRESENCE_COLOURS = {2: "#4f8aff",     # light blue  – newly applied
+                    1: "#2a4b8d",     # dark  blue  – active / carried‑over
+                   -1: "#ffafaf",     # light red   – retracted
+                    0: "#ffffff"}     # white       – inactive
+# without show_additional every status but inactive looks alike
+PRESENCE_COLOURS_PLAIN = {2: "#2a4b8d", 1: "#2a4b8d", -1: "#2a4b8d", 0: "#ffffff"}
+PRESENCE_STATUS_NAMES = {2: "newly applied", 1: "active (carried over)", -1: "retracted", 0: "inactive"}
 
-    
+
+def style_presence(df: pd.DataFrame, show_additional: bool = False):
+    colours = PRESENCE_COLOURS if show_additional else PRESENCE_COLOURS_PLAIN
 
     # formatting hides the numeric values
     return df.style.applymap(lambda v: f"background-color: {colours[v]}")\
@@ -302,8 +527,147 @@ def style_presence(df: pd.DataFrame, show_additional: bool = False):
                         {"selector": "td,th", "props": "line-height: inherit; padding: 0;"}
                     ])
 
+
+# Status codes -1, 0, 1, 2 (indexed by status + 1) ordered by what a
+# pooled pixel shows first: retracted, newly applied, active, inactive
+_PRESENCE_PRIORITY = np.array([3, 0, 1, 2], dtype=np.int8)
+_PRESENCE_BY_PRIORITY = np.array([0, 1, 2, -1], dtype=np.int8)
+
+
+def presence_rgb(status: np.ndarray, show_additional: bool = False) -> np.ndarray:
+    """RGB image (uint8) of a status matrix through the style_presence palette"""
+    colours = PRESENCE_COLOURS if show_additional else PRESENCE_COLOURS_PLAIN
+    palette = np.array([_hex_rgb(colours[value]) for value in (-1, 0, 1, 2)], dtype=np.uint8)
+    return palette[status.astype(np.intp) + 1]
+
+
+def plot_presence_matrix(status: np.ndarray, scenario_ids, test_ids, title="", show_additional=False,
+                         flipped=False, fig_height=500):
+    """
+    Presence matrix (make_presence_array) as one PNG image: the cells are
+    coloured in NumPy through the style_presence palette, so the browser
+    draws an image instead of one styled table cell per entry. Matrices
+    beyond RASTER_MAX_SIZE are pooled, a pixel showing the most notable
+    status of its block. ``flipped`` puts tests on the rows.
+    """
+    row_ids, col_ids = (test_ids, scenario_ids) if flipped else (scenario_ids, test_ids)
+    status = status.T if flipped else status
+    pooled, (block_rows, block_cols) = _max_pool(_PRESENCE_PRIORITY[status.astype(np.intp) + 1], RASTER_MAX_SIZE)
+    rgb = presence_rgb(_PRESENCE_BY_PRIORITY[pooled], show_additional)
+
+    x_title, y_title = ("Scenario ID", "Test ID") if flipped else ("Test ID", "Scenario ID")
+    fig = go.Figure(go.Image(
+        source=_png_data_uri(rgb),
+        x0=(block_cols - 1) / 2, dx=block_cols, y0=(block_rows - 1) / 2, dy=block_rows,
+        hovertemplate=f"{x_title} #%{{x}}<br>{y_title} #%{{y}}<extra></extra>",
+    ))
+    fig.update_xaxes(title=x_title, range=[-0.5, len(col_ids) - 0.5], side="top", **_category_axis(col_ids))
+    fig.update_yaxes(title=y_title, range=[len(row_ids) - 0.5, -0.5], **_category_axis(row_ids))
+    fig.update_layout(title=title, height=fig_height)
+    return fig
+
+
+def presence_status(status: np.ndarray, scenario_ids, test_ids, scenario, test) -> str:
+    """Status name of ``scenario`` in test ``test``, looked up in the array of make_presence_array"""
+    return PRESENCE_STATUS_NAMES[int(status[scenario_ids.index(scenario), test_ids.index(test)])]
+
+
+# Cost frames kept for reuse: (tests, costs_data, frame), matched by identity
+COST_FRAME_CACHE_SIZE = 4
+_cost_frames = []
+
+
+def make_cost_frame(tests, costs_data) -> pd.DataFrame:
+    """
+    Per-test cost frame shared by the cost plots, in execution order:
+    test_id, absolute_total_cost (all scenarios of the test),
+    scenarios / apply / retract (comma-separated), total_ordered_cost
+    (apply + retract) and cumulative_cost (its running sum). Sums are
+    bincounts over the flattened incidence; the frame of the same
+    ``tests`` and ``costs_data`` objects is built once and reused, so
+    callers must not modify it (or those objects) in place.
+    """
+    for cached_tests, cached_costs, frame in _cost_frames:
+        if cached_tests is tests and cached_costs is costs_data:
+            return frame
+    if isinstance(tests, TestPlan):
+        frame = _plan_cost_frame(tests, costs_data)
+    else:
+        frame = _tests_cost_frame(tests, costs_data)
+    _cost_frames.insert(0, (tests, costs_data, frame))
+    del _cost_frames[COST_FRAME_CACHE_SIZE:]
+    return frame
+
+
+def _sum_by_test(owner: np.ndarray, values: list, n: int) -> np.ndarray:
+    values = np.array(values)
+    sums = np.bincount(owner, weights=values, minlength=n)
+    return np.rint(sums).astype(np.int64) if values.dtype.kind in 'iu' or len(values) == 0 else sums
+
+
+def _tests_cost_frame(tests, costs_data) -> pd.DataFrame:
+    costs_lookup = costs_data.get("scenarios", {})
+    n = len(tests)
+    # a repeated test ID shows the first test with that ID
+    first = {}
+    for i, test in enumerate(tests):
+        first.setdefault(test["id"], i)
+    source = [tests[first[test["id"]]] for test in tests]
+
+    scenarios = [test["scenarios"] for test in tests]
+    absolute = _sum_by_test(np.repeat(np.arange(n), [len(sc) for sc in scenarios]),
+                            [costs_lookup.get(s, 0) for sc in scenarios for s in sc], n)
+    operations = [test.get("apply", []) + test.get("retract", []) for test in source]
+    ordered = _sum_by_test(np.repeat(np.arange(n), [len(ops) for ops in operations]),
+                           [costs_lookup.get(s, 0) for ops in operations for s in ops], n)
+    return _cost_frame(
+        [test["id"] for test in tests], absolute,
+        [", ".join([str(s) for s in test.get("scenarios", [])]) for test in source],
+        [", ".join([str(s) for s in test.get("apply", [])]) for test in source],
+        [", ".join([str(s) for s in test.get("retract", [])]) for test in source],
+        ordered)
+
+
+def _plan_cost_frame(plan: TestPlan, costs_data) -> pd.DataFrame:
+    costs = cost_vector(plan.scenarios, costs_data.get("scenarios", {}))
+    n = len(plan)
+    rows, entry_costs = plan.rows(), costs[plan.cols]
+    applied, retracted = plan.operations()
+    absolute = _sum_by_test(rows, entry_costs, n)
+    # scenarios retracted after test i are retracted by test i + 1
+    ordered = (np.bincount(rows[applied], weights=entry_costs[applied], minlength=n)
+               + np.bincount(rows[retracted] + 1, weights=entry_costs[retracted], minlength=n + 1)[:n])
+
+    ids, offsets = plan.scenarios.ids, plan.offsets.tolist()
+    cols = plan.cols.tolist()
+    names = lambda entries: ", ".join(sorted(str(ids[c]) for c in entries))
+    scenario_names, apply_names, retract_names = [], [], []
+    for i in range(n):
+        lo, hi = offsets[i], offsets[i + 1]
+        scenario_names.append(", ".join([str(ids[c]) for c in cols[lo:hi]]))
+        apply_names.append(names(plan.cols[lo:hi][applied[lo:hi]].tolist()))
+        prev = offsets[i - 1] if i else lo
+        retract_names.append(names(plan.cols[prev:lo][retracted[prev:lo]].tolist()))
+    return _cost_frame([record.extra.get("id", i + 1) for i, record in enumerate(plan.records)],
+                       absolute, scenario_names, apply_names, retract_names, ordered)
+
+
+def _cost_frame(test_ids, absolute, scenarios, apply, retract, ordered) -> pd.DataFrame:
+    ordered = np.asarray(ordered, dtype=np.float64)
+    return pd.DataFrame({
+        "test_id": test_ids,
+        "absolute_total_cost": absolute,
+        "scenarios": scenarios,
+        "apply": apply,
+        "retract": retract,
+        "total_ordered_cost": ordered,
+        "cumulative_cost": np.cumsum(ordered),
+    })
+
+
 def make_cost_plots(tests, costs_data, title="", type="absolute", show_cumsum=True, display_in_execorder=True,
-                    barcolor="skyblue", linecolor="red", fig_height=600):
+                    barcolor="skyblue", linecolor="red", fig_height=600,
+                    test_range=None, max_buckets=MAX_PLOT_BUCKETS):
     """
     Create a bar plot of the total costs per test.
     There are four types of cost plots as follows:
@@ -313,42 +677,12 @@ def make_cost_plots(tests, costs_data, title="", type="absolute", show_cumsum=Tr
             - Modes: 1. single y-axis: Application cost on y-axis on left or 2. double y-axis: Application cost on left, cumulative cost on right
         - Optimized Ordered Test Costs[key="relative"]: Costs per test config, if they are applied+retracted in the order of execution.
             - Modes: 1. single y-axis: Application cost on y-axis on left or 2. double y-axis: Application cost on left, cumulative cost on right
+    Only the bars at positions ``test_range`` (start, stop) of the chosen
+    order are drawn; more than ``max_buckets`` of them are binned into
+    buckets of consecutive tests (mean cost, with min/max as error bars).
     """
-    
-    # Lookup table for scenario costs Scenario ID → cost
-    costs_lookup = costs_data.get("scenarios", {})
-    # costs_lookup = {
-    #         int(b["scenarioID"]["value"]): int(b["cost"]["value"])
-    #         for b in raw["results"]["bindings"]
-    #     }
-    
-    # st.write(costs_lookup)
-
-    # Build a DataFrame with test IDs and their costs
-    test_costs = []
-    for i,test in enumerate(tests):
-        test_id = test["id"]
-        total_cost = sum(costs_lookup.get(scenario, 0) for scenario in test["scenarios"])
-        test_costs.append({"test_id": test_id, "absolute_total_cost": total_cost})
-    
-    costs_df = pd.DataFrame(test_costs)
-    # costs_df["test_id"] = costs_df["test_id"].astype(str) 
-
-
-    # Add the column for ordered cost
-    for i, row in costs_df.iterrows():
-        test_id = row["test_id"]
-        test = [test for test in tests if test["id"] == test_id][0]
-        apply_test_ids = test.get("apply", [])
-        retract_test_ids = test.get("retract", [])
-        costs_df.at[i, "scenarios"] = ", ".join([str(s) for s in test.get("scenarios", [])])
-        costs_df.at[i, "apply"] = ", ".join([str(s) for s in apply_test_ids])
-        costs_df.at[i, "retract"] = ", ".join([str(s) for s in retract_test_ids])
-        ordered_cost = sum(costs_lookup.get(scenario, 0) for scenario in apply_test_ids+ retract_test_ids)
-        costs_df.at[i, "total_ordered_cost"] = ordered_cost   
-        
-    # Add column for culmulative cost for the excution order
-    costs_df["cumulative_cost"] = costs_df["total_ordered_cost"].cumsum()
+    costs_df = make_cost_frame(tests, costs_data).copy()
+
     # for the last entry in cost_df, add the valur of absolute_total_cost to cumulative_cost to match the Combine dcost in metrics
     # this value is the cost to finally retract the last test configuration
     costs_df.at[len(costs_df)-1, "cumulative_cost"] = costs_df.at[len(costs_df)-1, "cumulative_cost"] + costs_df.at[len(costs_df)-1, "absolute_total_cost"]
@@ -366,6 +700,13 @@ def make_cost_plots(tests, costs_data, title="", type="absolute", show_cumsum=Tr
         costs_df = costs_df.sort_values(by=[cost_column])
         yaxis_tag = "(least to most expensive configuration)"
 
+    if test_range is not None:
+        costs_df = costs_df.iloc[max(test_range[0], 0):test_range[1]]
+    binned = bool(max_buckets) and len(costs_df) > max_buckets
+    if binned:
+        costs_df = bucket_cost_frame(costs_df, cost_column, max_buckets)
+        yaxis_tag += f" – {max_buckets} buckets of consecutive tests"
+
 
     # st.write(costs_df)
     
@@ -377,6 +718,11 @@ def make_cost_plots(tests, costs_data, title="", type="absolute", show_cumsum=Tr
             y=costs_df[cost_column],
             name="Test Configuration Cost",
             marker=dict(color=barcolor), 
+            error_y=dict(
+                type="data", symmetric=False,
+                array=costs_df["max_cost"] - costs_df[cost_column],
+                arrayminus=costs_df[cost_column] - costs_df["min_cost"],
+            ) if binned else None,
             zorder=1,
         )
     line_trace = go.Line(
@@ -406,7 +752,7 @@ def make_cost_plots(tests, costs_data, title="", type="absolute", show_cumsum=Tr
             tickfont=dict(size=8.5, color='black'),
             # tickson='boundaries',
             # showgrid=True,
-            dtick=1,
+            dtick=None if binned else 1,
             # tick0=0,
             # mirror="allticks",
         ),
@@ -445,67 +791,11 @@ def make_cost_histogram(unopt_tests, opt_tests, costs_data, title="",
         - Optimized Ordered Test Costs[key="relative"]: Costs per test config, if they are applied+retracted in the order of execution.
             - Modes: 1. single y-axis: Application cost on y-axis on left or 2. double y-axis: Application cost on left, cumulative cost on right
     """
-    
-    # Lookup table for scenario costs Scenario ID → cost
-    costs_lookup = costs_data.get("scenarios", {})
-    # costs_lookup = {
-    #         int(b["scenarioID"]["value"]): int(b["cost"]["value"])
-    #         for b in raw["results"]["bindings"]
-    #     }
-    
-    # st.write(costs_lookup)
-
-    # Build a DataFrame with test IDs and their costs
-    test_costs = []
-    for i,test in enumerate(unopt_tests):
-        test_id = test["id"]
-        total_cost = sum(costs_lookup.get(scenario, 0) for scenario in test["scenarios"])
-        test_costs.append({"test_id": test_id, "absolute_total_cost": total_cost})
-    
-    unopt_costs_df = pd.DataFrame(test_costs)
-    unopt_costs_df["type"] = "Unoptimized Test Cost"
-    # costs_df["test_id"] = costs_df["test_id"].astype(str) 
-
-
-    # Add the column for ordered cost
-    for i, row in unopt_costs_df.iterrows():
-        test_id = row["test_id"]
-        test = [test for test in unopt_tests if test["id"] == test_id][0]
-        apply_test_ids = test.get("apply", [])
-        retract_test_ids = test.get("retract", [])
-        unopt_costs_df.at[i, "scenarios"] = ", ".join([str(s) for s in test.get("scenarios", [])])
-        unopt_costs_df.at[i, "apply"] = ", ".join([str(s) for s in apply_test_ids])
-        unopt_costs_df.at[i, "retract"] = ", ".join([str(s) for s in retract_test_ids])
-        ordered_cost = sum(costs_lookup.get(scenario, 0) for scenario in apply_test_ids+ retract_test_ids)
-        unopt_costs_df.at[i, "total_ordered_cost"] = ordered_cost   
-        
-    # Add column for culmulative cost for the excution order
-    unopt_costs_df["cumulative_cost"] = unopt_costs_df["total_ordered_cost"].cumsum()
-    
-    test_costs = []
-    for i,test in enumerate(opt_tests):
-        test_id = test["id"]
-        total_cost = sum(costs_lookup.get(scenario, 0) for scenario in test["scenarios"])
-        test_costs.append({"test_id": test_id, "absolute_total_cost": total_cost})
-    
-    opt_costs_df = pd.DataFrame(test_costs)
-    opt_costs_df["type"] = "Optimized Test Cost"
-    # costs_df["test_id"] = costs_df["test_id"].astype(str) 
-
-
-    # Add the column for ordered cost
-    for i, row in opt_costs_df.iterrows():
-        test_id = row["test_id"]
-        test = [test for test in opt_tests if test["id"] == test_id][0]
-        apply_test_ids = test.get("apply", [])
-        retract_test_ids = test.get("retract", [])
-        opt_costs_df.at[i, "scenarios"] = ", ".join([str(s) for s in test.get("scenarios", [])])
-        opt_costs_df.at[i, "apply"] = ", ".join([str(s) for s in apply_test_ids])
-        opt_costs_df.at[i, "retract"] = ", ".join([str(s) for s in retract_test_ids])
-        ordered_cost = sum(costs_lookup.get(scenario, 0) for scenario in apply_test_ids+ retract_test_ids)
-        opt_costs_df.at[i, "total_ordered_cost"] = ordered_cost   
-        
-    # Add column for culmulative cost for the excution order
+    unopt_costs_df = make_cost_frame(unopt_tests, costs_data).copy()
+    unopt_costs_df.insert(2, "type", "Unoptimized Test Cost")
+
+    opt_costs_df = make_cost_frame(opt_tests, costs_data).copy()
+    opt_costs_df.insert(2, "type", "Optimized Test Cost")
     opt_costs_df["cumulative_cost"] = opt_costs_df["total_ordered_cost"]#.cumsum()
 
     costs_df = pd.concat([opt_costs_df, unopt_costs_df], ignore_index=True)
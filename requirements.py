@@ -7,6 +7,7 @@ import pandas as pd
 import numpy as np
 
 from src.generate_tests import generate_tests
+from src.sparql_json import iter_rows
 from jsontocsv import json_to_csv
 # from makeplots import build_sankey, make_presence_df, style_presence, make_cost_plots, make_cost_histogram
 
@@ -24,8 +25,8 @@ def render(project: dict) -> None:
 
     json_to_csv(json_input_path=json_path, csv_output_path=csv_path)
 
-    req_data = json.load(open(os.path.join("reports/Requirements.json"), "rb+"))
-    tests_data = generate_tests(req_data)
+    req_path = os.path.join("reports/Requirements.json")
+    tests_data = generate_tests(req_path, index_path=os.path.join(folder, "tests_index.json"))
 
     with open(os.path.join(folder, "tests.json"), "w") as f:
         json.dump(tests_data, f, indent=2)
@@ -33,11 +34,11 @@ def render(project: dict) -> None:
 
 
     requirements = {}
-    for req in req_data["results"]["bindings"]:
-        requirements[req["reqName"]["value"]] = {
-            "id": req["reqName"]["value"],
-            "scenarios": req["scenarios"]["value"],
-            "quantity": req["quaID"]["value"]
+    for req_name, req_scenarios, qua_id in iter_rows(req_path, ("reqName", "scenarios", "quaID")):
+        requirements[req_name] = {
+            "id": req_name,
+            "scenarios": req_scenarios,
+            "quantity": qua_id
         }
 
     requirements_df = pd.DataFrame.from_dict(requirements, orient="index")
@@ -5,6 +5,7 @@ import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 
+from src.sparql_json import iter_rows
 from makeplots import build_sankey, make_presence_df, style_presence, make_cost_plots, make_cost_histogram
 
 
@@ -21,14 +22,14 @@ def render(project: dict) -> None:
     
     # # ──────────────────────────── 2.  Load data once ────────────────────────────
 
-    req_data = json.load(open(os.path.join("reports/Requirements.json"), "rb+"))
+    req_path = os.path.join("reports/Requirements.json")
 
     requirements = {}
-    for req in req_data["results"]["bindings"]:
-        requirements[req["reqName"]["value"]] = {
-            "id": req["reqName"]["value"],
-            "scenarios": req["scenarios"]["value"],
-            "quantity": req["quaID"]["value"]
+    for req_name, req_scenarios, qua_id in iter_rows(req_path, ("reqName", "scenarios", "quaID")):
+        requirements[req_name] = {
+            "id": req_name,
+            "scenarios": req_scenarios,
+            "quantity": qua_id
         }
 
     requirements_df = pd.DataFrame.from_dict(requirements, orient="index")
@@ -0,0 +1,50 @@
+"""
+Background persistence of pipeline artifacts.
+
+The dashboard keeps pruned tests, costs and optimized orders in memory
+and only saves them as side effects. save_json() hands the serialization
+to a single writer thread, so saves run in order, off the caller's path,
+and a file is replaced atomically once complete: readers never see a
+partially written artifact.
+"""
+
+import json
+import os
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, List, Optional
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-writer")
+_pending: List[Future] = []
+
+
+def _write_json(path: str, data: Any, indent: int):
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=".json")
+    try:
+        # json.dumps runs the C encoder when indent is None; json.dump to a
+        # file always falls back to the Python one
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps(data, indent=indent))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_json(path: str, data: Any, indent: int = 2) -> Future:
+    """
+    Save ``data`` as JSON at ``path`` in the background. ``data`` must not
+    be mutated until the returned future is done.
+    """
+    _pending[:] = [future for future in _pending if not future.done()]
+    future = _writer.submit(_write_json, path, data, indent)
+    _pending.append(future)
+    return future
+
+
+def wait_for_saves(timeout: Optional[float] = None):
+    """Block until every pending save has finished; re-raise the first failure"""
+    done, _ = wait(list(_pending), timeout=timeout)
+    for future in done:
+        future.result()
@@ -0,0 +1,222 @@
+"""
+Tour construction heuristics for test ordering.
+
+All tours start at test 0 (the empty configuration) and are built from a
+NeighborIndex, so they never need the full weight matrix:
+
+    "identity"             the input order (Ruby behaviour)
+    "nearest-neighbor"     always move to the nearest unvisited test
+    "greedy"               greedy matching of the k-nearest-neighbor edges
+                           into paths, joined nearest endpoint first
+    "space-filling-curve"  Hilbert order of a 2-D projection of the
+                           cost-weighted scenario sets
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.local_search import NEIGHBOR_K, SearchBudget
+from src.neighbor_index import NeighborIndex, NearestUnvisited
+
+# Hilbert curve resolution (bits per axis) of the space-filling-curve order
+HILBERT_BITS = 16
+# Power iterations used to find the projection axes
+PROJECTION_ITERATIONS = 20
+
+
+def identity_tour(index: NeighborIndex) -> List[int]:
+    return list(range(index.n))
+
+
+def nearest_neighbor_tour(index: NeighborIndex, start: int = 0,
+                          budget: Optional[SearchBudget] = None) -> List[int]:
+    """
+    Greedy walk from ``start`` to the nearest unvisited test. Once
+    ``budget`` is exhausted the unvisited tests follow in index order.
+    """
+    unvisited = NearestUnvisited(index)
+    unvisited.remove(start)
+    tour = [start]
+    while unvisited.remaining:
+        if budget is not None and not budget.poll():
+            tour.extend(np.flatnonzero(unvisited.allowed).tolist())
+            break
+        nxt, _ = unvisited.nearest(tour[-1])
+        unvisited.remove(nxt)
+        tour.append(nxt)
+    return tour
+
+
+def greedy_edge_tour(index: NeighborIndex, k: int = NEIGHBOR_K,
+                     neighbors: Optional[Tuple[List[List[int]], List[List]]] = None,
+                     budget: Optional[SearchBudget] = None) -> List[int]:
+    """
+    Greedy edge matching: take the k-nearest-neighbor edges cheapest first
+    whenever both ends still have degree < 2 and no cycle is closed. The
+    resulting paths are then chained, always continuing with the path
+    whose endpoint is nearest to the current end; once ``budget`` is
+    exhausted the remaining paths follow in index order.
+    """
+    n = index.n
+    if n <= 3:
+        return identity_tour(index)
+    near, near_dists = neighbors if neighbors is not None else index.knn_all(k)
+
+    edges = sorted(
+        (dist, a, b)
+        for a in range(n)
+        for b, dist in zip(near[a], near_dists[a])
+        if a < b or a not in near[b]
+    )
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    adjacent = [[] for _ in range(n)]
+    for _, a, b in edges:
+        if len(adjacent[a]) < 2 and len(adjacent[b]) < 2:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[ra] = rb
+                adjacent[a].append(b)
+                adjacent[b].append(a)
+
+    # Walk every path from one end; other_end maps each end to the other
+    paths = {}
+    other_end = {}
+    seen = [False] * n
+    for a in range(n):
+        if seen[a] or len(adjacent[a]) == 2:
+            continue
+        path, prev, cur = [a], -1, a
+        seen[a] = True
+        while True:
+            nxt = [x for x in adjacent[cur] if x != prev]
+            if not nxt:
+                break
+            prev, cur = cur, nxt[0]
+            seen[cur] = True
+            path.append(cur)
+        paths[a] = path
+        paths[path[-1]] = path
+        other_end[a], other_end[path[-1]] = path[-1], a
+
+    # Chain the paths, starting with the one containing test 0
+    ends = np.zeros(n, dtype=bool)
+    ends[list(paths)] = True
+    unvisited = NearestUnvisited(index, allowed=ends)
+    first = next(e for e, path in paths.items() if 0 in path)
+    tour = list(paths[first])
+    unvisited.remove(first)
+    unvisited.remove(other_end[first])
+    while unvisited.remaining:
+        if budget is not None and not budget.poll():
+            for end in np.flatnonzero(unvisited.allowed).tolist():
+                if unvisited.allowed[end]:
+                    path = paths[end]
+                    tour.extend(path if path[0] == end else path[::-1])
+                    unvisited.remove(end)
+                    unvisited.remove(other_end[end])
+            break
+        end, _ = unvisited.nearest(tour[-1])
+        path = paths[end]
+        tour.extend(path if path[0] == end else path[::-1])
+        unvisited.remove(end)
+        unvisited.remove(other_end[end])
+
+    start = tour.index(0)
+    return tour[start:] + tour[:start]
+
+
+def _hilbert_index(x: np.ndarray, y: np.ndarray, bits: int) -> np.ndarray:
+    """Position of the grid points (x, y) along a Hilbert curve"""
+    x, y = x.astype(np.int64), y.astype(np.int64)
+    d = np.zeros_like(x)
+    s = 1 << (bits - 1)
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, s - 1 - x, x)
+        y = np.where(flip, s - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s >>= 1
+    return d
+
+
+def space_filling_curve_tour(index: NeighborIndex, bits: int = HILBERT_BITS) -> List[int]:
+    """
+    Order the tests along a Hilbert curve through their projection on the
+    top two principal axes of the cost-weighted scenario incidence matrix
+    (found by power iteration over the inverted index, without building
+    the matrix).
+    """
+    n = index.n
+    if n <= 3:
+        return identity_tour(index)
+    cols, offsets = index.set_cols, index.set_offsets
+    owners = np.repeat(np.arange(n), np.diff(offsets))
+    weights = index.costs[cols]
+    mean = np.bincount(cols, weights=weights, minlength=len(index.costs)) / n
+
+    def project(v):  # (X - mean) v
+        return np.bincount(owners, weights=weights * v[cols], minlength=n) - mean @ v
+
+    def back(u):  # (X - mean)^T u
+        return np.bincount(cols, weights=weights * u[owners], minlength=len(index.costs)) - mean * u.sum()
+
+    rng = np.random.default_rng(0)
+    axes = []
+    for _ in range(2):
+        v = rng.standard_normal(len(index.costs))
+        for _ in range(PROJECTION_ITERATIONS):
+            v = back(project(v))
+            for axis in axes:
+                v -= (v @ axis) * axis
+            norm = np.linalg.norm(v)
+            if norm == 0:
+                break
+            v /= norm
+        axes.append(v)
+
+    coords = np.stack([project(axis) for axis in axes], axis=1)
+    span = coords.max(axis=0) - coords.min(axis=0)
+    span[span == 0] = 1
+    grid = ((coords - coords.min(axis=0)) / span * ((1 << bits) - 1)).round()
+    order = np.argsort(_hilbert_index(grid[:, 0], grid[:, 1], bits), kind='stable')
+
+    tour = order.tolist()
+    start = tour.index(0)
+    return tour[start:] + tour[:start]
+
+
+CONSTRUCTIONS = {
+    "identity": identity_tour,
+    "nearest-neighbor": nearest_neighbor_tour,
+    "greedy": greedy_edge_tour,
+    "space-filling-curve": space_filling_curve_tour,
+}
+
+
+def construct_tour(name: str, index: NeighborIndex,
+                   neighbors: Optional[Tuple[List[List[int]], List[List]]] = None,
+                   budget: Optional[SearchBudget] = None) -> List[int]:
+    """
+    Initial tour built by the named heuristic (``neighbors``: precomputed
+    k-NN lists). The walking heuristics finish early, with a valid tour,
+    once ``budget`` is exhausted.
+    """
+    if name not in CONSTRUCTIONS:
+        raise ValueError(f"Unknown construction: {name}")
+    if name == "greedy":
+        return greedy_edge_tour(index, neighbors=neighbors, budget=budget)
+    if name == "nearest-neighbor":
+        return nearest_neighbor_tour(index, budget=budget)
+    return CONSTRUCTIONS[name](index)
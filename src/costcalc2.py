@@ -1,6 +1,13 @@
 import json
 from pathlib import Path
 import streamlit as st
+import numpy as np
+from typing import Dict, Tuple
+
+from src.test_plan import TestPlan, cost_vector
+
+# Scenario entries looked up per block when scoring pairs of consecutive tests
+BATCH_BLOCK_ENTRIES = 1 << 22
 
 def calculate_costs(tests, costs_data):
     """
@@ -13,6 +20,9 @@ def calculate_costs(tests, costs_data):
     # Load costs from costs.json and build a cost lookup dictionary
     cost_lookup = costs_data.get("scenarios", {})
 
+    if isinstance(tests, TestPlan):
+        return calculate_plan_costs(tests, costs_data)
+
     # # Load the test data
     # file_path = 'reports/tests_unoptimized_def.json'
     # with open(file_path, 'r') as file:
@@ -46,13 +56,103 @@ def calculate_costs(tests, costs_data):
     total_combined = total_apply_cost + total_retract_cost
     # declared_length = data.get("length", "Not specified")
 
-    print("\n--- Totals ---")
-    print(f"Total Apply Cost: {total_apply_cost}")
-    print(f"Total Retract Cost: {total_retract_cost}")
-    print(f"Total Combined Cost: {total_combined}")
-
     return {
         "total_apply_cost": total_apply_cost,
         "total_retract_cost": total_retract_cost,
         "total_combined_cost": total_combined
-    }
\ No newline at end of file
+    }
+
+
+def calculate_plan_costs(plan: TestPlan, costs_data):
+    """calculate_costs for a TestPlan in execution order, from its incidence"""
+    totals = batch_costs(plan, [np.arange(len(plan))], costs_data)
+    return {key: values[0].item() for key, values in totals.items()}
+
+
+def _flatten_orderings(orderings) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Orderings as one flat array of test indices, the ordering of every entry and their count"""
+    if isinstance(orderings, np.ndarray) and orderings.ndim == 2:
+        m, length = orderings.shape
+        return orderings.reshape(-1).astype(np.int64), np.repeat(np.arange(m), length), m
+    orderings = list(orderings)
+    if orderings and np.ndim(orderings[0]) == 0:  # a single ordering
+        orderings = [orderings]
+    if not orderings:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0
+    flat = np.concatenate([np.asarray(order, dtype=np.int64) for order in orderings])
+    return flat, np.repeat(np.arange(len(orderings)), [len(order) for order in orderings]), len(orderings)
+
+
+def shared_costs(plan: TestPlan, costs: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    Summed cost of the scenarios tests u[i] and v[i] have in common: the
+    scenarios of the shorter row of each pair are looked up in the other
+    row through the sorted incidence keys, BATCH_BLOCK_ENTRIES at a time.
+    """
+    n_scenarios = max(len(plan.scenarios), 1)
+    present = np.sort(plan.rows() * n_scenarios + plan.cols)
+    lengths = np.diff(plan.offsets)
+    swap = lengths[u] > lengths[v]
+    u, v = np.where(swap, v, u), np.where(swap, u, v)
+    ends = np.cumsum(lengths[u])
+
+    shared = np.zeros(len(u))
+    lo = 0
+    while lo < len(u):
+        before = ends[lo - 1] if lo else 0
+        hi = max(int(np.searchsorted(ends, before + BATCH_BLOCK_ENTRIES, side='right')), lo + 1)
+        uu, vv, row_lengths = u[lo:hi], v[lo:hi], lengths[u[lo:hi]]
+        pair = np.repeat(np.arange(hi - lo), row_lengths)
+        entries = plan.offsets[uu][pair] + np.arange(len(pair)) - (ends[lo:hi] - row_lengths - before)[pair]
+        cols = plan.cols[entries]
+        keys = vv[pair] * n_scenarios + cols
+        pos = np.minimum(np.searchsorted(present, keys), max(len(present) - 1, 0))
+        hit = present[pos] == keys if len(present) else np.zeros(len(keys), dtype=bool)
+        shared[lo:hi] = np.bincount(pair, weights=np.where(hit, costs[cols], 0), minlength=hi - lo)
+        lo = hi
+    return shared
+
+
+def batch_costs(plan, orderings, costs_data=None) -> Dict[str, np.ndarray]:
+    """
+    Apply, retract and combined totals of many orderings of the same tests
+    in one pass, without side effects. ``plan`` is a TestPlan (or tests in
+    the JSON shape); ``orderings`` is an (m, n) array, a list of
+    sequences of row indices into the plan (lengths may differ), or a
+    single sequence. Costs come from ``costs_data`` if given, else from
+    the plan. Returns arrays of length m under the calculate_costs keys.
+
+    Every test applies what the previous one lacks and every applied
+    scenario is retracted once (the last test's when the campaign ends),
+    so both totals are sum(A(test)) - sum(shared(t_k, t_k+1)) with A the
+    summed cost of a test's scenarios. Orderings of a population share
+    most of their consecutive pairs, and every distinct pair is scored
+    once.
+    """
+    if not isinstance(plan, TestPlan):
+        plan = TestPlan.from_tests(plan)
+    if costs_data is not None:
+        costs = cost_vector(plan.scenarios, costs_data.get("scenarios", {}))
+    elif plan.scenario_costs is not None:
+        costs = plan.scenario_costs
+    else:
+        raise ValueError("batch_costs needs costs_data for a plan without scenario costs")
+
+    flat, owner, m = _flatten_orderings(orderings)
+    absolute = np.bincount(plan.rows(), weights=costs[plan.cols], minlength=len(plan))
+    totals = np.bincount(owner, weights=absolute[flat], minlength=m)
+
+    consecutive = owner[1:] == owner[:-1]
+    u, v = flat[:-1][consecutive], flat[1:][consecutive]
+    n = max(len(plan), 1)
+    pairs, inverse = np.unique(np.minimum(u, v) * n + np.maximum(u, v), return_inverse=True)
+    shared = shared_costs(plan, costs, pairs // n, pairs % n)
+    totals -= np.bincount(owner[1:][consecutive], weights=shared[inverse], minlength=m)
+
+    if costs.dtype.kind in 'iu':
+        totals = np.rint(totals).astype(np.int64)
+    return {
+        "total_apply_cost": totals,
+        "total_retract_cost": totals.copy(),
+        "total_combined_cost": 2 * totals,
+    }
@@ -0,0 +1,271 @@
+"""
+Decompose-and-stitch ordering for very large test plans.
+
+1. Partition the tests into clusters of at most ``cluster_size``
+   similar tests by balanced recursive bisection around pairs of
+   far-apart pivot tests under the reconfiguration cost.
+2. Solve every cluster's sub-tour in a weights_pool worker: greedy
+   construction over a cluster-local NeighborIndex plus local search on
+   the cluster's dense weight block.
+3. Order the clusters by a tour over their medoids, open each sub-tour
+   at the edge that joins the previous cluster most cheaply and
+   concatenate them.
+4. Refine only around the stitches: the REFINE_WINDOW tests on either
+   side of each one are re-optimized as a path with fixed ends.
+
+Clustering costs O(n log(n / cluster_size)) distance evaluations and
+every other step is linear in the plan for a fixed cluster size, except
+ordering the medoids, which is small.
+
+Every step checks the SearchBudget. Once it is spent, bisection stops,
+clusters not solved yet keep their plan order, and the clusters are
+chained in the order they were found. The result is always a valid tour,
+and it is the plan order if the budget is spent from the start.
+"""
+
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.distance_oracle import distance_pairs
+from src.neighbor_index import NeighborIndex
+from src.construction import greedy_edge_tour
+from src.local_search import (LocalSearch, SearchBudget, LOCAL_SEARCH_MOVES, NEIGHBOR_K, PROGRESS_INTERVAL,
+                              neighbor_lists)
+from src.held_karp import held_karp, tour_cost, HELD_KARP_MAX_N
+from src.weights_pool import weights_pool, pool_weights, pool_cancel
+
+# Largest cluster solved as one sub-tour
+CLUSTER_SIZE = 1000
+# Members sampled when picking a cluster's medoid
+MEDOID_SAMPLE = 200
+# Tests on either side of a stitch re-optimized by the boundary refinement
+REFINE_WINDOW = 100
+
+
+def cluster_tests(weights, members: np.ndarray, cluster_size: int = CLUSTER_SIZE,
+                  rng: Optional[np.random.Generator] = None,
+                  budget: Optional[SearchBudget] = None) -> List[np.ndarray]:
+    """
+    Split ``members`` into clusters of similar tests of at most
+    ``cluster_size`` by recursive bisection: two far-apart pivot tests are
+    found from a random start, and the tests are cut at the median of
+    d(x, p1) - d(x, p2), so every split is balanced. Once ``budget`` is
+    spent, the remaining parts are not split further.
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+    if len(members) <= cluster_size or (budget is not None and not budget.poll()):
+        return [members]
+    start = members[rng.integers(len(members))]
+    p1 = members[np.argmax(distance_pairs(weights, start, members))]
+    to_p1 = distance_pairs(weights, p1, members)
+    p2 = members[np.argmax(to_p1)]
+    score = to_p1 - distance_pairs(weights, p2, members)
+    half = len(members) // 2
+    split = np.argpartition(score, half)
+    return (cluster_tests(weights, members[split[:half]], cluster_size, rng, budget)
+            + cluster_tests(weights, members[split[half:]], cluster_size, rng, budget))
+
+
+def solve_cluster(weights, members: np.ndarray, index: NeighborIndex,
+                  moves, k: int = NEIGHBOR_K, budget: Optional[SearchBudget] = None) -> List[int]:
+    """
+    Sub-tour (global test ids) of one cluster; ``index`` covers the members
+    only. Within ``budget``: once it runs out, the best sub-tour so far, or
+    the members in plan order if there is none yet.
+    """
+    if len(members) <= 3:
+        return members.tolist()
+    if budget is not None:
+        # time limit and cancellation only: progress is the whole tour's
+        budget.begin(0)
+    neighbors = index.knn_all(k, budget)
+    if neighbors is None:
+        return members.tolist()
+    tour = greedy_edge_tour(index, k, neighbors, budget)
+    block = distance_pairs(weights, members[:, None], members[None, :])
+    tour = LocalSearch(block, tour, k, neighbors).run(moves, budget)
+    return members[tour].tolist()
+
+
+def _solve_cluster_pooled(members: np.ndarray, index: NeighborIndex, moves, k: int,
+                          deadline: Optional[float] = None) -> List[int]:
+    budget = None
+    if pool_cancel() is not None:
+        budget = SearchBudget(None if deadline is None else deadline - time.time(), cancelled=pool_cancel())
+    return solve_cluster(pool_weights(), members, index, moves, k, budget)
+
+
+def order_clusters(weights, medoids: np.ndarray, first: int) -> List[int]:
+    """Cluster visiting order: a short tour over the medoids, starting at ``first``"""
+    n = len(medoids)
+    if n <= 3:
+        order = list(range(n))
+    else:
+        block = distance_pairs(weights, medoids[:, None], medoids[None, :])
+        if n <= HELD_KARP_MAX_N:
+            order, _ = held_karp(block)
+        else:
+            order = LocalSearch(block, list(range(n))).run(LOCAL_SEARCH_MOVES['3opt'])
+    start = order.index(first)
+    return order[start:] + order[:start]
+
+
+def stitch(weights, sub_tours: List[List[int]],
+           budget: Optional[SearchBudget] = None) -> Tuple[List[int], List[int]]:
+    """
+    Concatenate cyclic sub-tours: the first is opened before test 0, every
+    other one at the edge whose removal and reconnection to the previous
+    sub-tour's end costs least (once ``budget`` is spent, where it starts).
+    Returns the tour and the stitch positions (where each sub-tour after
+    the first starts).
+    """
+    first = sub_tours[0]
+    start = first.index(0) if 0 in first else 0
+    tour = first[start:] + first[:start]
+    seams = []
+    for cycle in sub_tours[1:]:
+        cycle = np.asarray(cycle, dtype=np.intp)
+        seams.append(len(tour))
+        if len(cycle) == 1 or (budget is not None and not budget.poll()):
+            tour.extend(cycle.tolist())
+            continue
+        prev = tour[-1]
+        u, v = cycle, np.roll(cycle, -1)
+        edge = distance_pairs(weights, u, v)
+        forward = distance_pairs(weights, prev, v) - edge  # enter at v, leave at u
+        backward = distance_pairs(weights, prev, u) - edge  # enter at u, leave at v
+        i_f, i_b = int(np.argmin(forward)), int(np.argmin(backward))
+        if forward[i_f] <= backward[i_b]:
+            path = np.roll(cycle, -(i_f + 1))
+        else:
+            path = np.roll(cycle[::-1], -(len(cycle) - 1 - i_b))
+        tour.extend(path.tolist())
+    return tour, seams
+
+
+def refine_path(weights, path: List[int], moves, k: int = NEIGHBOR_K,
+                budget: Optional[SearchBudget] = None) -> Tuple[List[int], Any]:
+    """
+    Re-optimize a path of the tour with its two ends fixed: local search on
+    the path's dense weight block, in which the closing edge between the
+    ends is made so cheap that no move ever drops it. Returns the new path
+    and the change in cost.
+    """
+    m = len(path)
+    if m < 5:
+        return path, 0
+    members = np.asarray(path, dtype=np.intp)
+    block = distance_pairs(weights, members[:, None], members[None, :])
+    # widened first: the sentinel is minus the block's total, which
+    # overflows the int32 weights of realistic costs
+    block = block.astype(np.int64 if block.dtype.kind in 'iu' else np.float64)
+    block[0, m - 1] = block[m - 1, 0] = -(block.sum() + 1)
+    engine = LocalSearch(block, list(range(m)), k, neighbor_lists(block, k))
+    cycle = engine.run(moves, budget)
+    start = cycle.index(0)
+    cycle = cycle[start:] + cycle[:start]
+    if cycle[1] == m - 1:  # walked the closing edge first
+        cycle = [0] + cycle[:0:-1]
+    return members[cycle].tolist(), engine.delta
+
+
+def decompose_and_stitch(weights, index: NeighborIndex, local_search: str = '3opt',
+                         k: int = NEIGHBOR_K, workers: Optional[int] = None,
+                         cluster_size: int = CLUSTER_SIZE, seed: int = 0,
+                         budget: Optional[SearchBudget] = None) -> Tuple[List[int], Any, Dict[str, Any]]:
+    """
+    Order a large plan by clustering, solving clusters in parallel and
+    stitching. ``local_search`` names a move set of LOCAL_SEARCH_MOVES
+    ("2opt", the Ruby search, stands in as "2opt-fast"). Every step stays
+    within ``budget`` (see the module docstring). Returns the tour
+    (starting at test 0), its cost and statistics of the decomposition.
+    """
+    started = time.perf_counter()
+    moves = LOCAL_SEARCH_MOVES.get(local_search, LOCAL_SEARCH_MOVES['2opt-fast'])
+    n = len(weights)
+    rng = np.random.default_rng(seed)
+    in_budget = lambda: budget is None or budget.poll()
+
+    clusters = cluster_tests(weights, np.arange(n), cluster_size, rng, budget)
+    clustered = time.perf_counter()
+
+    # Sub-tours of the clusters solved within the budget; the others (also
+    # any left too large by bisection) keep their plan order
+    sub_tours = [None] * len(clusters)
+    todo = [j for j, cluster in enumerate(clusters) if len(cluster) <= cluster_size]
+    workers = min(workers or os.cpu_count() or 1, max(len(todo), 1))
+    if workers <= 1:
+        for j in todo:
+            if not in_budget():
+                break
+            sub_tours[j] = solve_cluster(weights, clusters[j], index.subset(clusters[j]), moves, k,
+                                         budget.split() if budget is not None else None)
+    else:
+        cancel = multiprocessing.Event() if budget is not None else None
+        remaining = budget.remaining() if budget is not None else None
+        deadline = None if remaining is None else time.time() + remaining
+        with weights_pool(weights, workers, cancel) as pool:
+            futures = {}
+            for j in todo:
+                if not in_budget():
+                    break
+                futures[pool.submit(_solve_cluster_pooled, clusters[j], index.subset(clusters[j]),
+                                    moves, k, deadline)] = j
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if not future.cancelled():
+                        sub_tours[futures[future]] = future.result()
+                if pending and not in_budget():
+                    # running clusters return their sub-tours so far
+                    for future in pending:
+                        future.cancel()
+                    cancel.set()
+    unsolved = sum(sub_tour is None for sub_tour in sub_tours)
+    sub_tours = [cluster.tolist() if sub_tour is None else sub_tour
+                 for cluster, sub_tour in zip(clusters, sub_tours)]
+    solved = time.perf_counter()
+
+    first = next(j for j, cluster in enumerate(clusters) if 0 in cluster)
+    if in_budget():
+        # Medoid of every sub-tour: its member nearest to the others, sampled
+        medoids = []
+        for cluster in clusters:
+            sample = cluster if len(cluster) <= MEDOID_SAMPLE else rng.choice(cluster, MEDOID_SAMPLE, replace=False)
+            medoids.append(sample[np.argmin(distance_pairs(weights, sample[:, None], sample[None, :]).sum(axis=1))])
+        order = order_clusters(weights, np.asarray(medoids), first)
+    else:
+        order = [first] + [j for j in range(len(clusters)) if j != first]
+    tour, seams = stitch(weights, [sub_tours[j] for j in order], budget)
+    stitched_cost = tour_cost(weights, tour)
+
+    # Boundary-only refinement around the stitches
+    if budget is not None:
+        budget.begin(stitched_cost)
+    delta = 0
+    for seam in seams:
+        if budget is not None and budget.stopped is not None:
+            break
+        lo, hi = max(seam - REFINE_WINDOW, 0), min(seam + REFINE_WINDOW, n)
+        tour[lo:hi], change = refine_path(weights, tour[lo:hi], moves, k, budget)
+        delta += change
+    start = tour.index(0)
+    tour = tour[start:] + tour[:start]
+
+    stats = {
+        'clusters': len(clusters),
+        'unsolved_clusters': unsolved,
+        'largest_cluster': max(len(cluster) for cluster in clusters),
+        'stitched_cost': stitched_cost,
+        'cluster_seconds': clustered - started,
+        'solve_seconds': solved - clustered,
+        'refine_seconds': time.perf_counter() - solved,
+    }
+    return tour, stitched_cost + delta, stats
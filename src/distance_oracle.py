@@ -0,0 +1,187 @@
+"""
+Matrix-free reconfiguration costs for test ordering.
+
+The cost between two tests is the summed cost of the scenarios in exactly
+one of them. DistanceOracle computes it on demand from packed scenario
+bitsets instead of materializing the n x n weight matrix, so memory stays
+linear in the number of tests:
+
+    d(a, b) = sum_k weight_k * popcount((bits_a ^ bits_b) & mask_k)
+
+where the masks split the scenarios by cost, either into binary planes
+(mask_k = scenarios whose integer cost has bit k set, weight 2^k) or into
+classes of equal cost, whichever needs fewer masks. Single pairs use
+Python int bitsets behind a bounded LRU cache; rows and pair vectors use
+NumPy uint64 words.
+"""
+
+import copy
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Hot pairs kept by the per-oracle LRU cache
+ORACLE_CACHE_SIZE = 1 << 20
+# uint64 words processed per block when computing rows or pair vectors
+ORACLE_BLOCK_WORDS = 1 << 22
+
+if hasattr(np, 'bitwise_count'):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT8 = np.array([bin(b).count('1') for b in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        return _POPCOUNT8[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1)
+
+
+def _pack(bit_lists: Sequence[Sequence[int]], n_words: int) -> np.ndarray:
+    """Pack lists of bit positions into rows of uint64 words"""
+    packed = np.zeros((len(bit_lists), n_words), dtype=np.uint64)
+    rows = np.repeat(np.arange(len(bit_lists)), [len(bits) for bits in bit_lists])
+    cols = np.fromiter((bit for bits in bit_lists for bit in bits), dtype=np.uint64, count=len(rows))
+    np.bitwise_or.at(packed, (rows, (cols >> np.uint64(6)).astype(np.intp)),
+                     np.left_shift(np.uint64(1), cols & np.uint64(63)))
+    return packed
+
+
+def intern_scenarios(tests: List[Dict], cost_map: Dict[str, int]) -> Tuple[List[List[int]], List]:
+    """
+    Number the scenarios with a non-zero cost in order of appearance.
+    Returns every test's sorted scenario numbers and the cost per number.
+    """
+    columns = {}
+    bit_lists = []
+    for test in tests:
+        bits = set()
+        for e in test['scenarios']:
+            key = str(e)
+            if not cost_map.get(key, 0):
+                continue
+            if key not in columns:
+                columns[key] = len(columns)
+            bits.add(columns[key])
+        bit_lists.append(sorted(bits))
+    return bit_lists, [cost_map[key] for key in columns]
+
+
+class DistanceOracle:
+    """Weighted symmetric-difference costs between tests, computed on demand"""
+
+    def __init__(self, tests: List[Dict], cost_map: Dict[str, int],
+                 cache_size: int = ORACLE_CACHE_SIZE):
+        bit_lists, costs = intern_scenarios(tests, cost_map)
+        # kept for NeighborIndex.from_oracle
+        self.sets = bit_lists
+        self.costs = costs
+        self.integral = all(isinstance(c, int) for c in costs)
+
+        # Cost masks: binary planes of non-negative integer costs, or one
+        # class per distinct cost
+        classes = {}
+        for col, c in enumerate(costs):
+            classes.setdefault(c, []).append(col)
+        planes = None
+        if self.integral and all(c >= 0 for c in costs):
+            n_planes = max(costs, default=0).bit_length()
+            if n_planes <= len(classes):
+                planes = [(1 << p, [col for col, c in enumerate(costs) if c >> p & 1])
+                          for p in range(n_planes)]
+        if planes is None:
+            planes = list(classes.items())
+
+        self.n = len(tests)
+        self.n_words = (len(costs) + 63) // 64
+        self.bits = [sum(1 << b for b in bits) for bits in bit_lists]
+        self.masks = [(weight, sum(1 << col for col in cols)) for weight, cols in planes]
+        self.packed = _pack(bit_lists, self.n_words)
+        self.packed_masks = _pack([cols for _, cols in planes], self.n_words)
+        self.mask_weights = np.array([weight for weight, _ in planes],
+                                     dtype=np.int64 if self.integral else np.float64)
+        self.cache_size = cache_size
+        self.item = lru_cache(maxsize=cache_size)(self._item)
+
+    def __len__(self):
+        return self.n
+
+    def __getstate__(self):
+        # the LRU cache wrapper is not picklable; workers rebuild their own
+        state = self.__dict__.copy()
+        del state['item']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.item = lru_cache(maxsize=self.cache_size)(self._item)
+
+    def _item(self, a: int, b: int):
+        """Cost between tests a and b (``item`` is its cached version)"""
+        x = self.bits[a] ^ self.bits[b]
+        return sum(weight * (x & mask).bit_count() for weight, mask in self.masks)
+
+    def _weigh(self, diff: np.ndarray) -> np.ndarray:
+        """Costs of XORed bitsets ``diff`` (..., n_words)"""
+        out = np.zeros(diff.shape[:-1], dtype=self.mask_weights.dtype)
+        for weight, mask in zip(self.mask_weights, self.packed_masks):
+            out += weight * _popcount(diff & mask).sum(axis=-1, dtype=np.int64)
+        return out
+
+    def rows(self, rows) -> np.ndarray:
+        """Costs from the tests ``rows`` to every test, shape (len(rows), n), or (n,) for one row"""
+        if np.ndim(rows) == 0:
+            return self.rows([rows])[0]
+        rows = np.asarray(rows, dtype=np.intp)
+        out = np.empty((len(rows), self.n), dtype=self.mask_weights.dtype)
+        step = max(1, ORACLE_BLOCK_WORDS // max(self.n * self.n_words, 1))
+        for start in range(0, len(rows), step):
+            block = self.packed[rows[start:start + step], None, :] ^ self.packed[None, :, :]
+            out[start:start + step] = self._weigh(block)
+        return out
+
+    def pairs(self, u, v) -> np.ndarray:
+        """Elementwise costs between tests u and v (broadcast like indices)"""
+        u, v = np.broadcast_arrays(np.asarray(u, dtype=np.intp), np.asarray(v, dtype=np.intp))
+        flat_u, flat_v = u.ravel(), v.ravel()
+        out = np.empty(len(flat_u), dtype=self.mask_weights.dtype)
+        step = max(1, ORACLE_BLOCK_WORDS // max(self.n_words, 1))
+        for start in range(0, len(flat_u), step):
+            stop = start + step
+            out[start:stop] = self._weigh(self.packed[flat_u[start:stop]] ^ self.packed[flat_v[start:stop]])
+        return out.reshape(u.shape)
+
+    def matrix(self) -> np.ndarray:
+        """The full weight matrix (only for small plans)"""
+        return self.rows(np.arange(self.n))
+
+    def subset(self, members: Sequence[int]) -> "DistanceOracle":
+        """Oracle over the given tests only (renumbered 0..len(members)-1)"""
+        members = np.asarray(members, dtype=np.intp)
+        sub = copy.copy(self)
+        sub.sets = [self.sets[a] for a in members]
+        sub.bits = [self.bits[a] for a in members]
+        sub.packed = self.packed[members]
+        sub.n = len(members)
+        sub.item = lru_cache(maxsize=self.cache_size)(sub._item)
+        return sub
+
+
+def distance_rows(weights, rows) -> np.ndarray:
+    """Rows of a weight matrix or oracle"""
+    if isinstance(weights, DistanceOracle):
+        return weights.rows(rows)
+    return weights[rows]
+
+
+def distance_pairs(weights, u, v) -> np.ndarray:
+    """Elementwise weights[u, v] of a weight matrix or oracle"""
+    if isinstance(weights, DistanceOracle):
+        return weights.pairs(u, v)
+    return weights[u, v]
+
+
+def distance_subset(weights, members: Sequence[int]):
+    """Weights among the given tests only, as a matrix or oracle like ``weights``"""
+    if isinstance(weights, DistanceOracle):
+        return weights.subset(members)
+    members = np.asarray(members, dtype=np.intp)
+    return weights[np.ix_(members, members)]
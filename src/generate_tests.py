@@ -1,20 +1,64 @@
+import os
 import json
 import uuid
 import hashlib
 from collections import defaultdict
-import networkx as nx
+
+from src.artifacts import save_json
+from src.sparql_json import iter_rows
+from src.test_plan import TestPlan
 
 # ----------- Hard-coded input/output file paths -----------
 # INPUT_FILE = "../reports/Requirements.json"
 # OUTPUT_FILE = "tests.json"
 # ---------------------------------------------------------
 
+TEST_INDEX_VERSION = 1
+_test_index_cache = {}  # Map: index_path -> (mtime_ns, index)
+
+
+def generate_tests(data, index_path=None, as_plan=False):
+    """
+    Generate tests from the Requirements SPARQL result. ``data`` may be the
+    parsed document or anything ``iter_rows`` can stream (path, bytes, file).
+
+    When ``index_path`` is given, test uuids are derived from their
+    ``config_digest`` instead of being random, and the generator keeps a
+    persisted index (requirement -> rows, config digest -> test) at that path.
+    Only tests whose scenario set or contributing requirements changed since
+    the previous run are rebuilt; all others are reused from the index. The
+    returned test dicts are copies, so callers may set their fields, but the
+    lists and dicts inside them are shared with the index and must not be
+    edited in place.
 
-def generate_tests(data):
+    With ``as_plan`` the tests are returned as a TestPlan.
+    """
+    (scenario_sets_list, rqts_by_ss, rqts_by_qty,
+     qty_by_rqt, rows_by_rqt) = read_requirements(data)
 
-    requirements = data["results"]["bindings"]
+    if index_path is not None:
+        tests = generate_tests_incremental(
+            scenario_sets_list, rqts_by_ss, rqts_by_qty, qty_by_rqt, rows_by_rqt, index_path
+        )
+        return TestPlan.from_tests(tests) if as_plan else tests
+
+    # --- Index strict subsets of every scenario set via bitsets ---
+    subsets_by_ss = strict_subsets(scenario_sets_list)
+
+    # --- Generate tests in the same order as vertices were added ---
+    tests = []
+    for k, ss in enumerate(scenario_sets_list):
+        subsets = [scenario_sets_list[adjacent] for adjacent in subsets_by_ss[k]]
+        test_obj = make_test(ss, subsets, rqts_by_ss, rqts_by_qty, qty_by_rqt)
+        tests.append(test_obj)
+
+    return TestPlan.from_tests(tests) if as_plan else tests
+
+
+def read_requirements(data):
+    """Build scenario sets and requirement/quantity indexes, preserving insertion order"""
+    requirements = iter_rows(data, ("reqName", "scenarios", "quaID"))
 
-    # --- Build scenario sets and indexes, preserving insertion order ---
     scenario_sets_list = []  # Ordered list of scenario sets (as frozen sets)
     scenario_sets_seen = set()  # For quick membership check
     
@@ -22,16 +66,14 @@ def generate_tests(data):
     rqts_by_ss_set = defaultdict(set)  # For quick membership check
     rqts_by_qty = defaultdict(set)  # Map: quantity -> set(req_ids)
     qty_by_rqt = {}  # Map: req_id -> quantity
+    rows_by_rqt = defaultdict(list)  # Map: req_id -> [[sorted scenarios, quantity], ...]
 
-    for rh in requirements:
-        req_id = rh["reqName"]["value"]
-        quantity = rh["quaID"]["value"]
-        
+    for req_id, scenarios_value, quantity in requirements:
         if req_id is None or quantity is None:
             continue
 
         # Process configs for this requirement
-        scenarios = rh["scenarios"]["value"].split(",")
+        scenarios = scenarios_value.split(",")
         ss = frozenset(scenarios)
 
 
@@ -45,57 +87,250 @@ def generate_tests(data):
 
         rqts_by_qty[quantity].add(req_id)
         qty_by_rqt[req_id] = quantity
+        rows_by_rqt[req_id].append([",".join(sorted(ss)), quantity])
 
-    # --- Build graph: directed edges from superset to subset ---
-    g = nx.DiGraph()
-    for ss in scenario_sets_list:
-        g.add_node(ss)
+    return scenario_sets_list, rqts_by_ss, rqts_by_qty, qty_by_rqt, rows_by_rqt
 
-    for v1 in scenario_sets_list:
-        for v2 in scenario_sets_list:
-            if v1 < v2:
-                g.add_edge(v2, v1)
 
-    # --- Generate tests in the same order as vertices were added ---
+def make_config_digest(ss):
+    """md5 of the sorted scenario list, formatted like the Ruby JSON dump"""
+    config = sorted(ss)
+    digest_string = str(config).replace("'", '"')
+    return hashlib.md5(digest_string.encode("utf-8")).hexdigest()
+
+
+def make_test(ss, subsets, rqts_by_ss, rqts_by_qty, qty_by_rqt, test_uuid=None):
+    """Build the test object for scenario set ``ss`` given its strict subsets"""
+    rqmts_direct = set(rqts_by_ss[ss])
+    rqmts = set(rqmts_direct)
+
+    for adjacent in subsets:
+        rqmts.update(rqts_by_ss[adjacent])
+
+    quantities = set()
+    for r in rqmts:
+        if r in qty_by_rqt:
+            quantities.add(qty_by_rqt[r])
+    quantities = sorted(quantities)
+
+    qh = {}
+    for q in quantities:
+        reqs_for_q = rqts_by_qty[q].intersection(rqmts)
+        qh[q] = {"requirements": sorted(reqs_for_q)}
+
+    quantities_direct = []
+    for q in quantities:
+        if q in qh:
+            if any(r in rqmts_direct for r in qh[q]["requirements"]):
+                quantities_direct.append(q)
+
+    config = sorted(ss)
+    config_digest = make_config_digest(ss)
+
+    rqmts_direct_list = rqts_by_ss[ss]
+
+    return {
+        "uuid": test_uuid or str(uuid.uuid4()),
+        "config_digest": config_digest,
+        "scenarios": config,
+        "quantities": qh,
+        "requirements_direct": rqmts_direct_list,
+        "quantities_direct": quantities_direct
+    }
+
+
+def generate_tests_incremental(scenario_sets_list, rqts_by_ss, rqts_by_qty,
+                               qty_by_rqt, rows_by_rqt, index_path):
+    """
+    Rebuild only the tests affected by requirement edits since the index at
+    ``index_path`` was written, then persist the updated index.
+
+    A test depends on the rows of every requirement whose scenario set is a
+    subset of (or equal to) its own, so the tests to rebuild are the
+    supersets of every old or new scenario set of an added, removed or
+    edited requirement, plus any test whose direct requirement list changed.
+    """
+    index = load_test_index(index_path)
+    old_rows = index["requirements"]
+    old_tests = index["tests"]
+
+    subset_index = SubsetIndex(scenario_sets_list)
+
+    # --- Scenario sets touched by added, removed or edited requirements ---
+    touched = set()
+    for req_id in old_rows.keys() | rows_by_rqt.keys():
+        before = old_rows.get(req_id, [])
+        after = rows_by_rqt.get(req_id, [])
+        if before != after:
+            for scenarios, _ in before + after:
+                touched.add(frozenset(scenarios.split(",")))
+
+    dirty = 0
+    for ss in touched:
+        dirty |= subset_index.supersets(ss, strict=False)
+    dirty = set(iter_bits(dirty))
+
+    # --- Reuse clean tests, rebuild dirty ones with content-addressed uuids ---
     tests = []
-    for ss in scenario_sets_list:
-        rqmts_direct = set(rqts_by_ss[ss])
-        rqmts = set(rqmts_direct)
-
-        for adjacent in g.successors(ss):
-            rqmts.update(rqts_by_ss[adjacent])
-
-        quantities = set()
-        for r in rqmts:
-            if r in qty_by_rqt:
-                quantities.add(qty_by_rqt[r])
-        quantities = sorted(quantities)
-
-        qh = {}
-        for q in quantities:
-            reqs_for_q = rqts_by_qty[q].intersection(rqmts)
-            qh[q] = {"requirements": sorted(reqs_for_q)}
-
-        quantities_direct = []
-        for q in quantities:
-            if q in qh:
-                if any(r in rqmts_direct for r in qh[q]["requirements"]):
-                    quantities_direct.append(q)
-
-        config = sorted(ss)
-        digest_string = str(config).replace("'", '"')
-        config_digest = hashlib.md5(digest_string.encode("utf-8")).hexdigest()
-
-        rqmts_direct_list = rqts_by_ss[ss]
-
-        test_obj = {
-            "uuid": str(uuid.uuid4()),
-            "config_digest": config_digest,
-            "scenarios": config,
-            "quantities": qh,
-            "requirements_direct": rqmts_direct_list,
-            "quantities_direct": quantities_direct
-        }
+    rebuild = []
+    for k, ss in enumerate(scenario_sets_list):
+        test_obj = old_tests.get(make_config_digest(ss))
+        if (test_obj is None or k in dirty
+                or test_obj["requirements_direct"] != rqts_by_ss[ss]):
+            rebuild.append(k)
         tests.append(test_obj)
 
-    return tests
+    # Per-set subset queries scan every scenario; on a cold or mostly dirty
+    # index one bulk pass over all sets is cheaper
+    memberships = sum(len(ss) for ss in scenario_sets_list)
+    if len(rebuild) * len(subset_index.sets_by_scenario) > memberships:
+        subsets_by_ss = strict_subsets(scenario_sets_list)
+        subsets_of = lambda k: [scenario_sets_list[j] for j in subsets_by_ss[k]]
+    else:
+        subsets_of = lambda k: subset_index.subsets(scenario_sets_list[k])
+
+    for k in rebuild:
+        ss = scenario_sets_list[k]
+        tests[k] = make_test(
+            ss, subsets_of(k), rqts_by_ss, rqts_by_qty, qty_by_rqt,
+            test_uuid=str(uuid.UUID(hex=make_config_digest(ss)))
+        )
+
+    if rebuild or len(tests) != len(old_tests) or touched:
+        save_test_index(index_path, rows_by_rqt, tests)
+    # The index (and its in-memory cache) keeps the originals; a shallow copy
+    # per test lets callers add or replace fields (id, apply, retract, ...)
+    return [dict(test) for test in tests]
+
+
+def load_test_index(index_path):
+    """
+    Load a persisted test index, or an empty one if missing or outdated.
+    The parsed index is kept in memory and reused while the file is
+    unchanged, so it is shared and must not be mutated.
+    """
+    empty = {"version": TEST_INDEX_VERSION, "requirements": {}, "tests": {}}
+    cached = _test_index_cache.get(index_path)
+    if cached is not None and cached[0] is None:  # save still in progress
+        return cached[1]
+    if not os.path.exists(index_path):
+        return empty
+    mtime = os.stat(index_path).st_mtime_ns
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except json.JSONDecodeError:
+        return empty
+    if index.get("version") != TEST_INDEX_VERSION:
+        return empty
+    _test_index_cache[index_path] = (mtime, index)
+    return index
+
+
+def save_test_index(index_path, rows_by_rqt, tests):
+    """
+    Save the index in the background and atomically (see save_json); until
+    the file is written, load_test_index serves it from memory.
+    """
+    index = {
+        "version": TEST_INDEX_VERSION,
+        "requirements": rows_by_rqt,
+        "tests": {t["config_digest"]: t for t in tests},
+    }
+    _test_index_cache[index_path] = (None, index)
+
+    def saved(future):
+        if _test_index_cache.get(index_path, (None, None))[1] is not index:
+            return  # a newer save took over
+        if future.exception() is None:
+            _test_index_cache[index_path] = (os.stat(index_path).st_mtime_ns, index)
+        else:
+            del _test_index_cache[index_path]
+
+    save_json(index_path, index, indent=None).add_done_callback(saved)
+
+
+def iter_bits(mask):
+    """Yield the indices of the set bits of an int bitmask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class SubsetIndex:
+    """
+    Subset/superset queries over an ordered list of scenario sets.
+
+    Sets are indexed by position and encoded as Python int bitmasks: one
+    inverted-index bitmask per scenario marks the sets containing it, and one
+    bitmask per cardinality restricts candidates by size. The supersets of a
+    set are the large-enough sets found in the inverted lists of every one of
+    its scenarios; intersecting rarest-first empties the candidates early,
+    so the work tracks the output size instead of comparing every pair.
+    """
+
+    def __init__(self, scenario_sets_list):
+        self.scenario_sets_list = scenario_sets_list
+        self.sets_by_scenario = defaultdict(int)  # Map: scenario -> bitmask of set indices
+        sets_by_card = defaultdict(int)  # Map: cardinality -> bitmask of set indices
+        for k, ss in enumerate(scenario_sets_list):
+            bit = 1 << k
+            for sc in ss:
+                self.sets_by_scenario[sc] |= bit
+            sets_by_card[len(ss)] |= bit
+
+        # Map: cardinality -> bitmask of sets with at least that cardinality
+        self.at_least = {}
+        acc = 0
+        for card in sorted(sets_by_card, reverse=True):
+            acc |= sets_by_card[card]
+            self.at_least[card] = acc
+        self.cards = sorted(sets_by_card)
+
+    def _card_mask(self, card):
+        """Bitmask of the sets with cardinality >= ``card``"""
+        for c in self.cards:
+            if c >= card:
+                return self.at_least[c]
+        return 0
+
+    def supersets(self, ss, strict=True):
+        """Bitmask of the indexed sets that are (strict) supersets of ``ss``"""
+        candidates = self._card_mask(len(ss) + 1 if strict else len(ss))
+        # Every superset contains all scenarios of ss; intersect rarest first
+        for sc in sorted(ss, key=lambda x: self.sets_by_scenario.get(x, 0).bit_count()):
+            if not candidates:
+                break
+            candidates &= self.sets_by_scenario.get(sc, 0)
+        return candidates
+
+    def subsets(self, ss):
+        """Indexed sets that are strict subsets of ``ss``, in insertion order"""
+        candidates = 0
+        for sc in ss:
+            candidates |= self.sets_by_scenario.get(sc, 0)
+        return [
+            self.scenario_sets_list[k]
+            for k in iter_bits(candidates)
+            if self.scenario_sets_list[k] < ss
+        ]
+
+
+def strict_subsets(scenario_sets_list):
+    """
+    For every scenario set, return the indices of all other sets in the list
+    that are strict subsets of it (the superset -> subset edges of the old
+    networkx graph).
+    """
+    subset_index = SubsetIndex(scenario_sets_list)
+
+    # Invert superset lists into subset lists, keeping insertion order
+    subsets_by_ss = [[] for _ in scenario_sets_list]
+    for k, ss in enumerate(scenario_sets_list):
+        for superset in iter_bits(subset_index.supersets(ss)):
+            subsets_by_ss[superset].append(k)
+
+    return subsets_by_ss
@@ -0,0 +1,161 @@
+"""
+Held-Karp exact solver and lower bound for test ordering.
+
+held_karp() solves small plans exactly with the bitmask dynamic program,
+vectorized with NumPy over all subsets of one size at a time.
+held_karp_bound() computes the Held-Karp Lagrangian (1-tree) lower bound
+of larger plans by subgradient optimization, so heuristic tours can be
+reported together with their optimality gap.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.distance_oracle import distance_pairs, distance_rows
+from src.local_search import SearchBudget
+
+# Largest plan (including the empty configuration) solved exactly; the
+# DP table has 2^(n-1) * (n-1) entries (80 MB at n = 20)
+HELD_KARP_MAX_N = 20
+# Subgradient iterations of the 1-tree bound, and how many iterations
+# without improvement halve the step size
+BOUND_ITERATIONS = 100
+BOUND_PATIENCE = 10
+
+
+def held_karp(weights: np.ndarray) -> Tuple[List[int], float]:
+    """Optimal tour starting at city 0 and its cost"""
+    weights = np.asarray(weights)
+    n = len(weights)
+    if n > HELD_KARP_MAX_N:
+        raise ValueError(f"Held-Karp is limited to {HELD_KARP_MAX_N} configurations, got {n}")
+    if n <= 3:
+        tour = list(range(n))
+        return tour, tour_cost(weights, tour)
+
+    # dp[mask, j]: cheapest path from city 0 through the cities in mask
+    # (bit j = city j + 1), ending at city j + 1
+    m = n - 1
+    inner = weights[1:, 1:].astype(np.float64)
+    dp = np.full((1 << m, m), np.inf)
+    bits = 1 << np.arange(m)
+    dp[bits, np.arange(m)] = weights[0, 1:]
+
+    masks = np.arange(1 << m)
+    popcount = np.zeros(1 << m, dtype=np.int8)
+    for j in range(m):
+        popcount += (masks >> j) & 1
+
+    # Extend every path over s cities by one more city j
+    for s in range(1, m):
+        layer = np.flatnonzero(popcount == s)
+        paths = dp[layer]
+        for j in range(m):
+            free = (layer & bits[j]) == 0
+            dp[layer[free] | bits[j], j] = (paths[free] + inner[:, j]).min(axis=1)
+
+    # Close the tour and walk the table back from the full mask
+    full = (1 << m) - 1
+    last = int(np.argmin(dp[full] + weights[1:, 0]))
+    path = [last]
+    mask = full
+    while mask != bits[last]:
+        mask ^= int(bits[last])
+        last = int(np.argmin(dp[mask] + inner[:, last]))
+        path.append(last)
+
+    tour = [0] + [city + 1 for city in reversed(path)]
+    return tour, tour_cost(weights, tour)
+
+
+def tour_cost(weights: np.ndarray, tour: List[int]):
+    """Cost of the closed tour, as a Python number"""
+    tour = np.asarray(tour, dtype=np.intp)
+    edges = distance_pairs(weights, tour, np.roll(tour, -1))
+    return edges.sum(dtype=np.float64 if edges.dtype.kind == 'f' else np.int64).item()
+
+
+def one_tree(weights: np.ndarray, pi: np.ndarray) -> Tuple[float, np.ndarray]:
+    """
+    Minimum 1-tree under penalties ``pi``: a minimum spanning tree of
+    cities 1..n-1 (Prim, one matrix row per step) plus the two cheapest
+    edges of city 0. Returns its penalized cost and the city degrees.
+    """
+    n = len(weights)
+    degree = np.zeros(n, dtype=np.int64)
+
+    key = distance_rows(weights, 1).astype(np.float64) + pi[1] + pi
+    key[:2] = np.inf
+    parent = np.ones(n, dtype=np.intp)
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[:2] = True
+    total = 0.0
+    for _ in range(n - 2):
+        v = int(np.argmin(key))
+        total += key[v]
+        degree[v] += 1
+        degree[parent[v]] += 1
+        in_tree[v] = True
+        key[v] = np.inf
+        row = distance_rows(weights, v) + pi[v] + pi
+        closer = ~in_tree & (row < key)
+        key[closer] = row[closer]
+        parent[closer] = v
+
+    edges0 = distance_rows(weights, 0)[1:] + pi[0] + pi[1:]
+    nearest = np.argpartition(edges0, 1)[:2]
+    total += edges0[nearest].sum()
+    degree[0] = 2
+    degree[nearest + 1] += 1
+    return total, degree
+
+
+def held_karp_bound(weights: np.ndarray, upper_bound: float, gap: Optional[float] = None,
+                    iterations: int = BOUND_ITERATIONS,
+                    budget: Optional[SearchBudget] = None) -> float:
+    """
+    Held-Karp lower bound on the optimal tour cost.
+
+    Maximizes the penalized 1-tree cost over the city penalties by
+    subgradient steps sized from ``upper_bound`` (the cost of a known
+    tour). Stops early once the 1-tree is a tour (the bound is then
+    optimal), once (upper_bound - bound) / upper_bound <= ``gap``, or
+    once ``budget`` is exhausted; every iterate is a valid bound.
+    """
+    n = len(weights)
+    if n <= 3:
+        return tour_cost(weights, list(range(n)))
+
+    integral = isinstance(tour_cost(weights, [0, 1]), int)
+    pi = np.zeros(n)
+    best = -np.inf
+    step_scale = 2.0
+    stale = 0
+    for _ in range(iterations):
+        cost, degree = one_tree(weights, pi)
+        bound = cost - 2.0 * pi.sum()
+        if bound > best + 1e-9:
+            best, stale = bound, 0
+        else:
+            stale += 1
+            if stale >= BOUND_PATIENCE:
+                step_scale, stale = step_scale / 2, 0
+
+        subgradient = degree - 2
+        norm = (subgradient ** 2).sum()
+        if norm == 0:
+            break  # the 1-tree is a tour
+        if gap is not None and upper_bound > 0 and (upper_bound - best) / upper_bound <= gap:
+            break
+        if budget is not None and not budget.poll():
+            break
+        pi += step_scale * max(upper_bound - bound, 1e-9) / norm * subgradient
+
+    best = min(best, upper_bound)
+    return int(np.ceil(best - 1e-6)) if integral else best
+
+
+def optimality_gap(cost: float, lower_bound: float) -> float:
+    """Relative distance of a tour cost from a lower bound"""
+    return (cost - lower_bound) / cost if cost > 0 else 0.0
@@ -0,0 +1,386 @@
+"""
+Local search engine for test ordering.
+
+All moves work on the same array-backed tour (tour list + position index)
+and the same symmetric weight matrix, and every move is applied as a
+sequence of 2-opt flips, so they share one delta/apply primitive:
+
+    "2opt"    neighbor-list 2-opt
+    "or-opt"  move a segment of 1..3 tests between two neighbors, optionally
+              reversed (together with "2opt" this is the 3-opt "or2h"
+              neighborhood of segment insertions and segment reversals)
+    "lk"      bounded Lin-Kernighan style chain of 2-opt flips
+
+Cities are only re-examined after one of their tour edges changed
+(don't-look bits), and candidates come from k-nearest neighbor lists.
+The weights may be a NumPy matrix or a DistanceOracle.
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.distance_oracle import DistanceOracle, distance_rows
+from src.neighbor_index import NeighborIndex
+
+# Candidate list length per city
+NEIGHBOR_K = 8
+# Longest segment moved by an or-opt move
+OR_OPT_MAX_SEGMENT = 3
+# Candidates tried per level of an LK move, and its maximum depth
+LK_BREADTH = (5, 1)
+LK_MAX_DEPTH = 4
+# Rows of the weight matrix scanned per block for neighbor lists
+NEIGHBOR_CHUNK_ROWS = 1024
+
+# Minimum seconds between two progress callbacks of a SearchBudget
+PROGRESS_INTERVAL = 0.2
+
+# Move sets behind each local_search name accepted by OptimizeTestOrder.run
+LOCAL_SEARCH_MOVES = {
+    "2opt-fast": ("2opt",),
+    "or-opt": ("or-opt",),
+    "3opt": ("2opt", "or-opt"),
+    "lk": ("lk", "or-opt"),
+}
+
+
+def neighbor_lists(weights, k: int = NEIGHBOR_K) -> Tuple[List[List[int]], List[List]]:
+    """
+    k nearest cities of every city (ascending distance) and their distances.
+    A DistanceOracle is queried through a NeighborIndex instead of row scans.
+    """
+    n = len(weights)
+    k = min(k, n - 1)
+    if k <= 0:
+        return [[] for _ in range(n)], [[] for _ in range(n)]
+    if isinstance(weights, DistanceOracle):
+        return NeighborIndex.from_oracle(weights).knn_all(k)
+    neighbors, neighbor_dists = [], []
+    for start in range(0, n, NEIGHBOR_CHUNK_ROWS):
+        rows = np.arange(start, min(start + NEIGHBOR_CHUNK_ROWS, n))
+        dists = distance_rows(weights, rows)
+        block = dists.astype(np.float64)
+        block[np.arange(len(rows)), rows] = np.inf
+        nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(block, nearest, axis=1), axis=1, kind='stable')
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        neighbors.extend(nearest.tolist())
+        neighbor_dists.extend(np.take_along_axis(dists, nearest, axis=1).tolist())
+    return neighbors, neighbor_dists
+
+
+class SearchBudget:
+    """
+    Wall-clock and iteration budget of an anytime search, with progress
+    reporting and cancellation.
+
+    Searches call step() once per iteration (a city examined by the local
+    search engine, or one outer index of the Ruby-style 2-opt) and stop as
+    soon as it returns False; improve() records every applied move. Every
+    tour the searches keep is valid, so stopping early still yields the
+    best tour found so far.
+
+    ``progress(elapsed, best_cost, improvements)`` is called at most every
+    PROGRESS_INTERVAL seconds and once more when the search ends; it may
+    return False to cancel. cancel() may also be called from another thread,
+    or from another process when ``cancelled`` is a multiprocessing Event.
+    With a ``stop_cost`` (e.g. from a lower bound and an optimality gap), the
+    search stops once its tour costs no more than that.
+    """
+
+    def __init__(self, time_limit: Optional[float] = None, max_iterations: Optional[int] = None,
+                 progress: Optional[Callable[[float, float, int], Optional[bool]]] = None,
+                 cancelled=None, stop_cost=None):
+        self.time_limit = time_limit
+        self.stop_cost = stop_cost
+        self.max_iterations = max_iterations
+        self.progress = progress
+        self.started = time.perf_counter()
+        self.iterations = 0
+        self.improvements = 0
+        self.cost = None
+        self.stopped = None  # "time", "iterations", "cancelled" or "gap" once exhausted
+        self._cancelled = cancelled if cancelled is not None else threading.Event()
+        self._reported = self.started
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left of the time limit (None if unlimited)"""
+        if self.time_limit is None:
+            return None
+        return max(self.time_limit - self.elapsed(), 0.0)
+
+    def split(self) -> "SearchBudget":
+        """
+        Budget of one sub-search: the remaining time, a fresh iteration cap
+        and the same cancellation, without progress reporting or stop cost
+        (a sub-search's cost is not the tour's)
+        """
+        return SearchBudget(self.remaining(), self.max_iterations, cancelled=self._cancelled)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def begin(self, cost):
+        """Start tracking from a tour of the given cost"""
+        if self.cost is None or cost < self.cost:
+            self.cost = cost
+
+    def improve(self, delta):
+        """Record an applied move that changed the tour cost by ``delta``"""
+        self.cost += delta
+        self.improvements += 1
+
+    def step(self) -> bool:
+        """Count one iteration; False once the budget is exhausted"""
+        if self.stopped is None and self.max_iterations is not None and self.iterations >= self.max_iterations:
+            self.stopped = "iterations"
+        if self.stopped is not None:
+            return False
+        self.iterations += 1
+        return self.poll()
+
+    def poll(self) -> bool:
+        """Report progress if due; False once the budget is exhausted"""
+        if self.stopped is not None:
+            return False
+        now = time.perf_counter()
+        # nothing to report before the first tour (see begin())
+        if self.progress is not None and self.cost is not None and now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            if self.progress(now - self.started, self.cost, self.improvements) is False:
+                self.cancel()
+        if self._cancelled.is_set():
+            self.stopped = "cancelled"
+        elif self.time_limit is not None and now - self.started >= self.time_limit:
+            self.stopped = "time"
+        elif self.stop_cost is not None and self.cost is not None and self.cost <= self.stop_cost:
+            self.stopped = "gap"
+        return self.stopped is None
+
+    def finish(self):
+        """Report the final state"""
+        if self.progress is not None:
+            self.progress(self.elapsed(), self.cost, self.improvements)
+
+
+class LocalSearch:
+    """Don't-look-bit local search over a symmetric weight matrix"""
+
+    def __init__(self, weights: np.ndarray, tour: Sequence[int], k: int = NEIGHBOR_K,
+                 neighbors=None):
+        self.weights = weights
+        self.n = len(tour)
+        self.tour = list(tour)
+        self.pos = [0] * self.n
+        for idx, city in enumerate(self.tour):
+            self.pos[city] = idx
+        if neighbors is None:
+            neighbors = neighbor_lists(weights, k)
+        self.neighbors, self.neighbor_dists = neighbors
+        # Total cost change of all applied moves
+        self.delta = 0
+
+    # ----------- tour primitives -----------
+
+    def d(self, a: int, b: int):
+        return self.weights.item(a, b)
+
+    def succ(self, city: int) -> int:
+        return self.tour[(self.pos[city] + 1) % self.n]
+
+    def pred(self, city: int) -> int:
+        return self.tour[self.pos[city] - 1]
+
+    def _reverse(self, i: int, j: int):
+        """Reverse tour positions i..j (cyclic), or the complement if it is shorter"""
+        tour, pos, n = self.tour, self.pos, self.n
+        length = (j - i) % n + 1
+        if 2 * length > n:
+            i, j = (j + 1) % n, (i - 1) % n
+            length = n - length
+        if length < 2:
+            return
+        if i <= j:
+            segment = tour[j:i - 1 if i else None:-1]
+            tour[i:j + 1] = segment
+            for idx, city in enumerate(segment, i):
+                pos[city] = idx
+        else:
+            # segment wraps past the end of the array
+            segment = (tour[i:] + tour[:j + 1])[::-1]
+            tour[i:] = segment[:n - i]
+            tour[:j + 1] = segment[n - i:]
+            for idx, city in enumerate(segment, i):
+                pos[city] = idx % n
+
+    def flip(self, a: int, b: int, c: int, d: int):
+        """
+        Replace tour edges (a, b) and (c, d) by (a, c) and (b, d). Both edges
+        must point the same way: b = succ(a) and d = succ(c), or b = pred(a)
+        and d = pred(c).
+        """
+        if self.succ(a) == b:
+            self._reverse(self.pos[b], self.pos[c])
+        else:
+            self._reverse(self.pos[a], self.pos[d])
+
+    # ----------- moves -----------
+
+    def move_2opt(self, a: int) -> Tuple[int, ...]:
+        """Best-first 2-opt move from city a; returns the touched cities"""
+        for forward in (True, False):
+            b = self.succ(a) if forward else self.pred(a)
+            d_ab = self.d(a, b)
+            for c, d_ac in zip(self.neighbors[a], self.neighbor_dists[a]):
+                if d_ac >= d_ab:
+                    break  # no gain possible from farther candidates
+                d = self.succ(c) if forward else self.pred(c)
+                if c == b or d == a:
+                    continue
+                delta = d_ac + self.d(b, d) - d_ab - self.d(c, d)
+                if delta < 0:
+                    self.flip(a, b, c, d)
+                    self.delta += delta
+                    return a, b, c, d
+        return ()
+
+    def move_or_opt(self, a: int) -> Tuple[int, ...]:
+        """Move the segment starting at a (1..3 tests) next to a neighbor"""
+        n = self.n
+        s2 = a
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            if length > 1:
+                s2 = self.succ(s2)
+            if n < length + 4:
+                break
+            s1 = a
+            p, nx = self.pred(s1), self.succ(s2)
+            segment = {s1, s2} if length < 3 else {s1, self.succ(s1), s2}
+            removed = self.d(p, s1) + self.d(s2, nx) - self.d(p, nx)
+            if removed <= 0:
+                continue
+            for end in (s1, s2):
+                for c, d_end in zip(self.neighbors[end], self.neighbor_dists[end]):
+                    if d_end >= removed:
+                        break
+                    if c in segment:
+                        continue
+                    # insert between c and either of its tour neighbors
+                    for x, y in ((c, self.succ(c)), (self.pred(c), c)):
+                        if y in segment or y == p or x in segment:
+                            continue
+                        d_xy = self.d(x, y)
+                        keep = self.d(x, s1) + self.d(s2, y) - d_xy
+                        flipped = self.d(x, s2) + self.d(s1, y) - d_xy
+                        delta = min(keep, flipped) - removed
+                        if delta < 0:
+                            self._insert_segment(p, s1, s2, nx, x, y, reverse=flipped < keep)
+                            self.delta += delta
+                            return p, s1, s2, nx, x, y
+        return ()
+
+    def _insert_segment(self, p, s1, s2, nx, x, y, reverse):
+        """Move segment s1..s2 (between p and nx) between x and y = succ(x)"""
+        # p s1..s2 nx ... x y  ->  p x ... nx s2..s1 y
+        self.flip(p, s1, x, y)
+        if x != nx:
+            # -> p nx ... x s2..s1 y
+            self.flip(p, x, nx, s2)
+        if not reverse and s1 != s2:
+            # -> p nx ... x s1..s2 y
+            self.flip(x, s2, s1, y)
+
+    def move_lk(self, a: int) -> Tuple[int, ...]:
+        """Bounded LK move: a chain of 2-opt flips anchored at a"""
+        for t2 in (self.succ(a), self.pred(a)):
+            touched = []
+            delta = self._lk_step(a, t2, 0, 0, set(), touched)
+            if delta is not None:
+                self.delta += delta
+                return tuple(touched)
+        return ()
+
+    def _lk_step(self, t1, t2, cost_delta, depth, added, touched):
+        """
+        Break edge (t1, t2) and try to close the tour through a neighbor t3
+        of t2. Returns the total cost change once an improving chain is
+        found and kept, or None after undoing every flip of this level.
+        """
+        d12 = self.d(t1, t2)
+        open_gain = d12 - cost_delta
+        breadth = LK_BREADTH[depth] if depth < len(LK_BREADTH) else 1
+        tried = 0
+        for t3, d23 in zip(self.neighbors[t2], self.neighbor_dists[t2]):
+            if d23 >= open_gain:
+                break  # gain criterion
+            if t3 == t1 or t3 == self.succ(t2) or t3 == self.pred(t2):
+                continue
+            # undoing a flip may have mirrored the array, so re-read the orientation
+            forward = self.succ(t1) == t2
+            t4 = self.pred(t3) if forward else self.succ(t3)
+            if (t3, t4) in added:
+                continue
+            tried += 1
+            new_delta = cost_delta - d12 - self.d(t3, t4) + d23 + self.d(t1, t4)
+            if new_delta < 0:
+                # t1 t2 ... t4 t3  ->  t1 t4 ... t2 t3
+                self.flip(t1, t2, t4, t3)
+                touched.extend((t1, t2, t3, t4))
+                return new_delta
+            if depth + 1 < LK_MAX_DEPTH:
+                self.flip(t1, t2, t4, t3)
+                added.add((t2, t3))
+                added.add((t3, t2))
+                result = self._lk_step(t1, t4, new_delta, depth + 1, added, touched)
+                added.discard((t2, t3))
+                added.discard((t3, t2))
+                if result is not None:
+                    touched.extend((t1, t2, t3, t4))
+                    return result
+                self.flip(t1, t4, t2, t3)
+            if tried >= breadth:
+                break
+        return None
+
+    # ----------- driver -----------
+
+    def run(self, moves: Sequence[str] = ("2opt",), budget: Optional[SearchBudget] = None,
+            active: Optional[Sequence[int]] = None):
+        """
+        Apply improving moves until no city is active or ``budget`` is
+        exhausted; returns the tour. ``active`` limits the initially
+        examined cities (default: all), e.g. to the ends of edited edges.
+        """
+        if self.n < 5:
+            return self.tour
+        move_fns = [getattr(self, f"move_{name.replace('-', '_')}") for name in moves]
+        active = deque(self.tour if active is None else dict.fromkeys(active))
+        queued = [False] * self.n  # inverted don't-look bits
+        for city in active:
+            queued[city] = True
+
+        while active:
+            if budget is not None and not budget.step():
+                break
+            a = active.popleft()
+            queued[a] = False
+            for move in move_fns:
+                delta = self.delta
+                touched = move(a)
+                if touched:
+                    if budget is not None:
+                        budget.improve(self.delta - delta)
+                    for city in (a,) + tuple(touched):
+                        if not queued[city]:
+                            queued[city] = True
+                            active.append(city)
+                    break
+
+        return self.tour
@@ -0,0 +1,132 @@
+"""
+Multi-rig (min-max mTSP) scheduling of a test plan.
+
+With several identical rigs, every rig starts from the empty
+configuration (test 0) and runs its own share of the tests; the campaign
+takes as long as the most expensive rig. The schedule is built route
+first, cluster second:
+
+1. cut the optimized single tour into ``rigs`` consecutive segments so
+   that the largest rig cost is minimal (exact for the given tour, by
+   bisection on that cost),
+2. re-optimize every rig's tour on its own,
+3. concatenate the rig tours and cut again, for a few rounds, which
+   never makes the largest rig cost worse.
+
+A rig's cost is that of its closed tour 0 -> tests -> 0, like the
+single-tour reconfiguration cost.
+"""
+
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.distance_oracle import distance_pairs, distance_subset
+from src.held_karp import tour_cost
+from src.local_search import LocalSearch, SearchBudget, NEIGHBOR_K, neighbor_lists
+
+# Split / re-optimize rounds
+RIG_ROUNDS = 3
+# Bisection steps on the largest rig cost when costs are not integral
+SPLIT_BISECTIONS = 60
+
+
+def split_tour(weights, sequence: Sequence[int], rigs: int) -> List[List[int]]:
+    """
+    Cut ``sequence`` (the tests after test 0) into at most ``rigs``
+    consecutive segments minimizing the largest closed-tour cost of
+    [0] + segment. With no more tests than rigs, every test gets its own.
+    """
+    seq = np.asarray(sequence, dtype=np.intp)
+    m = len(seq)
+    if m == 0:
+        return []
+    if max(rigs, 1) >= m:
+        return [[int(t)] for t in seq]
+
+    # cost(i..j) = d0[i] + P[j] - P[i] + d0[j] for prefix path costs P;
+    # reach[j] = P[j] + d0[j] is nondecreasing under the triangle
+    # inequality, so the furthest feasible end is one searchsorted away
+    d0 = distance_pairs(weights, 0, seq).astype(np.float64)
+    prefix = np.concatenate(([0.0], np.cumsum(distance_pairs(weights, seq[:-1], seq[1:]))))
+    reach = np.maximum.accumulate(prefix + d0)
+    start_offset = d0 - prefix
+
+    def cuts(limit) -> Optional[List[int]]:
+        """Segment starts of the greedy split under ``limit`` (None if > rigs segments)"""
+        starts, i = [], 0
+        while i < m:
+            starts.append(i)
+            if len(starts) > rigs:
+                return None
+            j = int(np.searchsorted(reach, limit - start_offset[i], side='right'))
+            i = max(j, i + 1)
+        return starts
+
+    lo = float((2 * d0).max())
+    hi = float(prefix[-1] + 2 * d0.max())
+    if isinstance(tour_cost(weights, [0, int(seq[0])]), int):
+        lo, hi = int(np.floor(lo)), int(np.ceil(hi))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if cuts(mid) is None:
+                lo = mid + 1
+            else:
+                hi = mid
+    else:
+        for _ in range(SPLIT_BISECTIONS):
+            mid = (lo + hi) / 2
+            if cuts(mid) is None:
+                lo = mid
+            else:
+                hi = mid
+    starts = cuts(hi) + [m]
+    return [seq[a:b].tolist() for a, b in zip(starts, starts[1:])]
+
+
+def optimize_rig(weights, rig: List[int], moves, k: int = NEIGHBOR_K,
+                 budget: Optional[SearchBudget] = None) -> List[int]:
+    """Re-optimize one rig's tests (test 0 excluded); returns them in tour order"""
+    members = [0] + list(rig)
+    if len(members) < 5:
+        return list(rig)
+    sub = distance_subset(weights, members)
+    tour = LocalSearch(sub, range(len(members)), k, neighbor_lists(sub, k)).run(moves, budget)
+    start = tour.index(0)
+    tour = tour[start + 1:] + tour[:start]
+    return [members[t] for t in tour]
+
+
+def multi_rig(weights, tour: Sequence[int], rigs: int, moves=None, k: int = NEIGHBOR_K,
+              budget: Optional[SearchBudget] = None,
+              rounds: int = RIG_ROUNDS) -> Tuple[List[List[int]], List[Any]]:
+    """
+    Schedule the closed ``tour`` (starting at test 0) on ``rigs`` rigs.
+    ``moves`` are the local search moves used to re-optimize each rig
+    (None keeps the split order). Returns every rig's tour, each starting
+    at test 0, and its cost. There is always one per rig: with fewer tests
+    than rigs (or none), the idle rigs get the tour [0] at cost 0.
+    """
+    if budget is not None:
+        # time limit and cancellation only: the rigs have no single cost
+        # for progress reports to track
+        budget = budget.split()
+        budget.begin(0)
+    tour = list(tour)
+    sequence = tour[tour.index(0) + 1:] + tour[:tour.index(0)]
+    best_rigs, best_makespan = None, None
+    for _ in range(max(rounds, 1)):
+        split = split_tour(weights, sequence, rigs)
+        if moves is not None:
+            split = [optimize_rig(weights, rig, moves, k, budget) for rig in split]
+        costs = [tour_cost(weights, [0] + rig) for rig in split]
+        makespan = max(costs, default=0)
+        if best_makespan is not None and makespan >= best_makespan:
+            break
+        best_rigs, best_makespan = (split, costs), makespan
+        if moves is None or (budget is not None and budget.stopped is not None):
+            break
+        sequence = [t for rig in split for t in rig]
+    split, costs = best_rigs
+    idle = max(rigs, 1) - len(split)
+    return [[0] + rig for rig in split] + [[0] for _ in range(idle)], costs + [tour_cost(weights, [0])] * idle
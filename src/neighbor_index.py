@@ -0,0 +1,153 @@
+"""
+Exact k-nearest-neighbor queries between tests under the reconfiguration
+cost (cost-weighted Hamming distance between scenario sets).
+
+With A(t) the summed cost of test t's scenarios and S(a, b) the summed
+cost of the scenarios a and b share,
+
+    d(a, b) = A(a) + A(b) - 2 * S(a, b)
+
+Only tests sharing a scenario with a have S > 0, and they are exactly the
+tests in the inverted lists (scenario -> tests) of a's scenarios. Every
+other test is at A(a) + A(b), so the nearest of them are simply the ones
+with the smallest A. A query therefore scores the inverted-list
+candidates exactly and merges them with a prefix of the tests sorted by
+A, which replaces a metric tree or LSH prefilter by an exact answer whose
+cost tracks the size of the inverted lists instead of the plan.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.distance_oracle import DistanceOracle, intern_scenarios
+
+
+class NeighborIndex:
+    """Inverted scenario index answering nearest-test queries"""
+
+    def __init__(self, sets: Sequence[Sequence[int]], costs: Sequence):
+        self.n = len(sets)
+        self.integral = all(isinstance(c, int) for c in costs)
+        self.costs = np.asarray(costs, dtype=np.float64)
+
+        # Scenarios per test and tests per scenario, as CSR arrays
+        lengths = np.array([len(cols) for cols in sets], dtype=np.intp)
+        self.set_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self.set_cols = np.fromiter((c for cols in sets for c in cols), dtype=np.intp,
+                                    count=int(self.set_offsets[-1]))
+        owners = np.repeat(np.arange(self.n), lengths)
+        order = np.argsort(self.set_cols, kind='stable')
+        self.postings = owners[order]
+        self.posting_offsets = np.searchsorted(self.set_cols[order], np.arange(len(costs) + 1))
+
+        self.absolute = np.bincount(owners, weights=self.costs[self.set_cols], minlength=self.n)
+        self.by_absolute = np.argsort(self.absolute, kind='stable')
+
+    @classmethod
+    def from_tests(cls, tests: List[Dict], cost_map: Dict[str, int]) -> "NeighborIndex":
+        return cls(*intern_scenarios(tests, cost_map))
+
+    @classmethod
+    def from_oracle(cls, oracle: DistanceOracle) -> "NeighborIndex":
+        return cls(oracle.sets, oracle.costs)
+
+    def subset(self, members: Sequence[int]) -> "NeighborIndex":
+        """Index over the given tests only (renumbered 0..len(members)-1)"""
+        sets = [self.set_cols[self.set_offsets[a]:self.set_offsets[a + 1]] for a in members]
+        costs = self.costs.tolist()
+        if self.integral:
+            costs = [int(c) for c in costs]
+        return NeighborIndex(sets, costs)
+
+    def _as_cost(self, values: np.ndarray) -> np.ndarray:
+        return np.rint(values).astype(np.int64) if self.integral else values
+
+    def overlapping(self, a: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Tests sharing a scenario with a (a included) and their distances to a"""
+        cols = self.set_cols[self.set_offsets[a]:self.set_offsets[a + 1]]
+        if len(cols) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        starts, stops = self.posting_offsets[cols], self.posting_offsets[cols + 1]
+        tests = np.concatenate([self.postings[lo:hi] for lo, hi in zip(starts, stops)])
+        weights = np.repeat(self.costs[cols], stops - starts)
+        candidates, inverse = np.unique(tests, return_inverse=True)
+        shared = np.bincount(inverse, weights=weights, minlength=len(candidates))
+        return candidates, self.absolute[a] + self.absolute[candidates] - 2.0 * shared
+
+    def knn(self, a: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The k tests nearest to a (ascending distance) and their distances"""
+        candidates, dists = self.overlapping(a)
+        keep = candidates != a
+        candidates, dists = candidates[keep], dists[keep]
+
+        # Disjoint tests: the first k by absolute cost outside the candidates
+        prefix = self.by_absolute[:k + len(candidates) + 1]
+        prefix = prefix[(prefix != a) & ~np.isin(prefix, candidates, assume_unique=True)][:k]
+        candidates = np.concatenate((candidates, prefix))
+        dists = np.concatenate((dists, self.absolute[a] + self.absolute[prefix]))
+
+        nearest = np.argsort(dists, kind='stable')[:k]
+        return candidates[nearest], self._as_cost(dists[nearest])
+
+    def knn_all(self, k: int, budget=None) -> Optional[Tuple[List[List[int]], List[List]]]:
+        """
+        k-nearest-neighbor lists of every test, like local_search.neighbor_lists;
+        None if ``budget`` (a SearchBudget) runs out first
+        """
+        k = min(k, self.n - 1)
+        neighbors, neighbor_dists = [], []
+        for a in range(self.n):
+            if budget is not None and not budget.poll():
+                return None
+            near, dists = self.knn(a, k) if k > 0 else ([], [])
+            neighbors.append(list(map(int, near)))
+            neighbor_dists.append(np.asarray(dists).tolist())
+        return neighbors, neighbor_dists
+
+
+class NearestUnvisited:
+    """
+    Nearest-neighbor queries restricted to a shrinking set of allowed
+    tests, as needed by tour construction. The scan over the disjoint
+    tests resumes where the previous query stopped, since tests are only
+    ever removed.
+    """
+
+    def __init__(self, index: NeighborIndex, allowed: Optional[np.ndarray] = None):
+        self.index = index
+        self.allowed = np.ones(index.n, dtype=bool) if allowed is None else allowed.copy()
+        self.remaining = int(self.allowed.sum())
+        self._cursor = 0
+
+    def remove(self, t: int):
+        if self.allowed[t]:
+            self.allowed[t] = False
+            self.remaining -= 1
+
+    def nearest(self, a: int) -> Optional[Tuple[int, float]]:
+        """Nearest allowed test to a other than a itself, and its distance"""
+        if self.remaining == 0 or (self.remaining == 1 and self.allowed[a]):
+            return None
+        index = self.index
+        candidates, dists = index.overlapping(a)
+        keep = self.allowed[candidates] & (candidates != a)
+        candidates, dists = candidates[keep], dists[keep]
+        best = (int(candidates[np.argmin(dists)]), float(dists.min())) if len(candidates) else None
+
+        # First allowed disjoint test by absolute cost; removed tests at
+        # the front of the order are skipped for good
+        order = index.by_absolute
+        while self._cursor < index.n and not self.allowed[order[self._cursor]]:
+            self._cursor += 1
+        overlapping = set(candidates.tolist())
+        for pos in range(self._cursor, index.n):
+            t = int(order[pos])
+            if self.allowed[t] and t != a and t not in overlapping:
+                dist = float(index.absolute[a] + index.absolute[t])
+                if best is None or dist < best[1]:
+                    best = (t, dist)
+                break
+            if best is not None and index.absolute[a] + index.absolute[t] >= best[1]:
+                break
+        return best
@@ -7,9 +7,28 @@ Improved version with closer match to Ruby's 2-opt implementation.
 import json
 import sys
 import argparse
+import os
+import time
 import random
+import hashlib
 import logging
-from typing import List, Dict, Any, Tuple
+from collections import defaultdict, deque
+from concurrent.futures import wait, FIRST_COMPLETED
+import multiprocessing
+from typing import List, Dict, Any, Tuple, Optional
+
+import numpy as np
+
+from src.local_search import LocalSearch, SearchBudget, LOCAL_SEARCH_MOVES, NEIGHBOR_K, PROGRESS_INTERVAL
+from src.held_karp import held_karp, held_karp_bound, optimality_gap, BOUND_ITERATIONS
+from src.distance_oracle import DistanceOracle, distance_pairs
+from src.neighbor_index import NeighborIndex
+from src.construction import construct_tour
+from src.weights_pool import weights_pool, pool_weights, pool_cancel
+from src.decompose import decompose_and_stitch, CLUSTER_SIZE
+from src.multi_rig import multi_rig
+from src.artifacts import save_json
+from src.test_plan import TestPlan, cost_vector
 
 # ----------- Hard-coded input/output file paths -----------
 # COST_MAP_FILE = "costs.json"
@@ -17,31 +36,34 @@ from typing import List, Dict, Any, Tuple
 # OUTPUT_FILE = "test_order_optimized.json"
 # ---------------------------------------------------------
 
+# Rows of the weight matrix computed per block in make_weights
+WEIGHTS_CHUNK_ROWS = 1024
+# Plans with more tests use a DistanceOracle instead of the weight matrix
+MATRIX_FREE_MIN_TESTS = 20000
+# Plans with more tests are clustered, solved per cluster and stitched
+DECOMPOSE_MIN_TESTS = 100000
+
 
 class TSP2Opt:
     """2-opt TSP solver - closer match to Ruby implementation"""
     
-    def __init__(self, weights: List[List[float]]):
-        self.dimension = len(weights)
-        self.weights = weights
+    def __init__(self, weights):
+        # a weight matrix, or a DistanceOracle for matrix-free plans
+        self.weights = weights if isinstance(weights, DistanceOracle) else np.asarray(weights)
+        self.dimension = len(self.weights)
         self.tour = list(range(self.dimension))
         # Calculate initial cost exactly like Ruby
         self.cost = self._calculate_initial_cost()
     
     def _calculate_initial_cost(self) -> float:
         """Calculate initial tour cost matching Ruby's approach"""
-        total_cost = 0
-        for i in range(self.dimension):
-            j = (i + 1) % self.dimension
-            total_cost += self.distance(self.tour[i], self.tour[j])
-        return total_cost
+        tour = np.asarray(self.tour, dtype=np.intp)
+        edges = distance_pairs(self.weights, tour, np.roll(tour, -1))
+        return edges.sum(dtype=np.float64 if edges.dtype.kind == 'f' else np.int64).item()
     
     def distance(self, i: int, j: int) -> float:
-        """Get distance between cities i and j - matching Ruby's method"""
-        if j < i:
-            return self.weights[i][j]
-        else:
-            return self.weights[j][i]
+        """Get distance between cities i and j (the weight matrix is symmetric)"""
+        return self.weights.item(i, j)
     
     def swap_edges(self, i: int, j: int):
         """Swap edges - matching Ruby's implementation exactly"""
@@ -51,32 +73,313 @@ class TSP2Opt:
             i += 1
             j -= 1
     
-    def optimize(self):
-        """Run 2-opt optimization - matching Ruby's algorithm exactly"""
+    def optimize(self, budget: Optional[SearchBudget] = None):
+        """
+        Run 2-opt optimization - matching Ruby's algorithm exactly.
+
+        For a fixed i, the deltas of all remaining j are evaluated as one
+        vector and the first improving j is applied. A swap only reverses
+        positions i+1..j, so the scan resumes at j+1 with the same deltas
+        Ruby's sequential loop would see. With a ``budget``, every i is one
+        iteration and the search stops with the current tour once the
+        budget is exhausted.
+        """
+        n = self.dimension
+        w = self.weights
+        tour = np.asarray(self.tour, dtype=np.intp)
+        succ = np.roll(np.arange(n), -1)  # (j + 1) % dimension
+        if budget is not None:
+            budget.begin(self.cost)
         found_improvement = True
         
         while found_improvement:
             found_improvement = False
             
             # Match Ruby's loop structure exactly: for i in 0..(@dimension - 2)
-            for i in range(self.dimension - 1):  # 0 to dimension-2
+            for i in range(n - 1):  # 0 to dimension-2
+                if budget is not None and not budget.step():
+                    found_improvement = False
+                    break
                 # Match Ruby's: for j in (i + 2)..(@dimension - 1)
-                for j in range(i + 2, self.dimension):  # i+2 to dimension-1
-                    # Calculate cost delta exactly as Ruby does
-                    cost_delta = (
-                        0
-                        - self.distance(self.tour[i], self.tour[i + 1])
-                        - self.distance(self.tour[j], self.tour[(j + 1) % self.dimension])
-                        + self.distance(self.tour[i], self.tour[j])
-                        + self.distance(self.tour[i + 1], self.tour[(j + 1) % self.dimension])
-                    )
-                    
-                    if cost_delta < 0:
-                        # Perform swap exactly like Ruby
-                        self.swap_edges(i, j)
-                        self.cost += cost_delta
-                        found_improvement = True
-                        # Important: Ruby doesn't break here, it continues checking
+                j = i + 2
+                while j < n:
+                    a, b = tour[i], tour[i + 1]
+                    c = tour[j:]
+                    d = tour[succ[j:]]
+                    # Calculate cost deltas exactly as Ruby does
+                    cost_delta = ((distance_pairs(w, a, c) + distance_pairs(w, b, d))
+                                  - (w.item(a, b) + distance_pairs(w, c, d)))
+
+                    hits = np.flatnonzero(cost_delta < 0)
+                    if hits.size == 0:
+                        break
+                    # Perform swap exactly like Ruby
+                    k = j + hits[0]
+                    tour[i + 1:k + 1] = tour[i + 1:k + 1][::-1].copy()
+                    self.cost += cost_delta[hits[0]].item()
+                    if budget is not None:
+                        budget.improve(cost_delta[hits[0]].item())
+                    found_improvement = True
+                    # Important: Ruby doesn't break here, it continues checking
+                    j = k + 1
+
+        self.tour = tour.tolist()
+
+    def optimize_fast(self, k: int = NEIGHBOR_K):
+        """
+        Neighbor-list 2-opt with don't-look bits (see src/local_search.py).
+        Converges much faster than optimize() but, unlike it, does not
+        reproduce the Ruby tour.
+        """
+        self.local_search(LOCAL_SEARCH_MOVES['2opt-fast'], k)
+
+    def local_search(self, moves, k: int = NEIGHBOR_K, budget: Optional[SearchBudget] = None,
+                     active: Optional[List[int]] = None, neighbors=None):
+        """
+        Improve the tour with the given local search moves, within ``budget``
+        if given, starting from the ``active`` cities only if given.
+        ``neighbors`` are precomputed k-NN lists (see NeighborIndex.knn_all).
+        """
+        if budget is not None:
+            budget.begin(self.cost)
+            if not budget.poll():
+                return  # spent before the neighbor lists are even built
+        engine = LocalSearch(self.weights, self.tour, k, neighbors)
+        self.tour = engine.run(moves, budget, active)
+        self.cost += engine.delta
+
+    def warm_start(self, tour: List[int]):
+        """Continue from a known tour instead of the identity tour"""
+        self.tour = list(tour)
+        self.cost = self._calculate_initial_cost()
+
+
+# ----------- Warm start -----------
+
+def test_key(test: Dict) -> Any:
+    """Identity of a test across plans: its config digest, else uuid, else its scenarios"""
+    return test.get('config_digest') or test.get('uuid') or tuple(sorted(test['scenarios']))
+
+
+def warm_start_tour(tests: List[Dict], previous_tests: List[Dict],
+                    weights: np.ndarray) -> Tuple[List[int], List[int]]:
+    """
+    Map a previously optimized order onto ``tests`` (tests[0] being the
+    empty configuration): tests still present keep their relative order,
+    dropped ones are skipped and new ones are placed by cheapest insertion.
+    Returns the tour and the cities next to a changed edge, which are the
+    only places where local search has to look again.
+    """
+    indices_by_key = defaultdict(deque)  # duplicate tests are matched in order
+    for i, test in enumerate(tests[1:], 1):
+        indices_by_key[test_key(test)].append(i)
+
+    tour = [0]
+    changed = set()
+    placed = {0}
+    skipped = False
+    for test in previous_tests:
+        indices = indices_by_key.get(test_key(test))
+        if not indices:
+            skipped = True
+            continue
+        i = indices.popleft()
+        if skipped:
+            # tests were dropped between the previous kept test and this one
+            changed.update((tour[-1], i))
+            skipped = False
+        tour.append(i)
+        placed.add(i)
+    if skipped:
+        changed.update((tour[-1], 0))
+
+    for i in range(1, len(tests)):
+        if i in placed:
+            continue
+        order = np.asarray(tour, dtype=np.intp)
+        succ = np.roll(order, -1)
+        added = (distance_pairs(weights, order, i).astype(np.float64)
+                 + distance_pairs(weights, i, succ) - distance_pairs(weights, order, succ))
+        at = int(np.argmin(added))
+        changed.update((tour[at], i, tour[(at + 1) % len(tour)]))
+        tour.insert(at + 1, i)
+
+    return tour, sorted(changed)
+
+
+def warm_start_key(scenarios_cost: Dict[str, Any], local_search: Optional[str]) -> Dict[str, Any]:
+    """
+    What a result's order depends on besides its tests: a digest of the
+    scenario costs and the local search. A previous result only
+    warm-starts a run with the same key.
+    """
+    digest = hashlib.md5(json.dumps(scenarios_cost, sort_keys=True).encode("utf-8")).hexdigest()
+    return {'costs': digest, 'local_search': local_search}
+
+
+def load_previous_order(previous, key: Optional[Dict[str, Any]] = None) -> Tuple[Optional[List[Dict]], bool]:
+    """
+    Tests of a previous optimize_test_order result (dict, list or JSON path),
+    if any, and whether its search ran to the end (False if it was stopped
+    early). With ``key`` (see warm_start_key), a result saved under another
+    key, or under none, is ignored; a bare list of tests is taken as is.
+    """
+    if previous is None:
+        return None, True
+    if isinstance(previous, str):
+        if not os.path.exists(previous):
+            return None, True
+        with open(previous, 'r') as f:
+            previous = json.load(f)
+    finished = True
+    if isinstance(previous, dict):
+        if key is not None and previous.get('warm_start') != key:
+            return None, True
+        finished = (previous.get('search') or {}).get('stopped') is None
+        previous = previous.get('tests')
+    return previous or None, finished
+
+
+# ----------- Multi-start optimization -----------
+
+def _solve_start(weights, seed: Optional[int], local_search: str,
+                 k: int, budget: Optional[SearchBudget] = None,
+                 tour: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    One start: shuffle the tour with ``seed`` (None keeps the input order,
+    or starts from ``tour`` if given) and improve it
+    """
+    started = time.perf_counter()
+    tsp = TSP2Opt(weights)
+    if tour is not None:
+        tsp.warm_start(tour)
+    elif seed is not None:
+        random.Random(seed).shuffle(tsp.tour)
+        tsp.cost = tsp._calculate_initial_cost()
+    initial_cost = tsp.cost
+    if local_search == '2opt':
+        tsp.optimize(budget)
+    elif local_search in LOCAL_SEARCH_MOVES:
+        tsp.local_search(LOCAL_SEARCH_MOVES[local_search], k, budget)
+    else:
+        raise ValueError(f"Unknown local search: {local_search}")
+    return {
+        'seed': seed,
+        'initial_cost': initial_cost,
+        'cost': tsp.cost,
+        'seconds': time.perf_counter() - started,
+        'improvements': budget.improvements if budget is not None else None,
+        'stopped': budget.stopped if budget is not None else None,
+        'tour': tsp.tour,
+    }
+
+
+def _solve_start_shared(seed: Optional[int], local_search: str, k: int,
+                        deadline: Optional[float], max_iterations: Optional[int],
+                        tour: Optional[List[int]] = None) -> Dict[str, Any]:
+    time_limit = None if deadline is None else deadline - time.time()
+    budget = SearchBudget(time_limit, max_iterations, cancelled=pool_cancel())
+    return _solve_start(pool_weights(), seed, local_search, k, budget, tour)
+
+
+def multi_start(weights, runs: int, local_search: str = '2opt',
+                k: int = NEIGHBOR_K, workers: Optional[int] = None,
+                seed: Optional[int] = None, stop_cost: Optional[float] = None,
+                budget: Optional[SearchBudget] = None,
+                initial_tour: Optional[List[int]] = None) -> Tuple[List[int], float, List[Dict[str, Any]]]:
+    """
+    Run ``runs`` independent starts and keep the cheapest tour.
+
+    The first start keeps the input order, or starts from ``initial_tour``
+    (the single-run result); the others start from tours shuffled with
+    seeds ``seed + 1 ..``. Starts run in a weights_pool, whose workers map
+    the weight matrix from shared memory instead of receiving a pickled
+    copy. Once a start reaches ``stop_cost`` the starts that have not begun
+    yet are cancelled.
+
+    With a ``budget``, its time limit applies to all starts together and
+    its iteration cap to each start; progress is reported as starts finish,
+    and cancelling the budget stops the running starts with their current
+    tours. Returns the best tour, its cost and per-run statistics (seed,
+    initial and final cost, seconds, improvements) of the starts that ran.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    seeds = [None] + [seed + r for r in range(1, runs)]
+    workers = min(workers or os.cpu_count() or 1, runs)
+    done = lambda result: stop_cost is not None and result['cost'] <= stop_cost
+    time_limit = budget.remaining() if budget is not None else None
+    max_iterations = budget.max_iterations if budget is not None else None
+    tours = [initial_tour] + [None] * (runs - 1)
+    if budget is not None:
+        first = TSP2Opt(weights)
+        if initial_tour is not None:
+            first.warm_start(initial_tour)
+        budget.begin(first.cost)
+
+    def record(result) -> bool:
+        """Account for a finished start; False once no more starts should run"""
+        if budget is None:
+            return not done(result)
+        budget.begin(result['cost'])
+        budget.improvements += result['improvements']
+        return budget.poll() and not done(result)
+
+    results = []
+    if workers <= 1:
+        for s, tour in zip(seeds, tours):
+            start_budget = budget.split() if budget is not None else None
+            results.append(_solve_start(weights, s, local_search, k, start_budget, tour))
+            if not record(results[-1]):
+                break
+    else:
+        cancel = multiprocessing.Event()
+        deadline = None if time_limit is None else time.time() + time_limit
+        with weights_pool(weights, workers, cancel) as pool:
+            futures = {pool.submit(_solve_start_shared, s, local_search, k, deadline, max_iterations, tours[r]): r
+                       for r, s in enumerate(seeds)}
+            by_run = {}
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                going = budget is None or budget.poll()
+                for future in finished:
+                    if not future.cancelled():
+                        by_run[futures[future]] = future.result()
+                        going = record(by_run[futures[future]]) and going
+                if not going:
+                    for future in pending:
+                        future.cancel()
+                    if budget is not None and budget.stopped == "cancelled":
+                        cancel.set()
+            results = [by_run[r] for r in sorted(by_run)]
+
+    best = min(results, key=lambda result: result['cost'])
+    stats = [{key: value for key, value in result.items() if key != 'tour'} for result in results]
+    return best['tour'], best['cost'], stats
+
+
+# ----------- Output -----------
+
+def apply_retract_tests(tests_tour: List[Dict]) -> List[Dict]:
+    """
+    Tests of an ordered tour (starting with the empty configuration), each
+    with the scenarios to retract and apply coming from the previous one
+    """
+    opt_tests = []
+    for test_count, (current, nxt) in enumerate(zip(tests_tour, tests_tour[1:]), 1):
+        current_scenarios = set(current['scenarios'])
+        next_scenarios = set(nxt['scenarios'])
+        
+        opt_test = nxt.copy()
+        opt_test.update({
+            'id': test_count,
+            'scenarios': sorted(list(next_scenarios)),
+            'retract': sorted(list(current_scenarios - next_scenarios)),
+            'apply': sorted(list(next_scenarios - current_scenarios))
+        })
+        opt_tests.append(opt_test)
+    return opt_tests
 
 
 class OptimizeTestOrder:
@@ -92,40 +395,96 @@ class OptimizeTestOrder:
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
     
-    def make_weights(self, tests: List[Dict], cost_map: Dict[str, int]) -> List[List[float]]:
-        """Create weight matrix for TSP"""
+    def make_weights(self, tests: List[Dict], cost_map: Dict[str, int],
+                     chunk_rows: int = WEIGHTS_CHUNK_ROWS) -> np.ndarray:
+        """
+        Create the symmetric weight matrix for TSP.
+
+        weights[i, j] is the summed cost of the scenarios in exactly one of
+        tests i and j. With X the test x scenario incidence matrix and c the
+        scenario costs, that is a[i] + a[j] - 2 * (X diag(c) X^T)[i, j] where
+        a = X c, computed in row blocks of ``chunk_rows`` to bound memory.
+        Integer costs give an int32 matrix (int64 if it could overflow),
+        other costs float32. ``tests`` may also be a TestPlan.
+        """
         n = len(tests)
-        weights = []
-        
-        for i in range(n):
-            row = []
-            si = set(tests[i]['scenarios'])
-            for j in range(i + 1):
-                sj = set(tests[j]['scenarios'])
-                apply = sj - si
-                retract = si - sj
-                cost = sum(cost_map.get(str(e), 0) for e in (apply | retract))
-                row.append(cost)
-            weights.append(row)
+
+        if isinstance(tests, TestPlan):
+            # Incidence columns: the plan's scenarios with a non-zero cost
+            scenario_costs = cost_vector(tests.scenarios, cost_map)
+            used = scenario_costs[tests.cols] != 0
+            rows = tests.rows()[used]
+            columns, cols = np.unique(tests.cols[used], return_inverse=True)
+            costs = scenario_costs[columns].astype(np.float64)
+            integral = scenario_costs.dtype.kind == 'i'
+        else:
+            # Intern scenarios with a non-zero cost to incidence columns
+            columns = {}
+            rows, cols = [], []
+            for i, test in enumerate(tests):
+                for e in test['scenarios']:
+                    key = str(e)
+                    if not cost_map.get(key, 0):
+                        continue
+                    if key not in columns:
+                        columns[key] = len(columns)
+                    rows.append(i)
+                    cols.append(columns[key])
+            costs = np.array([cost_map[key] for key in columns], dtype=np.float64)
+            integral = all(isinstance(cost_map[key], int) for key in columns)
+
+        incidence = np.zeros((n, len(columns)), dtype=np.float64)
+        incidence[rows, cols] = 1.0
+
+        if not integral:
+            dtype = np.float32
+        elif 4 * costs.sum() < np.iinfo(np.int32).max:
+            dtype = np.int32
+        else:
+            dtype = np.int64
+
+        weighted = incidence * costs
+        absolute = weighted.sum(axis=1)
+        weights = np.empty((n, n), dtype=dtype)
+        for start in range(0, n, chunk_rows):
+            stop = min(start + chunk_rows, n)
+            block = absolute[start:stop, None] + absolute[None, :] - 2.0 * (weighted[start:stop] @ incidence.T)
+            weights[start:stop] = np.rint(block) if integral else block
         
         return weights
     
     def run(self, args: argparse.Namespace, input_data: str) -> Dict:
-        """Main optimization routine"""
+        """Main optimization routine (cost map file and tests JSON text)"""
         
         # Load cost map
         self.logger.info("loading cost map")
         with open(args.cost_map, 'r') as f:
             cost_map_data = json.load(f)
         
+        # Parse input tests
+        tests_data = json.loads(input_data)
+        
+        return self.solve(args, tests_data, cost_map_data)
+    
+    def solve(self, args: argparse.Namespace, tests_data: List[Dict], cost_map_data: Dict) -> Dict:
+        """Optimization routine on already parsed tests and cost map"""
+        
+        # Anytime search: stop at the time/iteration budget, on cancel or
+        # within the optimality gap. The clock starts here, so the time limit
+        # also covers the weights, the bound and the construction, which all
+        # check the budget too
+        budget = getattr(args, 'budget', None)
+        if budget is None and any(getattr(args, name, None) is not None
+                                  for name in ('time_limit', 'max_iterations', 'progress', 'gap')):
+            budget = SearchBudget(getattr(args, 'time_limit', None),
+                                  getattr(args, 'max_iterations', None),
+                                  getattr(args, 'progress', None))
+        
         scenarios_cost = cost_map_data['scenarios']
         observations_cost = cost_map_data['observations']
         
         self.logger.info(f"loaded {len(scenarios_cost) + len(observations_cost)} cost map entries")
         
-        # Parse input tests
-        tests_data = json.loads(input_data)
-        
         # Prepare tests list with initial empty configuration
         if args.resort:
             tests = sorted(tests_data, key=lambda x: random.random())
@@ -135,14 +494,22 @@ class OptimizeTestOrder:
         # Add initial empty test configuration at the beginning
         tests.insert(0, {'id': 0, 'scenarios': [], 'quantities': {}})
         
-        # Create weight matrix
-        weights = self.make_weights(tests, scenarios_cost)
+        # Create weight matrix, or a matrix-free oracle for large plans
+        matrix_free = getattr(args, 'matrix_free', None)
+        if matrix_free is None:
+            matrix_free = len(tests) > MATRIX_FREE_MIN_TESTS
+        if matrix_free:
+            self.logger.info(f"using matrix-free distances for {len(tests)} tests")
+            weights = DistanceOracle(tests, scenarios_cost)
+        else:
+            weights = self.make_weights(tests, scenarios_cost)
         
         # Calculate observation cost
-        observation_cost = sum(
+        test_observation_costs = [
             sum(observations_cost.get(q, 0) for q in t.get('quantities', {}).keys())
             for t in tests
-        )
+        ]
+        observation_cost = sum(test_observation_costs)
         
         # Optimize tour
         if args.concorde:
@@ -151,86 +518,311 @@ class OptimizeTestOrder:
         
         tsp = TSP2Opt(weights)
         self.logger.info(f"initial tour cost: {tsp.cost}")
+        # True while the budget (if any) has time left for the setup stages
+        in_budget = lambda: budget is None or budget.poll()
         
+        runs = getattr(args, 'runs', 1)
+        run_stats = None
+        decompose_stats = None
+        gap = getattr(args, 'gap', None)
+        local_search = getattr(args, 'local_search', '2opt') if args.optimize else None
+
+        # A previous order only warm-starts a run under the same costs and
+        # local search; otherwise its tour, and the few cities local search
+        # would revisit, are stale
+        warm_key = warm_start_key(scenarios_cost, local_search)
+        previous = getattr(args, 'previous', None)
+        previous_tests, previous_finished = load_previous_order(previous, warm_key)
+        if previous is not None and previous_tests is None:
+            self.logger.info("no previous order for these costs and local search, starting cold")
+
+        # Lower bound from a quick tour, before solving so that the search
+        # can stop as soon as a tour is within the gap threshold. Bounding
+        # costs an extra tour and BOUND_ITERATIONS O(n^2) 1-trees, so it is
+        # opt-in unless a gap threshold needs it; matrix-free plans, whose
+        # 1-trees would recompute every row on each iteration, only bound
+        # when asked to explicitly
+        lower_bound = None
+        want_bound = getattr(args, 'lower_bound', None)
+        if want_bound is None:
+            want_bound = gap is not None and previous_tests is None and not matrix_free
+        if want_bound and local_search != 'held-karp' and in_budget():
+            quick = TSP2Opt(weights)
+            quick.local_search(LOCAL_SEARCH_MOVES['2opt-fast'],
+                               budget=budget.split() if budget is not None else None)
+            lower_bound = held_karp_bound(
+                weights, quick.cost, gap, getattr(args, 'bound_iterations', BOUND_ITERATIONS), budget
+            )
+            self.logger.info(f"lower bound: {lower_bound}")
+
+        # Any search (single run, multi-start, warm start, refinement) stops
+        # once its tour is within the gap of the bound
+        stop_cost = None
+        if gap is not None and lower_bound is not None:
+            stop_cost = budget.stop_cost = lower_bound / (1 - gap) if gap < 1 else float('inf')
+        elif gap is not None and local_search != 'held-karp':
+            if want_bound:
+                reason = "no time left for the bound"
+            elif getattr(args, 'lower_bound', None) is False:
+                reason = "lower_bound=False"
+            else:
+                reason = ("not bounded by default on warm starts" if previous_tests is not None
+                          else "not bounded by default for matrix-free weights")
+            self.logger.warning(f"no lower bound ({reason}): gap {gap} ignored")
+
+        # Initial tour: the input order for the Ruby 2-opt, otherwise a
+        # construction heuristic over the k-nearest-neighbor index, whose
+        # neighbor lists the local search then reuses
+        k = getattr(args, 'neighbors', NEIGHBOR_K)
+        construction = getattr(args, 'construction', None)
+        if construction is None:
+            construction = 'identity' if local_search == '2opt' else 'greedy'
+        decompose = getattr(args, 'decompose', None)
+        if decompose is None:
+            decompose = len(tests) > DECOMPOSE_MIN_TESTS
+        decompose = decompose and previous_tests is None and local_search != 'held-karp'
+        if construction != 'identity' and not decompose and not in_budget():
+            construction = 'identity'  # no time left to build a better start
+        index = None
+        if args.optimize and (decompose or construction != 'identity'):
+            if matrix_free:
+                index = NeighborIndex.from_oracle(weights)
+            else:
+                index = NeighborIndex.from_tests(tests, scenarios_cost)
+        neighbors = None
+        if (args.optimize and construction != 'identity' and previous_tests is None
+                and local_search != 'held-karp' and not decompose):
+            neighbors = index.knn_all(k, budget)
+            if neighbors is not None:
+                tsp.warm_start(construct_tour(construction, index, neighbors, budget))
+                self.logger.info(f"{construction} construction tour cost: {tsp.cost}")
+
         if args.optimize:
-            tsp.optimize()
+            if local_search == 'held-karp':
+                tsp.tour, tsp.cost = held_karp(weights.matrix() if matrix_free else weights)
+                lower_bound = tsp.cost
+            elif previous_tests is not None and runs == 1:
+                # Warm start: reuse the previous order and only search around
+                # edits. The Ruby 2-opt has no notion of edits and rescans the
+                # whole tour, but stays the Ruby search
+                tour, changed = warm_start_tour(tests, previous_tests, weights)
+                tsp.warm_start(tour)
+                self.logger.info(f"warm start tour cost: {tsp.cost} ({len(changed)} changed tests)")
+                if local_search == '2opt':
+                    tsp.optimize(budget)
+                elif local_search in LOCAL_SEARCH_MOVES:
+                    # a search stopped early may not be a local optimum anywhere
+                    tsp.local_search(LOCAL_SEARCH_MOVES[local_search], k, budget,
+                                     active=changed if previous_finished else None)
+                else:
+                    raise ValueError(f"Unknown local search: {local_search}")
+            elif decompose:
+                tsp.tour, tsp.cost, decompose_stats = decompose_and_stitch(
+                    weights, index, local_search, k, workers=getattr(args, 'workers', None),
+                    cluster_size=getattr(args, 'cluster_size', CLUSTER_SIZE),
+                    seed=getattr(args, 'seed', None) or 0, budget=budget
+                )
+                self.logger.info(
+                    f"decomposed into {decompose_stats['clusters']} clusters "
+                    f"({decompose_stats['unsolved_clusters']} left in plan order by the budget), "
+                    f"stitched tour cost: {decompose_stats['stitched_cost']}"
+                )
+            elif runs > 1:
+                self.logger.info(f"running {runs} starts")
+                tsp.tour, tsp.cost, run_stats = multi_start(
+                    weights, runs, local_search, k,
+                    workers=getattr(args, 'workers', None), seed=getattr(args, 'seed', None),
+                    stop_cost=stop_cost, budget=budget,
+                    initial_tour=tsp.tour if construction != 'identity' else None
+                )
+            elif local_search == '2opt':
+                tsp.optimize(budget)
+            elif local_search in LOCAL_SEARCH_MOVES:
+                tsp.local_search(LOCAL_SEARCH_MOVES[local_search], k, budget, neighbors=neighbors)
+            else:
+                raise ValueError(f"Unknown local search: {local_search}")
+        if budget is not None:
+            budget.begin(tsp.cost)
+            budget.finish()
+            if budget.stopped is not None:
+                self.logger.info(f"search stopped early ({budget.stopped}) after {budget.elapsed():.2f}s")
         
         tour = tsp.tour
         reconfiguration_cost = tsp.cost
         
         self.logger.info(f"optimized tour cost: {reconfiguration_cost}")
         
-        # Rotate tour to start with the empty configuration (id=0)
-        init_idx = None
-        for idx, tour_idx in enumerate(tour):
-            if tests[tour_idx]['id'] == 0:
-                init_idx = idx
-                break
-        
-        if init_idx is None:
+        # Rotate tour to start with the empty configuration (id=0), which
+        # is always tests[0]
+        if 0 not in tour:
             raise ValueError("Initial empty configuration not found in tour")
+        init_idx = tour.index(0)
         
         if init_idx == 0:
             order = tour
         else:
             order = tour[init_idx:] + tour[:init_idx]
         
-        # Build ordered tests
-        tests_tour = [tests[i] for i in order]
-        
-        # Generate optimized test list with retract/apply operations
-        opt_tests = []
-        test_count = 0
+        # Several rigs: split the tour into balanced per-rig tours
+        rigs = getattr(args, 'rigs', 1) or 1
+        rig_tours = rig_costs = None
+        if rigs > 1:
+            rig_moves = None
+            if args.optimize:
+                rig_moves = LOCAL_SEARCH_MOVES.get(local_search, LOCAL_SEARCH_MOVES['2opt-fast'])
+            rig_tours, rig_costs = multi_rig(weights, order, rigs, rig_moves, k, budget)
+            self.logger.info(f"scheduled {len(rig_tours)} rigs, makespan: {max(rig_costs, default=0)}")
         
-        while len(tests_tour) >= 2:
-            pair = tests_tour[:2]
-            
-            current_scenarios = set(pair[0]['scenarios'])
-            next_scenarios = set(pair[1]['scenarios'])
-            
-            retract = sorted(list(current_scenarios - next_scenarios))
-            apply = sorted(list(next_scenarios - current_scenarios))
-            
-            test_count += 1
-            opt_test = pair[1].copy()
-            opt_test.update({
-                'id': test_count,
-                'scenarios': sorted(list(next_scenarios)),
-                'retract': retract,
-                'apply': apply
-            })
-            opt_tests.append(opt_test)
-            
-            tests_tour.pop(0)
+        # Build ordered tests with retract/apply operations
+        opt_tests = apply_retract_tests([tests[i] for i in order])
         
         self.logger.info(f"emitting {len(opt_tests)} test configurations")
         
-        return {
+        result = {
             'reconfiguration_cost': reconfiguration_cost,
+        }
+        if lower_bound is not None:
+            result['lower_bound'] = lower_bound
+            result['optimality_gap'] = optimality_gap(reconfiguration_cost, lower_bound)
+        result.update({
             'observation_cost': observation_cost,
+            'warm_start': warm_key,
             'tests': opt_tests
-        }
+        })
+        if run_stats is not None:
+            result['runs'] = run_stats
+        if decompose_stats is not None:
+            result['decompose'] = decompose_stats
+        if rig_tours is not None:
+            result['makespan'] = max(rig_costs, default=0)
+            result['rigs'] = [
+                {
+                    'rig': r + 1,
+                    'reconfiguration_cost': cost,
+                    'observation_cost': sum(test_observation_costs[i] for i in rig),
+                    'tests': apply_retract_tests([tests[i] for i in rig]),
+                }
+                for r, (rig, cost) in enumerate(zip(rig_tours, rig_costs))
+            ]
+        if budget is not None:
+            result['search'] = {
+                'elapsed': budget.elapsed(),
+                'iterations': budget.iterations,
+                'improvements': budget.improvements,
+                'stopped': budget.stopped,
+            }
+        return result
+
+
+# Options of optimize() and their defaults (see optimize_test_order)
+OPTIMIZE_OPTIONS = {
+    'local_search': "2opt",
+    'runs': 1,
+    'workers': None,
+    'seed': None,
+    'gap': None,
+    'time_limit': None,
+    'max_iterations': None,
+    'progress': None,
+    'budget': None,
+    'previous': None,
+    'lower_bound': None,
+    'matrix_free': None,
+    'construction': None,
+    'decompose': None,
+    'rigs': 1,
+    'output': None,
+}
+
 
+def optimize(tests: List[Dict], cost_map: Dict[str, Dict[str, Any]],
+             options: Optional[Dict[str, Any]] = None) -> Dict:
+    """
+    In-memory entry point: optimize the order of already parsed pruned
+    ``tests`` (or a TestPlan) under ``cost_map`` ({"scenarios": ..., "observations": ...}).
+    ``options`` takes the keyword arguments of optimize_test_order, plus
+    ``output``: a path the result is then saved to in the background (see
+    src/artifacts.py). Errors are raised, not returned.
+    """
+    if isinstance(tests, TestPlan):
+        tests = tests.to_tests()
+    options = dict(options or {})
+    unknown = set(options) - set(OPTIMIZE_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+    args = argparse.Namespace(resort=False, concorde=False, no_optimize=False, optimize=True,
+                              **{**OPTIMIZE_OPTIONS, **options})
+    result = OptimizeTestOrder().solve(args, tests, cost_map)
+    if args.output is not None:
+        save_json(args.output, result)
+    return result
 
-def optimize_test_order(pruned_tests_json, costs_json):
-    """Main entry point (hard-coded I/O version)"""
+
+def optimize_test_order(pruned_tests_json, costs_json, local_search="2opt",
+                        runs=1, workers=None, seed=None, gap=None,
+                        time_limit=None, max_iterations=None, progress=None, budget=None,
+                        previous=None, lower_bound=None, matrix_free=None, construction=None,
+                        decompose=None, rigs=1):
+    """
+    Main entry point (hard-coded I/O version). ``local_search`` picks the
+    improvement heuristic: "2opt" (Ruby-compatible, default), one of the
+    engines in src/local_search.py: "2opt-fast", "or-opt", "3opt", "lk", or
+    "held-karp" for the exact optimum of plans up to HELD_KARP_MAX_N tests.
+    With ``runs`` > 1, that many seeded starts run across ``workers``
+    processes and the result gains per-run statistics under "runs".
+    With ``gap`` (or ``lower_bound=True``) the result reports the Held-Karp
+    lower bound and the optimality gap of the tour; bounding and every
+    search stop once the gap is within ``gap`` (the result's "search"
+    summary then says "gap"). Warm starts and matrix-free plans are not
+    bounded unless ``lower_bound=True``, so there ``gap`` alone is ignored,
+    with a warning.
+
+    ``time_limit`` (seconds) caps the whole run from the weights on, with
+    the bound and the construction cut short as needed; ``max_iterations``
+    caps the search, and
+    ``progress(elapsed, best_cost, improvements)`` is called while it runs
+    (return False to stop). Pass a SearchBudget as ``budget`` instead to
+    cancel() it from elsewhere. A stopped search returns the best tour
+    found so far, and the result gains a "search" summary.
+
+    ``previous`` (a path to an earlier result such as
+    test_order_optimized.json, or the result itself) warm-starts a single
+    run: its order is reused, matched by config_digest/uuid, new tests are
+    inserted where cheapest and local search only revisits the edits (the
+    Ruby "2opt" still rescans the whole tour, from the previous order). A
+    result is only reused under the same scenario costs and local search
+    (its "warm_start" key); otherwise the run starts cold.
+    ``lower_bound`` forces the Held-Karp bound on or off (default: on
+    only with a ``gap``, unless warm-starting or matrix-free). ``matrix_free`` forces
+    DistanceOracle distances on or off (default: above
+    MATRIX_FREE_MIN_TESTS tests). ``construction`` picks the initial tour
+    heuristic of src/construction.py (default: "identity" for the Ruby
+    2-opt, "greedy" otherwise). ``decompose`` forces the cluster
+    decompose-and-stitch solver of src/decompose.py on or off (default:
+    above DECOMPOSE_MIN_TESTS tests); the result then gains its statistics
+    under "decompose".
+
+    ``rigs`` > 1 schedules the plan on that many identical rigs running in
+    parallel, each starting from the empty configuration: the result gains
+    the largest rig cost under "makespan" and per-rig costs and
+    apply/retract tests under "rigs" (see src/multi_rig.py), while "tests"
+    keeps the single-rig order.
+    """
     try:
-        # Read input tests JSON
+        # Read input tests JSON and cost map
         with open(pruned_tests_json, 'r') as f:
-            input_data = f.read()
-
-        # Build a minimal args namespace expected by OptimizeTestOrder.run()
-        class Args: pass
-        args = Args()
-        args.cost_map = costs_json
-        args.resort = False
-        args.concorde = False
-        args.no_optimize = False
-        args.optimize = True  # inverse of no_optimize
+            tests = json.load(f)
+        with open(costs_json, 'r') as f:
+            cost_map = json.load(f)
 
         # Run optimization
-        optimizer = OptimizeTestOrder()
-        result = optimizer.run(args, input_data)
+        result = optimize(tests, cost_map, {
+            'local_search': local_search, 'runs': runs, 'workers': workers, 'seed': seed,
+            'gap': gap, 'time_limit': time_limit, 'max_iterations': max_iterations,
+            'progress': progress, 'budget': budget, 'previous': previous,
+            'lower_bound': lower_bound, 'matrix_free': matrix_free,
+            'construction': construction, 'decompose': decompose, 'rigs': rigs,
+        })
 
         # # Write output JSON
         # with open(OUTPUT_FILE, 'w') as f:
@@ -1,7 +1,18 @@
+import gc
+import os
 import sys
 import json
 import logging
 
+from contextlib import contextmanager
+from itertools import chain, compress, repeat
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from src.sparql_json import iter_rows
+from src.test_plan import TestPlan, Interner
+
 # ----------- Hard-coded input/output file paths -----------
 # SUFFICIENCY_FILE = "../reports/sufficient.json"
 # TESTS_INPUT_FILE = "tests.json"
@@ -19,56 +30,301 @@ import logging
 #     return logging.getLogger('prune-tests')
 
 
+_sufficiency_cache = {}  # Map: sufficiency path -> (mtime_ns, SufficiencyIndex)
+
+
+class SufficiencyIndex:
+    """
+    Sufficiency table as a sparse boolean requirement x configuration
+    matrix: requirements and sufficient configurations (frozensets of
+    scenario IDs, as compared by the Ruby logic) are interned to codes,
+    and the true entries are the sorted keys r * n_configs + c. Every
+    interned requirement is constrained; one may be sufficient under any
+    number of configurations. ``single`` holds the configuration of each
+    requirement with exactly one (-1 otherwise), so that the common case
+    is a lookup instead of a binary search.
+    """
+
+    def __init__(self, sufficiency_data):
+        self.requirements = Interner()
+        self.configs = Interner()
+        rows = list(iter_rows(sufficiency_data, ("reqName", "scenarios")))
+        req_codes = np.array(self.requirements.add_all([req_id for req_id, _ in rows]), dtype=np.int64)
+        config_codes = np.array(self.configs.add_all([frozenset(scenarios.split(",")) for _, scenarios in rows]),
+                                dtype=np.int64)
+        self.n_configs = max(len(self.configs), 1)
+        self.keys = np.unique(req_codes * self.n_configs + config_codes)
+
+        key_requirements = self.keys // self.n_configs
+        per_requirement = np.bincount(key_requirements, minlength=len(self.requirements))
+        self.single = np.full(len(self.requirements), -1, dtype=np.int64)
+        one = per_requirement[key_requirements] == 1
+        self.single[key_requirements[one]] = self.keys[one] % self.n_configs
+        self.multiple = per_requirement > 1
+
+    def requirement_codes(self, req_ids, count: int = -1) -> np.ndarray:
+        """Codes of requirement IDs, -1 for unconstrained ones"""
+        return np.fromiter(map(self.requirements.index.get, req_ids, repeat(-1)), dtype=np.int64, count=count)
+
+    def config_codes(self, configs) -> np.ndarray:
+        """Codes of configurations (frozensets), -1 for ones sufficient for nothing"""
+        return np.fromiter(map(self.configs.index.get, configs, repeat(-1)), dtype=np.int64,
+                           count=len(configs))
+
+    def keeps(self, req_codes: np.ndarray, config_codes: np.ndarray) -> np.ndarray:
+        """Per entry: requirement unconstrained, or sufficient under the configuration"""
+        constrained = req_codes >= 0
+        if not len(self.keys):
+            return ~constrained
+        codes = np.where(constrained, req_codes, 0)
+        keep = ~constrained | ((self.single[codes] == config_codes) & (config_codes >= 0))
+        # requirements sufficient under several configurations: binary search
+        multiple = np.flatnonzero(constrained & self.multiple[codes] & (config_codes >= 0))
+        if len(multiple):
+            keys = req_codes[multiple] * self.n_configs + config_codes[multiple]
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            keep[multiple] = self.keys[pos] == keys
+        return keep
+
+
+def load_sufficiency_index(path) -> SufficiencyIndex:
+    """
+    SufficiencyIndex of a sufficiency file, kept in memory and reused while
+    the file is unchanged
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _sufficiency_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with _paused_gc():
+            cached = _sufficiency_cache[path] = (mtime, SufficiencyIndex(path))
+    return cached[1]
+
+
+class PruneReport:
+    """
+    Aggregated outcome of one pruning pass: totals, per-test counts and,
+    on demand, the individual drops (details()). Entries are the flattened
+    test -> quantity -> requirement lists; ``quantity_name`` and
+    ``requirement_name`` give the ID of a quantity / entry by position.
+    """
+
+    def __init__(self, uuids: List, quantity_name: Callable[[int], Any],
+                 requirement_name: Callable[[int], Any],
+                 entry_quantity: np.ndarray, quantity_test: np.ndarray,
+                 keep_entry: np.ndarray, keep_quantity: np.ndarray, keep_test: np.ndarray):
+        self.uuids = uuids
+        self.quantity_name = quantity_name
+        self.requirement_name = requirement_name
+        self.entry_quantity = entry_quantity
+        self.quantity_test = quantity_test
+        self.keep_entry = keep_entry
+        self.keep_quantity = keep_quantity
+        self.keep_test = keep_test
+
+        n = len(uuids)
+        self.requirements_dropped_by_test = np.bincount(
+            quantity_test[entry_quantity[~keep_entry]], minlength=n)
+        self.quantities_dropped_by_test = np.bincount(quantity_test[~keep_quantity], minlength=n)
+        self.dropped_requirements = int((~keep_entry).sum())
+        self.dropped_quantities = int((~keep_quantity).sum())
+        self.dropped_tests = int((~keep_test).sum())
+
+    def summary(self) -> str:
+        return (f"pruned {self.dropped_requirements} requirements, {self.dropped_quantities} quantities "
+                f"and {self.dropped_tests} of {len(self.uuids)} tests")
+
+    def by_test(self) -> Dict[Any, Tuple[int, int]]:
+        """(dropped requirements, dropped quantities) of every test with drops"""
+        touched = np.flatnonzero(self.requirements_dropped_by_test | self.quantities_dropped_by_test)
+        return {
+            self.uuids[t]: (int(self.requirements_dropped_by_test[t]), int(self.quantities_dropped_by_test[t]))
+            for t in touched.tolist()
+        }
+
+    def details(self) -> Iterator[str]:
+        """Every drop, in the messages of the former per-item log"""
+        entry_starts = np.concatenate(([0], np.cumsum(np.bincount(self.entry_quantity,
+                                                                  minlength=len(self.quantity_test)))))
+        quantity_starts = np.concatenate(([0], np.cumsum(np.bincount(self.quantity_test,
+                                                                     minlength=len(self.uuids)))))
+        for t, uuid in enumerate(self.uuids):
+            for q in range(quantity_starts[t], quantity_starts[t + 1]):
+                for e in range(entry_starts[q], entry_starts[q + 1]):
+                    if not self.keep_entry[e]:
+                        yield f"drop requirement {self.requirement_name(e)} from test {uuid}"
+                if not self.keep_quantity[q]:
+                    yield f"drop quantity {self.quantity_name(q)} from test {uuid}"
+            if not self.keep_test[t]:
+                yield f"drop test {uuid}"
+
+
+def prune_masks(index: SufficiencyIndex, req_codes: np.ndarray, entry_quantity: np.ndarray,
+                quantity_test: np.ndarray, test_configs: np.ndarray):
+    """
+    Keep masks of the flattened test -> quantity -> requirement entries
+    (entry_quantity, quantity_test: parent of each entry / quantity): a
+    quantity stays if any of its requirements does, a test if any of its
+    quantities does
+    """
+    keep_entry = index.keeps(req_codes, test_configs[quantity_test[entry_quantity]])
+    keep_quantity = np.bincount(entry_quantity, weights=keep_entry, minlength=len(quantity_test)) > 0
+    keep_test = np.bincount(quantity_test, weights=keep_quantity, minlength=len(test_configs)) > 0
+    return keep_entry, keep_quantity, keep_test
+
+
+def _flatten(requirement_lists: List[List], quantities_per_test: List[int]):
+    """Parent arrays of the flattened entries: entry -> quantity and quantity -> test"""
+    quantity_test = np.repeat(np.arange(len(quantities_per_test)), quantities_per_test)
+    entry_quantity = np.repeat(np.arange(len(requirement_lists)),
+                               np.fromiter(map(len, requirement_lists), dtype=np.int64,
+                                           count=len(requirement_lists)))
+    return entry_quantity, quantity_test
+
+
+def _kept_slices(requirements: Iterable, keep_entry: np.ndarray, entry_quantity: np.ndarray,
+                 n_quantities: int) -> Tuple[List, List[int], List[int]]:
+    """
+    Kept entries of the flattened requirement lists (``requirements``), in
+    one pass, and per quantity the end and count of its slice of them
+    """
+    kept = list(compress(requirements, keep_entry.tolist()))
+    counts = np.bincount(entry_quantity[keep_entry], minlength=n_quantities)
+    return kept, np.cumsum(counts).tolist(), counts.tolist()
+
+
+def _touched(report: "PruneReport") -> List[bool]:
+    """Per test: whether it lost a requirement or a quantity"""
+    return ((report.requirements_dropped_by_test > 0) | (report.quantities_dropped_by_test > 0)).tolist()
+
+
+@contextmanager
+def _paused_gc():
+    """
+    Pause the cyclic garbage collector: pruning allocates hundreds of
+    thousands of acyclic dicts and lists, and every collection they
+    trigger would rescan the (large) tests
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def prune_tests_batch(tests_data, sufficiency_data):
+    """
+    Vectorized pruning: returns the pruned tests (a new list, or a new
+    TestPlan for a TestPlan; the input is not modified) and a PruneReport.
+    Only the tests that lost entries are rebuilt; the others are shallow
+    copies. ``sufficiency_data`` may also be a prebuilt SufficiencyIndex.
+    """
+    with _paused_gc():
+        index = sufficiency_data if isinstance(sufficiency_data, SufficiencyIndex) else SufficiencyIndex(sufficiency_data)
+        if isinstance(tests_data, TestPlan):
+            return prune_plan(tests_data, index)
+        return _prune_test_dicts(tests_data, index)
+
+
+def _prune_test_dicts(tests_data, index: SufficiencyIndex):
+    """prune_tests_batch on tests in the JSON shape"""
+
+    # Flatten test -> quantity -> requirement
+    quantity_maps = [test['quantities'] for test in tests_data]
+    requirement_lists = [qh['requirements'] for qs in quantity_maps for qh in qs.values()]
+    entry_quantity, quantity_test = _flatten(requirement_lists, list(map(len, quantity_maps)))
+    test_configs = index.config_codes([frozenset(test['scenarios']) for test in tests_data])
+
+    req_codes = index.requirement_codes(chain.from_iterable(requirement_lists), len(entry_quantity))
+    keep_entry, keep_quantity, keep_test = prune_masks(index, req_codes, entry_quantity, quantity_test, test_configs)
+    quantity_ids = list(chain.from_iterable(quantity_maps))
+    entry_starts = np.searchsorted(entry_quantity, np.arange(len(requirement_lists)))
+    report = PruneReport([test['uuid'] for test in tests_data], quantity_ids.__getitem__,
+                         lambda e: requirement_lists[entry_quantity[e]][e - entry_starts[entry_quantity[e]]],
+                         entry_quantity, quantity_test, keep_entry, keep_quantity, keep_test)
+
+    # Rebuild only the kept tests and quantities that lost entries: all kept
+    # quantities in one pass, then each test takes its run of them
+    kept, ends, counts = _kept_slices(chain.from_iterable(requirement_lists), keep_entry, entry_quantity,
+                                      len(quantity_ids))
+    keep_q = keep_quantity.tolist()
+    lost_q = compress((np.bincount(entry_quantity[~keep_entry], minlength=len(quantity_ids)) > 0).tolist(), keep_q)
+    quantities = [
+        {**qh, 'requirements': kept[end - count:end]} if lost else qh
+        for qh, end, count, lost in zip(compress(chain.from_iterable(qs.values() for qs in quantity_maps), keep_q),
+                                        compress(ends, keep_q), compress(counts, keep_q), lost_q)
+    ]
+    kept_ids = list(compress(quantity_ids, keep_q))
+    test_ends = np.cumsum(np.bincount(quantity_test[keep_quantity], minlength=len(tests_data)))
+    pruned = [
+        {**test, 'quantities': dict(zip(kept_ids[end - count:end], quantities[end - count:end]))}
+        if touched else dict(test)
+        for test, end, count, touched in compress(
+            zip(tests_data, test_ends.tolist(), np.diff(test_ends, prepend=0).tolist(), _touched(report)),
+            keep_test.tolist())
+    ]
+    return pruned, report
+
+
+def prune_plan(plan: TestPlan, index: SufficiencyIndex) -> Tuple[TestPlan, PruneReport]:
+    """prune_tests_batch on a TestPlan, keeping its codes"""
+    scenario_ids = plan.scenarios.ids
+    quantity_maps = [record.quantities or {} for record in plan.records]
+    quantity_codes = [q for qs in quantity_maps for q in qs]
+    requirement_lists = [reqs for qs in quantity_maps for reqs in qs.values()]
+    req_codes = np.array(list(chain.from_iterable(requirement_lists)), dtype=np.int64)
+    entry_quantity, quantity_test = _flatten(requirement_lists, list(map(len, quantity_maps)))
+    test_configs = index.config_codes([
+        frozenset(map(scenario_ids.__getitem__, plan.row(i).tolist())) for i in range(len(plan))
+    ])
+    # plan requirement code -> index requirement code
+    to_index = index.requirement_codes(plan.requirements.ids)
+
+    keep_entry, keep_quantity, keep_test = prune_masks(
+        index, to_index[req_codes], entry_quantity, quantity_test, test_configs)
+    quantity_ids, requirement_ids = plan.quantities.ids, plan.requirements.ids
+    report = PruneReport([record.uuid for record in plan.records],
+                         lambda q: quantity_ids[quantity_codes[q]],
+                         lambda e: requirement_ids[req_codes[e]],
+                         entry_quantity, quantity_test, keep_entry, keep_quantity, keep_test)
+
+    kept, ends, counts = _kept_slices(req_codes.tolist(), keep_entry, entry_quantity, len(quantity_codes))
+    keep_q = keep_quantity.tolist()
+    keep, records = [], []
+    q = 0
+    for i, (record, qs, keep_t, touched) in enumerate(zip(plan.records, quantity_maps, keep_test.tolist(),
+                                                          _touched(report))):
+        if keep_t:
+            keep.append(i)
+            if touched:
+                record = record.replace(quantities={
+                    code: reqs if counts[j] == len(reqs) else kept[ends[j] - counts[j]:ends[j]]
+                    for j, (code, reqs) in enumerate(qs.items(), q) if keep_q[j]
+                })
+            records.append(record)
+        q += len(qs)
+    return plan.select(keep, records), report
+
+
 def prune_tests(tests_data, sufficiency_data):
     """
-    Prune tests based on sufficiency data - exact Ruby logic translation
+    Prune tests based on sufficiency data (the Ruby prune-tests logic).
+
+    A requirement constrained by the sufficiency table stays in a test only
+    if the test's configuration is one of the requirement's sufficient
+    configurations; quantities left without requirements and tests left
+    without quantities are dropped. Returns the pruned tests (a new list,
+    or a new TestPlan for a TestPlan); ``tests_data`` is not modified.
+    Logs one summary line, and every drop at DEBUG level.
     """
     logger = logging.getLogger('prune-tests')
-    
-    # Build sufficients mapping exactly like Ruby
-    sufficients = {}
-    for sh in sufficiency_data["results"]["bindings"]:
-        req_id = sh["reqName"]["value"]
-        config_sets = {frozenset(sh["scenarios"]["value"].split(","))}
-        sufficients[req_id] = config_sets
-    
-    # Process each test exactly like Ruby
-    drop_tests = []
-    
-    for test in tests_data:
-        t_uuid = test['uuid']
-        config = frozenset(test['scenarios'])
-        
-        drop_quantities = []
-        for q_id in list(test['quantities'].keys()):
-            qh = test['quantities'][q_id]
-
-            keep_requirements = []
-            for r_id in qh['requirements']:
-                if r_id in sufficients:
-                    if config in sufficients[r_id]:
-                        keep_requirements.append(r_id)
-                    else:
-                        logger.info(f"drop requirement {r_id} from test {t_uuid}")
-                else:
-                    keep_requirements.append(r_id)
-
-            qh['requirements'] = keep_requirements
-            if not qh['requirements']:
-                drop_quantities.append(q_id)
-
-        for drop_q in drop_quantities:
-            logger.info(f"drop quantity {drop_q} from test {t_uuid}")
-            del test['quantities'][drop_q]
-
-        if not test['quantities']:
-            drop_tests.append(test)
-
-    for drop_t in drop_tests:
-        logger.info(f"drop test {drop_t['uuid']}")
-        tests_data.remove(drop_t)
-
-    return tests_data
+    pruned, report = prune_tests_batch(tests_data, sufficiency_data)
+    logger.info(report.summary())
+    if logger.isEnabledFor(logging.DEBUG):
+        for message in report.details():
+            logger.debug(message)
+    return pruned
 
 
 # def main():
@@ -0,0 +1,202 @@
+"""
+Incremental reader for SPARQL JSON results (``head.vars`` / ``results.bindings``).
+
+The exported Requirements.json, sufficient.json and cost files can be very
+large, so instead of ``json.load``-ing the whole document the reader walks
+the top-level structure by hand and decodes one binding object at a time from
+a sliding text buffer. Each binding is flattened from
+``{"var": {"type": ..., "value": ...}}`` to its plain values.
+"""
+
+import io
+import os
+import json
+import codecs
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = " \t\n\r"
+
+
+class _Scanner:
+    """Sliding-window JSON tokenizer over a binary or text stream"""
+
+    def __init__(self, stream, chunk_size: int = CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        """Append the next chunk to the buffer, dropping consumed text"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(size or self.chunk_size)
+        if isinstance(chunk, (bytes, bytearray)):
+            chunk = self.utf8.decode(chunk, final=not chunk)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return not self.eof
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        """Consume the next non-whitespace character, which must be in ``chars``"""
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise json.JSONDecodeError(f"Expected one of {chars!r}", self.buf, self.pos)
+        self.pos += 1
+        return ch
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Most likely the value is cut off by the end of the buffer;
+                # grow the read size so very long values are not re-parsed
+                # once per chunk
+                if not self._fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    raise
+                continue
+            # A number or literal ending exactly at the buffer edge may continue
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return obj
+
+
+class BindingReader:
+    """
+    Stream the bindings of a SPARQL JSON result one row at a time.
+
+    ``vars`` holds ``head.vars`` once the head has been read (it is read
+    lazily, and is ``None`` when the document has no head before its
+    bindings). ``rows()`` yields each binding either as a ``{var: value}``
+    dict or, when ``fields`` is given, as a tuple of values in that order
+    with ``None`` for unbound variables.
+    """
+
+    def __init__(self, stream, chunk_size: int = CHUNK_SIZE):
+        self._events = _walk(_Scanner(stream, chunk_size))
+        self._pending = None
+        self._vars = None
+        self._head_done = False
+
+    @property
+    def vars(self) -> Optional[List[str]]:
+        if not self._head_done:
+            self._head_done = True
+            event = next(self._events, None)
+            if event is not None:
+                if event[0] == "vars":
+                    self._vars = event[1]
+                else:
+                    self._pending = event[1]
+        return self._vars
+
+    def rows(self, fields: Optional[Sequence[str]] = None) -> Iterator[Union[Dict[str, str], Tuple]]:
+        if self._pending is not None:
+            binding, self._pending = self._pending, None
+            yield flatten_binding(binding, fields)
+        for kind, payload in self._events:
+            if kind == "vars":
+                self._vars = payload
+                self._head_done = True
+            else:
+                yield flatten_binding(payload, fields)
+
+
+def _walk(scanner: _Scanner) -> Iterator[Tuple[str, Any]]:
+    """Yield ("vars", [...]) and ("binding", {...}) events in document order"""
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        return
+    while True:
+        key = scanner.value()
+        scanner.expect(":")
+        if key == "head":
+            head = scanner.value()
+            yield "vars", head.get("vars", [])
+        elif key == "results":
+            yield from _walk_results(scanner)
+        else:
+            scanner.value()
+        if scanner.expect(",}") == "}":
+            return
+
+
+def _walk_results(scanner: _Scanner) -> Iterator[Tuple[str, Any]]:
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        scanner.expect("}")
+        return
+    while True:
+        key = scanner.value()
+        scanner.expect(":")
+        if key == "bindings":
+            scanner.expect("[")
+            if scanner.peek() == "]":
+                scanner.expect("]")
+            else:
+                while True:
+                    yield "binding", scanner.value()
+                    if scanner.expect(",]") == "]":
+                        break
+        else:
+            scanner.value()
+        if scanner.expect(",}") == "}":
+            return
+
+
+def flatten_binding(binding: Dict[str, Dict], fields: Optional[Sequence[str]] = None):
+    """Turn ``{"var": {"type", "value"}}`` into a flat dict or field tuple"""
+    if fields is None:
+        return {var: term.get("value") for var, term in binding.items()}
+    return tuple([binding[f].get("value") if f in binding else None for f in fields])
+
+
+@contextmanager
+def open_bindings(source, chunk_size: int = CHUNK_SIZE) -> Iterator[BindingReader]:
+    """
+    Open a SPARQL JSON source for streaming. ``source`` may be a file path
+    (str or PathLike, always opened as a file), the raw bytes of an upload,
+    or an already open binary or text file object.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield BindingReader(f, chunk_size)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        yield BindingReader(io.BytesIO(source), chunk_size)
+    else:
+        yield BindingReader(source, chunk_size)
+
+
+def iter_rows(source, fields: Optional[Sequence[str]] = None) -> Iterator:
+    """
+    Yield flat binding rows from ``source``. Already parsed documents (dicts)
+    are accepted too, so loaders can take either form.
+    """
+    if isinstance(source, dict):
+        for binding in source["results"]["bindings"]:
+            yield flatten_binding(binding, fields)
+        return
+    with open_bindings(source) as reader:
+        yield from reader.rows(fields)
@@ -0,0 +1,277 @@
+"""
+Compact, array-backed test plan shared by the pipeline stages.
+
+The JSON shape used between stages is a list of test dicts with string
+scenario, requirement and quantity IDs. TestPlan keeps the same content
+as
+
+    scenarios / requirements / quantities   Interner: ID <-> int code
+    offsets, cols                          CSR test x scenario incidence
+                                           (row i = cols[offsets[i]:offsets[i + 1]])
+    scenario_costs, quantity_costs         cost vectors by code (int32, or
+                                           float64 for non-integral costs)
+    records                                one __slots__ TestRecord per test
+                                           with the remaining per-test fields
+
+Rows are kept in plan order, which is the execution order for optimized
+plans. from_tests() / to_tests() convert from and to the JSON shape.
+"""
+
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Test fields held by TestRecord / the incidence; any other key goes to
+# TestRecord.extra
+_RECORD_FIELDS = ('uuid', 'config_digest', 'scenarios', 'quantities',
+                  'requirements_direct', 'quantities_direct')
+
+
+class Interner:
+    """Bidirectional ID <-> dense int code dictionary"""
+
+    __slots__ = ('ids', 'index')
+
+    def __init__(self, ids: Iterable = ()):
+        self.ids: List[Any] = []
+        self.index: Dict[Any, int] = {}
+        for key in ids:
+            self.add(key)
+
+    def add(self, key) -> int:
+        """Code of ``key``, assigning the next one if it is new"""
+        code = self.index.get(key)
+        if code is None:
+            code = self.index[key] = len(self.ids)
+            self.ids.append(key)
+        return code
+
+    def add_all(self, keys: Iterable) -> List[int]:
+        """Codes of ``keys`` (see add), interned in one pass"""
+        index = self.index
+        setdefault = index.setdefault
+        codes = [setdefault(key, len(index)) for key in keys]
+        self.ids.extend(islice(index, len(self.ids), None))
+        return codes
+
+    def get(self, key, default=None):
+        return self.index.get(key, default)
+
+    def __getitem__(self, key) -> int:
+        return self.index[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def names(self, codes: Iterable[int]) -> List[Any]:
+        """IDs of the given codes"""
+        ids = self.ids
+        return [ids[c] for c in codes]
+
+
+class TestRecord:
+    """
+    Per-test fields outside the scenario incidence. ``quantities`` maps a
+    quantity code to its requirement codes; fields absent from the source
+    test are None.
+    """
+
+    __slots__ = ('uuid', 'config_digest', 'quantities', 'requirements_direct',
+                 'quantities_direct', 'extra')
+
+    def __init__(self, uuid: Optional[str] = None, config_digest: Optional[str] = None,
+                 quantities: Optional[Dict[int, List[int]]] = None,
+                 requirements_direct: Optional[List[int]] = None,
+                 quantities_direct: Optional[List[int]] = None,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.uuid = uuid
+        self.config_digest = config_digest
+        self.quantities = quantities
+        self.requirements_direct = requirements_direct
+        self.quantities_direct = quantities_direct
+        self.extra = extra or {}
+
+    def replace(self, **fields) -> "TestRecord":
+        """Copy with the given fields replaced"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(fields)
+        return TestRecord(**values)
+
+
+def cost_vector(interner: Interner, cost_map: Dict[Any, Any]) -> np.ndarray:
+    """Costs of the interned IDs (0 if missing): int32 if integral and in range, else float64"""
+    values = [cost_map.get(str(key), 0) for key in interner.ids]
+    if all(isinstance(v, int) for v in values):
+        array = np.array(values, dtype=np.int64)
+        info = np.iinfo(np.int32)
+        if len(array) == 0 or (array.min() >= info.min and array.max() <= info.max):
+            return array.astype(np.int32)
+        return array
+    return np.array(values, dtype=np.float64)
+
+
+class TestPlan:
+    """Ordered tests over interned scenarios, requirements and quantities"""
+
+    __slots__ = ('scenarios', 'requirements', 'quantities', 'offsets', 'cols', 'records',
+                 'scenario_costs', 'quantity_costs')
+
+    def __init__(self, scenarios: Interner, requirements: Interner, quantities: Interner,
+                 offsets: np.ndarray, cols: np.ndarray, records: List[TestRecord],
+                 scenario_costs: Optional[np.ndarray] = None,
+                 quantity_costs: Optional[np.ndarray] = None):
+        self.scenarios = scenarios
+        self.requirements = requirements
+        self.quantities = quantities
+        self.offsets = offsets
+        self.cols = cols
+        self.records = records
+        self.scenario_costs = scenario_costs
+        self.quantity_costs = quantity_costs
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    # ----------- adapters -----------
+
+    @classmethod
+    def from_tests(cls, tests: Sequence[Dict], cost_map: Optional[Dict[str, Dict]] = None,
+                   scenarios: Optional[Interner] = None, requirements: Optional[Interner] = None,
+                   quantities: Optional[Interner] = None) -> "TestPlan":
+        """
+        Plan of tests in the JSON shape. ``cost_map`` ({"scenarios": ...,
+        "observations": ...}) fills the cost vectors; interners may be
+        passed to share codes with another plan.
+        """
+        scenarios = scenarios if scenarios is not None else Interner()
+        requirements = requirements if requirements is not None else Interner()
+        quantities = quantities if quantities is not None else Interner()
+        add_scenario, add_requirement, add_quantity = scenarios.add, requirements.add, quantities.add
+
+        lengths = np.empty(len(tests), dtype=np.int64)
+        cols = []
+        records = []
+        for i, test in enumerate(tests):
+            row = [add_scenario(s) for s in test.get('scenarios', ())]
+            lengths[i] = len(row)
+            cols.extend(row)
+
+            qh = test.get('quantities')
+            direct = test.get('requirements_direct')
+            quantities_direct = test.get('quantities_direct')
+            records.append(TestRecord(
+                uuid=test.get('uuid'),
+                config_digest=test.get('config_digest'),
+                quantities=None if qh is None else {
+                    add_quantity(q): [add_requirement(r) for r in info['requirements']]
+                    for q, info in qh.items()
+                },
+                requirements_direct=None if direct is None else [add_requirement(r) for r in direct],
+                quantities_direct=None if quantities_direct is None else [add_quantity(q) for q in quantities_direct],
+                extra={key: value for key, value in test.items() if key not in _RECORD_FIELDS},
+            ))
+
+        offsets = np.zeros(len(tests) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        plan = cls(scenarios, requirements, quantities, offsets,
+                   np.array(cols, dtype=np.int32), records)
+        return plan.with_costs(cost_map) if cost_map is not None else plan
+
+    def to_tests(self, operations: bool = False) -> List[Dict]:
+        """
+        Tests in the JSON shape. With ``operations``, every test also gets
+        an "id" (its 1-based position unless it has one) and the "apply" /
+        "retract" scenarios relative to the previous test (the first one
+        relative to the empty configuration).
+        """
+        scenario_ids, requirement_ids, quantity_ids = self.scenarios.ids, self.requirements.ids, self.quantities.ids
+        if operations:
+            applied, retracted = self.operations()
+        tests = []
+        for i, record in enumerate(self.records):
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            test = {}
+            if operations:
+                test['id'] = record.extra.get('id', i + 1)
+            if record.uuid is not None:
+                test['uuid'] = record.uuid
+            if record.config_digest is not None:
+                test['config_digest'] = record.config_digest
+            test['scenarios'] = [scenario_ids[c] for c in self.cols[lo:hi].tolist()]
+            if record.quantities is not None:
+                test['quantities'] = {
+                    quantity_ids[q]: {'requirements': [requirement_ids[r] for r in reqs]}
+                    for q, reqs in record.quantities.items()
+                }
+            if record.requirements_direct is not None:
+                test['requirements_direct'] = [requirement_ids[r] for r in record.requirements_direct]
+            if record.quantities_direct is not None:
+                test['quantities_direct'] = [quantity_ids[q] for q in record.quantities_direct]
+            test.update(record.extra)
+            if operations:
+                test['apply'] = sorted(scenario_ids[c] for c in self.cols[lo:hi][applied[lo:hi]].tolist())
+                prev = self.offsets[i - 1] if i else lo
+                test['retract'] = sorted(scenario_ids[c] for c in self.cols[prev:lo][retracted[prev:lo]].tolist())
+            tests.append(test)
+        return tests
+
+    def with_costs(self, cost_map: Dict[str, Dict]) -> "TestPlan":
+        """This plan with cost vectors from ``cost_map`` ({"scenarios": ..., "observations": ...})"""
+        return TestPlan(self.scenarios, self.requirements, self.quantities, self.offsets, self.cols,
+                        self.records, cost_vector(self.scenarios, cost_map.get('scenarios', {})),
+                        cost_vector(self.quantities, cost_map.get('observations', {})))
+
+    # ----------- queries -----------
+
+    def row(self, i: int) -> np.ndarray:
+        """Scenario codes of test i"""
+        return self.cols[self.offsets[i]:self.offsets[i + 1]]
+
+    def rows(self) -> np.ndarray:
+        """Test index of every incidence entry (the CSR row indices)"""
+        return np.repeat(np.arange(len(self.records)), np.diff(self.offsets))
+
+    def select(self, indices: Sequence[int], records: Optional[List[TestRecord]] = None) -> "TestPlan":
+        """
+        Plan of the tests at ``indices`` in that order (codes and costs are
+        shared); ``records`` replaces their records.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = np.diff(self.offsets)[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        starts = np.repeat(self.offsets[indices] - offsets[:-1], lengths)
+        cols = self.cols[starts + np.arange(offsets[-1])]
+        if records is None:
+            records = [self.records[i] for i in indices.tolist()]
+        return TestPlan(self.scenarios, self.requirements, self.quantities, offsets, cols,
+                        records, self.scenario_costs, self.quantity_costs)
+
+    def operations(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Boolean masks over the incidence entries: ``applied`` marks the
+        scenarios of test i missing from test i - 1 (all of test 0), and
+        ``retracted`` the scenarios of test i missing from test i + 1 (none
+        of the last test; it is retracted when the campaign ends).
+        """
+        n_scenarios = max(len(self.scenarios), 1)
+        rows = self.rows()
+        keys = rows * n_scenarios + self.cols
+        present = np.sort(keys)
+        applied = (rows == 0) | ~np.isin(keys - n_scenarios, present, assume_unique=True)
+        retracted = (rows < len(self.records) - 1) & ~np.isin(keys + n_scenarios, present, assume_unique=True)
+        return applied, retracted
+
+
+def as_tests(tests, operations: bool = True):
+    """Tests in the JSON shape, converting a TestPlan (see TestPlan.to_tests)"""
+    if isinstance(tests, TestPlan):
+        return tests.to_tests(operations=operations)
+    return tests
@@ -0,0 +1,64 @@
+"""
+Process pools whose workers share the weights of one test plan.
+
+A weight matrix is copied once into a multiprocessing.shared_memory block
+that every worker maps in its initializer, so tasks never pickle it; a
+DistanceOracle is linear in size and is simply sent to each worker once.
+Task functions read the weights with pool_weights().
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.distance_oracle import DistanceOracle
+
+_pool_weights = None  # Worker-local (shared memory, weights) of the plan
+_pool_cancel = None  # Event set by the parent to stop running tasks
+
+
+def _attach(name: Optional[str], shape: Tuple[int, ...], dtype: str, cancel=None,
+            oracle: Optional[DistanceOracle] = None):
+    """Pool initializer: map the parent's weight matrix, or keep the oracle"""
+    global _pool_weights, _pool_cancel
+    if oracle is not None:
+        _pool_weights = (None, oracle)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+        _pool_weights = (shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+    _pool_cancel = cancel
+
+
+def pool_weights():
+    """The plan's weights inside a pool worker"""
+    return _pool_weights[1]
+
+
+def pool_cancel():
+    """The pool's cancellation Event inside a worker (None if not given)"""
+    return _pool_cancel
+
+
+@contextmanager
+def weights_pool(weights, workers: int, cancel=None):
+    """ProcessPoolExecutor of ``workers`` processes sharing ``weights``"""
+    shm = None
+    oracle = weights if isinstance(weights, DistanceOracle) else None
+    if oracle is None:
+        weights = np.ascontiguousarray(weights)
+        shm = shared_memory.SharedMemory(create=True, size=max(weights.nbytes, 1))
+        np.ndarray(weights.shape, dtype=weights.dtype, buffer=shm.buf)[...] = weights
+        initargs = (shm.name, weights.shape, weights.dtype.str)
+    else:
+        initargs = (None, None, None)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=initargs + (cancel, oracle)) as pool:
+            yield pool
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
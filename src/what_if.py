@@ -0,0 +1,148 @@
+"""
+Incremental what-if costs for manual reordering of a test sequence.
+
+A sequence runs from the empty configuration through its tests and back
+to the empty configuration, and every transition a -> b costs the
+scenarios in exactly one of a and b. The combined (apply + retract) cost
+is the sum of these transition costs, and apply and retract each make
+up half of it (every applied scenario is retracted once).
+
+Moving a test, swapping two tests or reversing a segment changes at most
+four transitions (the costs are symmetric, so a reversed segment keeps
+its inner ones), and SequenceCosts prices each edit from those alone:
+the totals are updated in constant time, independently of the length of
+the sequence.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.test_plan import TestPlan, cost_vector
+
+# Position of the empty configuration before the first and after the last test
+EMPTY = -1
+
+
+def plan_signature(plan: TestPlan) -> str:
+    """
+    Digest of what the what-if costs of a plan depend on: its tests (uuids
+    and scenario sets) and the scenario costs. Edits made on one plan must
+    not carry over to another that merely has an equal order.
+    """
+    digest = hashlib.md5(json.dumps([plan.scenarios.ids, [record.uuid for record in plan.records]]).encode("utf-8"))
+    for array in (plan.offsets, plan.cols, plan.scenario_costs):
+        digest.update(b"-" if array is None else np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+class SequenceCosts:
+    """Running totals of one ordering of a plan's tests under move / swap / reverse edits"""
+
+    def __init__(self, plan: TestPlan, order: Optional[Sequence[int]] = None,
+                 costs_data: Optional[Dict[str, Dict]] = None):
+        if costs_data is not None:
+            costs = cost_vector(plan.scenarios, costs_data.get("scenarios", {}))
+        elif plan.scenario_costs is not None:
+            costs = plan.scenario_costs
+        else:
+            raise ValueError("SequenceCosts needs costs_data for a plan without scenario costs")
+        self.plan = plan
+        self.integral = costs.dtype.kind in 'iu'
+        self.costs = costs.tolist()
+        self.sets = [frozenset(plan.row(i).tolist()) for i in range(len(plan))]
+        self.absolute = [sum(self.costs[c] for c in row) for row in self.sets]
+
+        self.order: List[int] = list(range(len(plan))) if order is None else [int(t) for t in order]
+        self.combined = sum(self.transitions())
+
+    # ----------- costs -----------
+
+    def d(self, a: int, b: int):
+        """Transition cost between tests a and b (EMPTY: the empty configuration)"""
+        if a == EMPTY or b == EMPTY:
+            return 0 if a == b else self.absolute[b if a == EMPTY else a]
+        small, large = (self.sets[a], self.sets[b]) if len(self.sets[a]) <= len(self.sets[b]) else (self.sets[b], self.sets[a])
+        costs = self.costs
+        return self.absolute[a] + self.absolute[b] - 2 * sum(costs[c] for c in small if c in large)
+
+    def at(self, i: int) -> int:
+        """Test at position i, EMPTY outside the sequence"""
+        return self.order[i] if 0 <= i < len(self.order) else EMPTY
+
+    def transitions(self) -> List[Any]:
+        """Cost of every transition, from the empty configuration to the first test to the empty one"""
+        path = [EMPTY] + self.order + [EMPTY]
+        return [self.d(a, b) for a, b in zip(path, path[1:])]
+
+    def totals(self) -> Dict[str, Any]:
+        """Current totals under the calculate_costs keys"""
+        half = self.combined // 2 if self.integral else self.combined / 2
+        return {
+            "total_apply_cost": half,
+            "total_retract_cost": half,
+            "total_combined_cost": self.combined,
+        }
+
+    # ----------- edits -----------
+
+    def delta_move(self, i: int, j: int):
+        """Change in combined cost if the test at position i is moved to position j"""
+        if i == j:
+            return 0
+        at, d, x = self.at, self.d, self.order[i]
+        removed = d(at(i - 1), at(i + 1)) - d(at(i - 1), x) - d(x, at(i + 1))
+        # neighbors of position j once x is out of the sequence
+        before = at(j - 1) if j <= i else at(j)
+        after = at(j) if j < i else at(j + 1)
+        return removed + d(before, x) + d(x, after) - d(before, after)
+
+    def delta_swap(self, i: int, j: int):
+        """Change in combined cost if the tests at positions i and j are swapped"""
+        if i == j:
+            return 0
+        i, j = min(i, j), max(i, j)
+        at, d = self.at, self.d
+        x, y = self.order[i], self.order[j]
+        if j == i + 1:
+            return (d(at(i - 1), y) + d(x, at(j + 1))) - (d(at(i - 1), x) + d(y, at(j + 1)))
+        return (d(at(i - 1), y) + d(y, at(i + 1)) + d(at(j - 1), x) + d(x, at(j + 1))
+                - d(at(i - 1), x) - d(x, at(i + 1)) - d(at(j - 1), y) - d(y, at(j + 1)))
+
+    def delta_reverse(self, i: int, j: int):
+        """Change in combined cost if positions i..j (inclusive) are reversed"""
+        i, j = min(i, j), max(i, j)
+        at, d = self.at, self.d
+        return (d(at(i - 1), at(j)) + d(at(i), at(j + 1))
+                - d(at(i - 1), at(i)) - d(at(j), at(j + 1)))
+
+    def move(self, i: int, j: int):
+        """Move the test at position i to position j; returns the change in combined cost"""
+        delta = self.delta_move(i, j)
+        self.order.insert(j, self.order.pop(i))
+        self.combined += delta
+        return delta
+
+    def swap(self, i: int, j: int):
+        """Swap the tests at positions i and j; returns the change in combined cost"""
+        delta = self.delta_swap(i, j)
+        self.order[i], self.order[j] = self.order[j], self.order[i]
+        self.combined += delta
+        return delta
+
+    def reverse(self, i: int, j: int):
+        """Reverse positions i..j (inclusive); returns the change in combined cost"""
+        delta = self.delta_reverse(i, j)
+        i, j = min(i, j), max(i, j)
+        self.order[i:j + 1] = self.order[i:j + 1][::-1]
+        self.combined += delta
+        return delta
+
+    def preview(self, edit: str, i: int, j: int) -> Tuple[Any, Dict[str, Any]]:
+        """Change in combined cost and the totals after ``edit`` ("move", "swap", "reverse"), without applying it"""
+        delta = getattr(self, f"delta_{edit}")(i, j)
+        combined = self.combined + delta
+        half = combined // 2 if self.integral else combined / 2
+        return delta, {"total_apply_cost": half, "total_retract_cost": half, "total_combined_cost": combined}
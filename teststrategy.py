@@ -1,18 +1,99 @@
 import streamlit as st
 import os
 import json
+import hashlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 
-from src.costcalc2 import calculate_costs
-from makeplots import build_scenario_timeline, plot_sequence_dots, plot_scenario_heatmaps, make_presence_df, style_presence, make_cost_plots, make_cost_histogram
+from src.costcalc2 import batch_costs
+from src.test_plan import TestPlan
+from src.what_if import SequenceCosts, plan_signature
+from makeplots import build_scenario_timeline, plot_sequence_dots, plot_scenario_heatmaps, make_presence_df, style_presence, make_cost_plots, make_cost_histogram, MAX_PLOT_BUCKETS, make_presence_array, plot_presence_matrix, presence_status, render_mode
 from jsontocsv import json_to_csv
-from src.prune_tests import prune_tests
-from src.optimize_test_order import optimize_test_order
+from src.prune_tests import prune_tests_batch, load_sufficiency_index
+from src.optimize_test_order import optimize
+from src.local_search import SearchBudget, PROGRESS_INTERVAL
+from src.artifacts import save_json
+from src.sparql_json import iter_rows
 
 from streamlit_echarts import st_echarts
 
+
+@st.fragment
+def render_reordering(plan: TestPlan, order, key: str, signature: str) -> None:
+    """
+    Manual reordering of the optimized sequence: edits are priced
+    incrementally and only this fragment reruns. ``signature`` identifies
+    the plan and its costs (see plan_signature).
+    """
+    # Start over whenever the optimized order, the tests or the costs change
+    state = st.session_state.get(key)
+    if state is None or state[0] != order or state[1] != signature:
+        sequence = SequenceCosts(plan, order)
+        state = st.session_state[key] = (list(order), signature, sequence, sequence.totals())
+    _, _, sequence, baseline = state
+
+    uuids = [plan.records[t].uuid for t in sequence.order]
+    positions = range(len(uuids))
+    label = lambda i: f"{i + 1}: {uuids[i]}"
+    cols = st.columns(3)
+    edit = cols[0].radio("Edit", options=["move", "swap", "reverse"], horizontal=True,
+                         format_func=lambda x: {"move": "Move test to position", "swap": "Swap two tests",
+                                                "reverse": "Reverse the tests between"}[x],
+                         key=f"{key}:edit")
+    i = cols[1].selectbox("Test", options=positions, format_func=label, key=f"{key}:i")
+    j = cols[2].selectbox("Position" if edit == "move" else "and", options=positions, format_func=label, key=f"{key}:j")
+
+    delta, totals = sequence.preview(edit, i, j)
+    cols = st.columns(3)
+    cols[0].metric("What-if Apply Cost", f"{totals['total_apply_cost']:,} $",
+                   delta=f"{totals['total_apply_cost'] - baseline['total_apply_cost']:,} $", delta_color="inverse")
+    cols[1].metric("What-if Retract Cost", f"{totals['total_retract_cost']:,} $",
+                   delta=f"{totals['total_retract_cost'] - baseline['total_retract_cost']:,} $", delta_color="inverse")
+    cols[2].metric("What-if Combined Cost", f"{totals['total_combined_cost']:,} $",
+                   delta=f"{totals['total_combined_cost'] - baseline['total_combined_cost']:,} $", delta_color="inverse")
+    st.caption(f"This edit changes the current sequence by {delta:,} $.")
+
+    cols = st.columns(2)
+    if cols[0].button("Apply edit", key=f"{key}:apply"):
+        getattr(sequence, edit)(i, j)
+        st.rerun(scope="fragment")
+    if cols[1].button("Reset to optimized order", key=f"{key}:reset"):
+        del st.session_state[key]
+        st.rerun(scope="fragment")
+    st.dataframe(pd.DataFrame({"Position": [i + 1 for i in positions], "Test": uuids}),
+                 use_container_width=True, hide_index=True, height=250)
+
+
+@st.fragment
+def render_zoomable(plot, tests, key: str, **kwargs) -> None:
+    """
+    Plot of a test sequence with a range slider: long ranges are drawn
+    binned (level of detail), and zooming or panning reruns only this
+    fragment to fetch the finer slice.
+    """
+    test_range = None
+    if len(tests) > MAX_PLOT_BUCKETS:
+        first, last = st.slider("Tests shown (positions in the plotted order)", min_value=1, max_value=len(tests),
+                                value=(1, len(tests)), key=f"{key}:range")
+        test_range = (first - 1, last)
+    st.plotly_chart(plot(tests, test_range=test_range, **kwargs), use_container_width=True)
+
+
+@st.fragment
+def render_presence_lookup(status, scenario_ids, test_ids, key: str) -> None:
+    """Status of one scenario in one test, served from the presence array"""
+    cols = st.columns(3)
+    scenario = cols[0].selectbox("Scenario", options=scenario_ids, key=f"{key}:scenario")
+    test = cols[1].selectbox("Test", options=test_ids, key=f"{key}:test")
+    if scenario is not None and test is not None:
+        cols[2].metric("Status", presence_status(status, scenario_ids, test_ids, scenario, test))
+
+
 def render(project: dict) -> None:
     folder   = project["folder"]
     json_path = os.path.join(folder, "sufficient.json")
@@ -30,37 +111,100 @@ def render(project: dict) -> None:
     # json_to_csv(json_input_path=tests_json, csv_output_path=os.path.join(folder, "tests.csv"))
 
     # ──────────────────────────── 1.  Load data once ────────────────────────────
-    sufficient = json.load(open(json_path, "rb+"))
     tests_data = json.load(open(tests_json, "rb+"))
 
-    pruned_tests = prune_tests(tests_data=tests_data, sufficiency_data=sufficient)
-    with open(os.path.join(folder, "pruned_tests.json"), "w") as f:
-        json.dump(pruned_tests, f, indent=2)
-    print(f"Pruned tests saved to {os.path.join(folder, 'pruned_tests.json')}")
+    pruned_tests, prune_report = prune_tests_batch(tests_data, load_sufficiency_index(json_path))
+    with st.expander("Pruning report", expanded=False):
+        st.write(prune_report.summary())
+        st.dataframe(pd.DataFrame(
+            [(uuid, reqs, quantities) for uuid, (reqs, quantities) in prune_report.by_test().items()],
+            columns=["Test", "Dropped Requirements", "Dropped Quantities"]))
+        if st.checkbox("Show every dropped item", value=False, key="prune_details"):
+            st.text("\n".join(prune_report.details()))
+    # Artifacts are saved in the background; the pipeline runs in memory
+    save_json(os.path.join(folder, "pruned_tests.json"), pruned_tests)
 
-    scenario_cost = json.load(open(scenario_cost_json, "rb+"))
-    observation_cost = json.load(open(observation_cost_json, "rb+"))
     costs_data = {"scenarios": {}, "observations": {}}
 
-    for sc in scenario_cost["results"]["bindings"]:
-        costs_data["scenarios"][sc["scenarioID"]["value"]] = int(sc["cost"]["value"])
+    for scenario_id, cost in iter_rows(scenario_cost_json, ("scenarioID", "cost")):
+        costs_data["scenarios"][scenario_id] = int(cost)
     
-    for oc in observation_cost["results"]["bindings"]:
-        costs_data["observations"][oc["quantityID"]["value"]] = int(oc["cost"]["value"])
+    for quantity_id, cost in iter_rows(observation_cost_json, ("quantityID", "cost")):
+        costs_data["observations"][quantity_id] = int(cost)
     
-    with open(os.path.join(folder, "costs.json"), "w") as f:
-        json.dump(costs_data, f, indent=2)
-    print(f"Costs data saved to {os.path.join(folder, 'costs.json')}")
-    costs_json = os.path.join(folder, "costs.json")
-    pruned_tests_json = os.path.join(folder, "pruned_tests.json")
+    save_json(os.path.join(folder, "costs.json"), costs_data)
+
+    with st.expander("Optimizer progress", expanded=False):
+        time_limit = st.number_input(
+            "Time budget in seconds (0 = run until converged)",
+            min_value=0.0, value=0.0, step=1.0, key="optimizer_time_limit"
+        )
+        rigs = st.number_input(
+            "Parallel test rigs (each starts from the empty configuration)",
+            min_value=1, value=1, step=1, key="optimizer_rigs"
+        )
+        cost_curve = st.empty()
+        # Clicking reruns the page, which interrupts the wait below: the
+        # search is then cancelled and keeps its best order so far, and the
+        # flag keeps the rerun from starting it again
+        stop_key = f"optimizer_stopped:{folder}"
+
+        def stop_optimizer():
+            st.session_state[stop_key] = True
 
-    opt_tests = optimize_test_order(pruned_tests_json=pruned_tests_json, costs_json=costs_json)
+        st.button("Stop optimizer", key="optimizer_stop", on_click=stop_optimizer)
+    curve = []
+    updates = queue.SimpleQueue()
 
-    with open(os.path.join(folder, "test_order_optimized.json"), "w") as f:
-        json.dump(opt_tests, f, indent=2)
-    print(f"Optimized test order saved to {os.path.join(folder, 'test_order_optimized.json')}")
+    def show_progress(elapsed, best_cost, improvements):
+        # called from the optimizer thread; the chart is drawn by this one
+        updates.put({"seconds": elapsed, "cost": best_cost})
 
-    unopt_tests = {"tests": pruned_tests}
+    def draw_progress():
+        if not updates.empty():
+            while not updates.empty():
+                curve.append(updates.get())
+            cost_curve.line_chart(pd.DataFrame(curve), x="seconds", y="cost")
+
+    # The last run is kept in the session with a digest of its inputs: it
+    # is reused while they are unchanged, unless it was interrupted by
+    # something other than Stop. Otherwise re-optimize, warm-starting from
+    # the last order (or the one saved by an earlier session), so small
+    # plan edits only re-optimize around the changed tests
+    optimized_json = os.path.join(folder, "test_order_optimized.json")
+    run_key = f"optimizer_run:{folder}"
+    inputs = hashlib.md5(json.dumps([
+        [[test["uuid"], test["scenarios"]] for test in pruned_tests], costs_data, time_limit, int(rigs)
+    ], sort_keys=True).encode("utf-8")).hexdigest()
+    last_run = st.session_state.get(run_key)
+    if last_run is None or last_run["inputs"] != inputs or not (last_run["finished"] or st.session_state.get(stop_key)):
+        st.session_state[stop_key] = False
+        budget = SearchBudget(time_limit or None, progress=show_progress, cancelled=threading.Event())
+        optimizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="optimizer")
+        running = optimizer.submit(optimize, pruned_tests, costs_data, {
+            "budget": budget, "rigs": int(rigs),
+            "previous": last_run["result"] if last_run is not None else optimized_json,
+            "output": optimized_json,
+        })
+        try:
+            while not running.done():
+                wait([running], timeout=PROGRESS_INTERVAL)
+                draw_progress()
+        finally:
+            if not running.done():
+                budget.cancel()
+            optimizer.shutdown()
+            last_run = st.session_state[run_key] = {
+                "inputs": inputs, "result": running.result(), "finished": budget.stopped != "cancelled",
+            }
+        draw_progress()
+    opt_tests = last_run["result"]
+    if not last_run["finished"]:
+        st.info("The optimizer was stopped; showing the best order found so far. "
+                "It runs again when the tests, costs or settings change.")
+
+    # Copies: the artifacts above may still be being saved
+    unopt_tests = {"tests": [dict(test) for test in pruned_tests]}
     ct = []
     for i, tt in enumerate(unopt_tests["tests"]):
         tt["id"] = i+1 
@@ -71,18 +215,17 @@ def render(project: dict) -> None:
         tt["retract"] = retract
         ct = tt["scenarios"]
     
-    for ss in opt_tests["tests"]:
-        target = [test for test in unopt_tests["tests"] if test["uuid"] == ss["uuid"]][0]
-        ss["id"] = target["id"]
+    unopt_ids = {}
+    for test in unopt_tests["tests"]:
+        unopt_ids.setdefault(test["uuid"], test["id"])
+    opt_tests = {**opt_tests, "tests": [{**ss, "id": unopt_ids[ss["uuid"]]} for ss in opt_tests["tests"]]}
     
-    req_data = json.load(open(requirements_json, "rb+"))
-
     requirements = {}
-    for req in req_data["results"]["bindings"]:
-        requirements[req["reqName"]["value"]] = {
-            "id": req["reqName"]["value"],
-            "scenarios": req["scenarios"]["value"],
-            "quantity": req["quaID"]["value"]
+    for req_name, req_scenarios, qua_id in iter_rows(requirements_json, ("reqName", "scenarios", "quaID")):
+        requirements[req_name] = {
+            "id": req_name,
+            "scenarios": req_scenarios,
+            "quantity": qua_id
         }
 
     requirements_df = pd.DataFrame.from_dict(requirements, orient="index")
@@ -102,7 +245,11 @@ def render(project: dict) -> None:
 
     # Display a grid of metrics with total costs
     st.markdown("##### Test Configuration Metrics")
-    costs = calculate_costs(unopt_tests["tests"], costs_data=costs_data)
+    # Both orderings of the pruned tests in one batch
+    plan = TestPlan.from_tests(pruned_tests, costs_data)
+    orderings = [np.arange(len(plan)), [unopt_ids[test["uuid"]] - 1 for test in opt_tests["tests"]]]
+    totals = batch_costs(plan, orderings)
+    costs, opt_costs = ({key: values[j].item() for key, values in totals.items()} for j in range(2))
     # show_optimized_numbers = st.checkbox("Show Optimized Values", value=True, key="cost_opt_plot")
     
     col1, col2, col3 = st.columns(3)
@@ -112,12 +259,30 @@ def render(project: dict) -> None:
     # st.markdown("---")
     # if show_optimized_numbers:
         # show optimized costs
-    opt_costs = calculate_costs(opt_tests["tests"], costs_data=costs_data)
     col1, col2, col3 = st.columns(3)
     col1.metric("Optimized Apply Cost", f"{opt_costs['total_apply_cost']:,} $")
     col2.metric("Optimized Retract Cost", f"{opt_costs['total_retract_cost']:,} $")
     col3.metric("Optimized Combined Cost", f"{opt_costs['total_combined_cost']:,} $")
 
+    with st.expander("Manual reordering (what-if costs)", expanded=False):
+        render_reordering(plan, orderings[1], f"what_if:{folder}", plan_signature(plan))
+
+    # Per-rig plans when the campaign is split across parallel test rigs
+    if "rigs" in opt_tests:
+        st.markdown("##### Test Facilities")
+        cols = st.columns(2)
+        cols[0].metric("Rigs", f"{len(opt_tests['rigs'])}")
+        cols[1].metric("Makespan (largest rig reconfiguration cost)", f"{opt_tests['makespan']:,} $")
+        rig_tabs = st.tabs([f"Rig {rig['rig']}" for rig in opt_tests["rigs"]])
+        for tab, rig in zip(rig_tabs, opt_tests["rigs"]):
+            with tab:
+                st.caption(f"{len(rig['tests'])} test configurations, "
+                           f"reconfiguration cost {rig['reconfiguration_cost']:,} $")
+                st.dataframe(
+                    pd.DataFrame(rig["tests"], columns=["id", "uuid", "scenarios", "apply", "retract"]),
+                    use_container_width=True, hide_index=True
+                )
+
     # # ──────────────────────────── 3.  Test Configuration Chart ────────────────────────────
     
     st.markdown("##### Test Configuration Chart")
@@ -127,6 +292,13 @@ def render(project: dict) -> None:
         options=["Scenario Heatmaps", "Test Sequence Dots", "Scenario Timeline", "Presence Matrix"],
         index=1
     )
+    renderer = st.selectbox(
+        "Renderer",
+        options=["auto", "svg", "webgl", "raster"],
+        format_func=lambda x: {"auto": "Automatic (by number of cells)", "svg": "SVG markers",
+                               "webgl": "WebGL / heatmap trace", "raster": "Server-side raster image"}[x],
+        key="plot_renderer"
+    )
     
     if plot_option == "Scenario Heatmaps":
         with st.expander("Show plot settings", expanded=False):
@@ -141,11 +313,11 @@ def render(project: dict) -> None:
                 key="fig_height_slider" 
             )
         fig1 = plot_scenario_heatmaps(unopt_tests["tests"], "Unoptimized Scenario Heatmaps", 
-                                      cell_size=cell_size, fig_height=fig_height)
+                                      cell_size=cell_size, fig_height=fig_height, mode=renderer)
         st.plotly_chart(fig1, use_container_width=True)
         if show_optimized:
             fig2 = plot_scenario_heatmaps(opt_tests["tests"], "Optimized Scenario Heatmaps", 
-                                          cell_size=cell_size, fig_height=fig_height)
+                                          cell_size=cell_size, fig_height=fig_height, mode=renderer)
             st.plotly_chart(fig2, use_container_width=True)
     elif plot_option == "Test Sequence Dots":
         with st.expander("Show plot settings", expanded=False):
@@ -159,13 +331,11 @@ def render(project: dict) -> None:
                 min_value=400, max_value=1200, value=500, step=50,
                 key="fig_height_slider"
             )
-        fig1 = plot_sequence_dots(unopt_tests["tests"], "Unoptimized Test Sequence", 
-                                  cell_size=cell_size, fig_height=fig_height)
-        st.plotly_chart(fig1, use_container_width=True)
+        render_zoomable(plot_sequence_dots, unopt_tests["tests"], "dots_unopt", title="Unoptimized Test Sequence",
+                        cell_size=cell_size, fig_height=fig_height, mode=renderer)
         if show_optimized:
-            fig2 = plot_sequence_dots(opt_tests["tests"], "Optimized Test Sequence", 
-                                      cell_size=cell_size, fig_height=fig_height)
-            st.plotly_chart(fig2, use_container_width=True)
+            render_zoomable(plot_sequence_dots, opt_tests["tests"], "dots_opt", title="Optimized Test Sequence",
+                            cell_size=cell_size, fig_height=fig_height, mode=renderer)
     elif plot_option == "Scenario Timeline":
         with st.expander("Show plot settings", expanded=False):
             cell_size = st.slider(
@@ -178,26 +348,31 @@ def render(project: dict) -> None:
                 min_value=400, max_value=1200, value=500, step=50,
                 key="fig_height_slider"
             )
-        fig1 = build_scenario_timeline(unopt_tests["tests"], "Unoptimized Scenario Timeline", 
-                                       cell_size=cell_size, fig_height=fig_height)
-        st.plotly_chart(fig1, use_container_width=True)
+        render_zoomable(build_scenario_timeline, unopt_tests["tests"], "timeline_unopt",
+                        title="Unoptimized Scenario Timeline", cell_size=cell_size, fig_height=fig_height, mode=renderer)
         if show_optimized:
-            fig2 = build_scenario_timeline(opt_tests["tests"], "Optimized Scenario Timeline", 
-                                           cell_size=cell_size, fig_height=fig_height)
-            st.plotly_chart(fig2, use_container_width=True)
+            render_zoomable(build_scenario_timeline, opt_tests["tests"], "timeline_opt",
+                            title="Optimized Scenario Timeline", cell_size=cell_size, fig_height=fig_height, mode=renderer)
     elif plot_option == "Presence Matrix":
         cols = st.columns(2)
         show_additional = cols[0].checkbox("Show Additional Scenarios", value=False)
         flipped = cols[1].checkbox("Flip Grid Order", value=False)
-        df1, __ = make_presence_df(unopt_tests["tests"], flipped=flipped)
-        df1 = style_presence(df1, show_additional=show_additional)
-        st.markdown("### Unoptimized Presence Matrix")
-        st.dataframe(df1,  use_container_width=True, row_height=30, height=500)
+        variants = [("Unoptimized", unopt_tests["tests"])]
         if show_optimized:
-            df2, _ = make_presence_df(opt_tests["tests"], flipped=flipped)
-            df2 = style_presence(df2, show_additional=show_additional)
-            st.markdown("### Optimized Presence Matrix")
-            st.dataframe(df2, use_container_width=True, row_height=30, height=500)
+            variants.append(("Optimized", opt_tests["tests"]))
+        for name, variant_tests in variants:
+            status, scenario_ids, test_ids = make_presence_array(variant_tests)
+            st.markdown(f"### {name} Presence Matrix")
+            # styled table cells while small, one raster image beyond
+            if render_mode(status.size, renderer) == "svg":
+                df, _ = make_presence_df(variant_tests, flipped=flipped)
+                df = style_presence(df, show_additional=show_additional)
+                st.dataframe(df, use_container_width=True, row_height=30, height=500)
+            else:
+                fig = plot_presence_matrix(status, scenario_ids, test_ids,
+                                           show_additional=show_additional, flipped=flipped)
+                st.plotly_chart(fig, use_container_width=True)
+                render_presence_lookup(status, scenario_ids, test_ids, key=f"presence:{name}")
     
     # # ──────────────────────────── 4.  Cost charts ────────────────────────────
     st.subheader("Cost Calculation")
@@ -220,8 +395,9 @@ def render(project: dict) -> None:
                 "Set plot height",
                 min_value=400, max_value=1200, value=650, step=50, 
             )
-    fig1 = make_cost_plots(
-        unopt_tests["tests"], 
+    render_zoomable(
+        make_cost_plots,
+        unopt_tests["tests"], "costs_unopt",
         costs_data=costs_data,
         title="Unoptimized Tests", 
         type=cost_type,
@@ -229,10 +405,10 @@ def render(project: dict) -> None:
         display_in_execorder=display_in_execorder,
         fig_height=fig_height, barcolor=barcolor, linecolor=linecolor
     )
-    st.plotly_chart(fig1, use_container_width=True)
     # if show_optimized:
-    fig2 = make_cost_plots(
-        opt_tests["tests"], 
+    render_zoomable(
+        make_cost_plots,
+        opt_tests["tests"], "costs_opt",
         costs_data=costs_data,
         title="Optimized Tests", 
         type=cost_type,
@@ -240,7 +416,6 @@ def render(project: dict) -> None:
         display_in_execorder=display_in_execorder,
         fig_height=fig_height, barcolor=barcolor, linecolor=linecolor
     )
-    st.plotly_chart(fig2, use_container_width=True)
 
 
     # # ──────────────────────────── 5.  Cost Distribution ────────────────────────────